@@ -0,0 +1,147 @@
+"""
+Time the hot User / CardPrint queries from core/views.py with and without the
+composite indexes, on a throwaway test database filled with synthetic rows.
+
+    python benchmark_indexes.py --users 200000 --repeat 5
+
+The real database is never touched: a test database is created (as the test
+runner would), populated with bulk_create, and destroyed at the end.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gsez_profile.settings')
+django.setup()
+
+from django.db import connection
+from django.db.utils import NotSupportedError
+
+from core.models import User, CardPrint, Company
+
+STATUSES = [choice[0] for choice in User.STATUS_CHOICES]
+START_DATE = date(2024, 1, 1)
+
+
+def populate(user_count, batch_size=5000):
+    companies = Company.objects.bulk_create([Company(company_name=f'Company {i}') for i in range(200)])
+    rng = random.Random(42)
+    
+    for start in range(0, user_count, batch_size):
+        users = []
+        for i in range(start, min(start + batch_size, user_count)):
+            users.append(User(
+                username=f'ZIS{i:09d}',
+                gsezid=f'ZIS{i:09d}',
+                password='!',
+                first_name=f'First{i}',
+                last_name=f'Last{i}',
+                user_type='user' if rng.random() < 0.97 else rng.choice(['admin', 'hr', 'security']),
+                status=rng.choice(STATUSES),
+                is_verified=rng.random() < 0.6,
+                is_printed=rng.random() < 0.4,
+                current_employer_company=rng.choice(companies),
+            ))
+        User.objects.bulk_create(users, batch_size=batch_size)
+    
+    user_ids = list(User.objects.values_list('id', flat=True))
+    prints = [
+        CardPrint(user_id=user_id, gsezid='', card_print_date=START_DATE + timedelta(days=rng.randrange(600)))
+        for user_id in rng.sample(user_ids, len(user_ids) // 2)
+    ]
+    CardPrint.objects.bulk_create(prints, batch_size=batch_size)
+
+
+def benchmark_queries():
+    # Shapes taken from admin_manage_users, admin_dashboard and admin_export_users.
+    # Each entry is (queryset, how it is evaluated).
+    day = START_DATE + timedelta(days=300)
+    some_user_id = User.objects.order_by('id').values_list('id', flat=True).first()
+    users = User.objects.filter(user_type='user')
+    return {
+        'user list page (user_type, order by username)':
+            (users.order_by('username', 'id')[:15], list),
+        'user list, status + verified + printed':
+            (users.filter(status='active', is_verified=True, is_printed=False).order_by('username', 'id')[:15], list),
+        'dashboard printed count':
+            (users.filter(is_printed=True), lambda qs: qs.count()),
+        'dashboard verified count':
+            (users.filter(is_verified=True), lambda qs: qs.count()),
+        'users with a card printed on a date':
+            (users.filter(id__in=CardPrint.objects.filter(card_print_date=day).values('user_id')).values_list('id', flat=True), list),
+        'card prints in a date range':
+            (CardPrint.objects.filter(card_print_date__range=[day, day + timedelta(days=30)]).values_list('user_id', flat=True).distinct(), list),
+        'latest card print for a user':
+            (CardPrint.objects.filter(user_id=some_user_id).order_by('-card_print_date'), lambda qs: qs.first()),
+    }
+
+
+def time_query(queryset, evaluate, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        # Evaluate a fresh clone each time so nothing comes from the result cache
+        evaluate(queryset.all())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_all(repeat):
+    return {name: time_query(qs, evaluate, repeat) for name, (qs, evaluate) in benchmark_queries().items()}
+
+
+def set_indexes(enabled):
+    with connection.schema_editor() as schema_editor:
+        for model in (User, CardPrint):
+            for index in model._meta.indexes:
+                if enabled:
+                    schema_editor.add_index(model, index)
+                else:
+                    schema_editor.remove_index(model, index)
+
+
+def print_plans():
+    for name, (queryset, evaluate) in benchmark_queries().items():
+        try:
+            plan = queryset.explain()
+        except NotSupportedError:
+            print('\n(query plans are not available on this database backend)')
+            return
+        print(f'\nPlan for "{name}":\n{plan}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f'Populating {args.users} users...')
+        populate(args.users)
+        
+        set_indexes(False)
+        before = run_all(args.repeat)
+        set_indexes(True)
+        after = run_all(args.repeat)
+        
+        width = max(len(name) for name in before)
+        print(f'\n{"query".ljust(width)}  {"before":>10}  {"after":>10}  {"speedup":>8}')
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f'{name.ljust(width)}  {before[name] * 1000:>8.1f}ms  {after[name] * 1000:>8.1f}ms  {speedup:>7.1f}x')
+        
+        print_plans()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Company, Document, CardPrint
+from .models import User, Company, Document, CardPrint, ExportJob, ImportJob
+from .search import search_users
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'gsezid', 'user_type', 'status', 'is_verified')
     list_filter = ('user_type', 'status', 'is_verified')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'gsezid')
+    # Maintained from CardPrint, never edited directly
+    readonly_fields = ('card_print_count', 'last_card_print_date', 'last_card_print_remarks')
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
         ('Personal info', {'fields': ('first_name', 'middle_name', 'last_name', 'email', 'nationality', 'date_of_birth', 
@@ -18,6 +21,7 @@ class CustomUserAdmin(UserAdmin):
         ('Previous Employment', {'fields': ('previous_employers',)}),
         ('Education', {'fields': ('qualifications',)}),
         ('Status', {'fields': ('status', 'is_verified', 'qr_code', 'user_type', 'is_required_profile_detail', 'is_printed')}),
+        ('Card Prints', {'fields': ('card_print_count', 'last_card_print_date', 'last_card_print_remarks')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
@@ -28,6 +32,12 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the token index instead of icontains across every search field
+        if not search_term:
+            return queryset, False
+        return search_users(queryset, search_term), False
+
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         # Make all fields non-required
@@ -52,7 +62,19 @@ class CardPrintAdmin(admin.ModelAdmin):
     list_filter = ('card_print_date',)
     date_hierarchy = 'card_print_date'
 
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'export_format', 'status', 'rows_done', 'rows_total', 'created_by', 'created_at', 'expires_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('token', 'started_at', 'heartbeat_at', 'finished_at', 'rows_done', 'rows_total', 'file', 'error')
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'original_name', 'status', 'rows_done', 'rows_total', 'success_count', 'updated_count', 'error_count', 'created_by', 'created_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('token', 'started_at', 'heartbeat_at', 'finished_at', 'rows_done', 'rows_total', 'checkpoint_row', 'update_existing', 'success_count', 'updated_count', 'error_count', 'file', 'error')
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Document, DocumentAdmin)
 admin.site.register(Company, CompanyAdmin)
 admin.site.register(CardPrint, CardPrintAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
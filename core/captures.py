@@ -0,0 +1,101 @@
+"""
+Camera captures uploaded ahead of a form post.
+
+The browser sends the captured JPEG as a multipart blob to photo_capture_upload,
+which streams it to disk through Django's upload handlers and answers with a
+token. The profile / user forms then post only that token instead of a base64
+data URL, and the view that saves the form takes the file over.
+
+Captures are stored per uploader, so a token is only honoured for the user who
+uploaded it, and are deleted when taken or after CAPTURE_TTL.
+"""
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+
+# Raw camera frames are a few hundred KB; anything much larger is not a capture
+CAPTURE_MAX_SIZE = 10 * 1024 * 1024
+
+# Captures never taken over by a form post are removed after this many seconds
+CAPTURE_TTL = 60 * 60
+
+TOKEN_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def capture_dir():
+    # Outside MEDIA_ROOT so pending captures are never served
+    return getattr(settings, 'CAPTURE_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'capture_uploads'))
+
+
+def capture_path(token, uploader):
+    """Path of an existing capture uploaded by `uploader`, or None."""
+    if not token or not TOKEN_RE.match(token):
+        return None
+    path = os.path.join(capture_dir(), str(uploader.pk), f'{token}.jpg')
+    return path if os.path.exists(path) else None
+
+
+def purge_captures(max_age=CAPTURE_TTL):
+    """Delete captures older than max_age seconds. Returns how many were deleted."""
+    cutoff = time.time() - max_age
+    deleted = 0
+    root = capture_dir()
+    if not os.path.isdir(root):
+        return 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    deleted += 1
+            except OSError:
+                pass
+    return deleted
+
+
+def store_capture(uploaded_file, uploader):
+    """
+    Validate an uploaded capture and move it into the capture area. Returns the
+    token; raises ValueError when the upload is not a usable image.
+    """
+    if uploaded_file.size > CAPTURE_MAX_SIZE:
+        raise ValueError('The captured photo is too large.')
+    try:
+        # verify() only reads the structure, not the pixel data
+        with Image.open(uploaded_file) as image:
+            image.verify()
+    except Exception:
+        raise ValueError('The captured photo is not a valid image.')
+
+    token = uuid.uuid4().hex
+    path = os.path.join(capture_dir(), str(uploader.pk), f'{token}.jpg')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Copied chunk by chunk from the upload handler's temporary file / buffer
+    part_path = path + '.part'
+    with open(part_path, 'wb') as output:
+        for chunk in uploaded_file.chunks():
+            output.write(chunk)
+    os.replace(part_path, path)
+    return token
+
+
+def take_capture(token, uploader, user):
+    """
+    Save the capture behind `token` as user's profile photo (without saving the
+    user) and delete it. Returns False when there is no such capture.
+    """
+    path = capture_path(token, uploader)
+    if path is None:
+        return False
+    filename = f"{user.gsezid}.jpg" if user.gsezid else f"user_{user.id}.jpg"
+    with open(path, 'rb') as source:
+        # Normalized by ProfilePhotoField on the way into storage
+        user.profile_photo.save(filename, File(source), save=False)
+    os.remove(path)
+    return True
@@ -0,0 +1,202 @@
+"""
+Column registry for the user export, the import template and the CSV import.
+
+Each UserColumn says where a column's value comes from (a values_list() path),
+how it is formatted on export, and how the importer treats it.
+"""
+
+
+def _flag(value):
+    return '1' if value else '0'
+
+
+def _inverted_flag(value):
+    # is_required_profile_detail is exported as "profile complete"
+    return '0' if value else '1'
+
+
+def _blank(value):
+    return value if value is not None else ''
+
+
+class UserColumn:
+    """
+    key: column name in the export selection and in import CSV headers
+    header: export header
+    source: values_list() path the exported value is read from (None for import-only columns)
+    formatter: applied to the fetched value on export (None leaves it as is)
+    group: heading on the export field selection page
+    importer: how admin_import_users reads the column (see IMPORTER_KINDS), None if not importable
+    note / examples: template CSV instruction row and the two example rows
+    """
+
+    def __init__(self, key, header=None, source=None, formatter=_blank, group=None,
+                 importer=None, note=None, examples=('', '')):
+        self.key = key
+        self.header = header
+        self.source = source
+        self.formatter = formatter
+        self.group = group
+        self.importer = importer
+        self.note = note
+        self.examples = examples
+
+    @property
+    def exportable(self):
+        return self.source is not None
+
+    @property
+    def in_template(self):
+        return self.note is not None
+
+
+# text/bool/date are set generically; the other kinds have their own handling in the import view
+IMPORTER_KINDS = ('username', 'password', 'text', 'choice', 'bool', 'date', 'int', 'company', 'json', 'json_part')
+
+DATE_NOTE = 'Use: YYYY-MM-DD or DD/MM/YYYY'
+
+USER_COLUMNS = [
+    # Basic Information
+    UserColumn('id', 'ID', 'id', None, 'Basic Information'),
+    UserColumn('username', 'Username', 'username', group='Basic Information',
+               importer='username', note='Optional (auto-generated if blank)', examples=('john_doe', 'jane_smith')),
+    UserColumn('password', importer='password', note='Optional (auto-generated if blank)',
+               examples=('password123', 'pass456')),
+    UserColumn('first_name', 'First Name', 'first_name', group='Basic Information',
+               importer='text', note='Optional', examples=('John', 'Jane')),
+    UserColumn('middle_name', 'Middle Name', 'middle_name', group='Basic Information',
+               importer='text', note='Optional', examples=('', 'M')),
+    UserColumn('last_name', 'Last Name', 'last_name', group='Basic Information',
+               importer='text', note='Optional', examples=('Doe', 'Smith')),
+    UserColumn('email', 'Email', 'email', group='Basic Information',
+               importer='text', note='Optional', examples=('john@example.com', 'jane@example.com')),
+    UserColumn('user_type', 'User Type', 'user_type', group='Basic Information',
+               importer='choice', note='Use: user/admin/hr/security', examples=('user', 'user')),
+    UserColumn('status', 'Status', 'status', group='Basic Information',
+               importer='choice', note='Use: active/inactive/blocked/terminated/under_surveillance',
+               examples=('active', 'active')),
+
+    # Personal Information
+    UserColumn('is_verified', 'Is Verified', 'is_verified', _flag, 'Personal Information',
+               importer='bool', note='Use: 1/0', examples=('1', '0')),
+    UserColumn('is_required_profile_detail', 'Is Profile Complete', 'is_required_profile_detail', _inverted_flag,
+               'Personal Information', importer='bool', note='Use: 1/0', examples=('1', '1')),
+    UserColumn('is_printed', 'Is Printed', 'is_printed', _flag, 'Personal Information',
+               importer='bool', note='Use: 1/0', examples=('0', '0')),
+    UserColumn('nationality', 'Nationality', 'nationality', group='Personal Information',
+               importer='text', note='Optional', examples=('Indian', 'American')),
+    UserColumn('date_of_birth', 'Date of Birth', 'date_of_birth', None, 'Personal Information',
+               importer='date', note=DATE_NOTE, examples=('1990-01-01', '31/05/1992')),
+    UserColumn('gsez_card_issue_date', 'GSEZ Card Issue Date', 'gsez_card_issue_date', None, 'Personal Information',
+               importer='date', note=DATE_NOTE, examples=('2023-01-01', '01.02.2023')),
+    UserColumn('gsez_card_expiry_date', 'GSEZ Card Expiry Date', 'gsez_card_expiry_date', None, 'Personal Information',
+               importer='date', note=DATE_NOTE, examples=('2025-01-01', '01-02-2025')),
+    UserColumn('gsezid', 'GSEZ ID', 'gsezid', group='Personal Information',
+               importer='text', note='Optional (auto-generated if blank)', examples=('ZIS2506000001', 'ZIS2506000002')),
+    UserColumn('profile_full_link', 'Profile Full Link', 'profile_full_link', group='Personal Information',
+               importer='text', note='Optional (e.g. http://207.108.234.113:83/GSEZID.jpg)',
+               examples=('http://207.108.234.113:83/ZIS2506000001.jpg', 'http://207.108.234.113:83/ZIS2506000002.jpg')),
+    UserColumn('employee_contact_number', 'Employee Contact Number', 'employee_contact_number',
+               group='Personal Information', importer='text', note='Optional', examples=('9876543210', '8765432109')),
+    UserColumn('qr_code', 'QR Code', 'qr_code', group='Personal Information',
+               importer='text', note='Optional (auto-generated if blank)',
+               examples=('http://207.180.234.113/IDCARD/ZIS2506000001', 'http://207.180.234.113/IDCARD/ZIS2506000002')),
+
+    # Address Information
+    UserColumn('current_address', 'Current Address', 'current_address', group='Address Information',
+               importer='text', note='Optional', examples=('123 Street, City', '789 Road, Town')),
+    UserColumn('is_permanent', 'Is Permanent', 'is_permanent', _flag, 'Address Information',
+               importer='bool', note='Use: 1/0', examples=('0', '1')),
+    UserColumn('permanent_address', 'Permanent Address', 'permanent_address', group='Address Information',
+               importer='text', note='Optional', examples=('456 Street, City', '789 Road, Town')),
+
+    # Employment Information
+    UserColumn('current_employer', 'Current Employer', 'current_employer', group='Employment Information',
+               importer='text', note='Optional', examples=('ACME Corp', 'XYZ Ltd')),
+    UserColumn('current_employer_join_date', 'Join Date', 'current_employer_join_date', None, 'Employment Information',
+               importer='date', note=DATE_NOTE, examples=('2022-01-01', '01/06/2021')),
+    UserColumn('current_employer_emp_code', 'Employee Code', 'current_employer_emp_code', group='Employment Information',
+               importer='text', note='Optional', examples=('EMP123', 'XYZ456')),
+    UserColumn('current_employer_designation', 'Designation', 'current_employer_designation',
+               group='Employment Information', importer='text', note='Optional', examples=('Developer', 'Manager')),
+    UserColumn('current_employer_department', 'Department', 'current_employer_department',
+               group='Employment Information', importer='text', note='Optional', examples=('IT', 'HR')),
+    UserColumn('current_employer_company', 'Company', 'current_employer_company__company_name',
+               group='Employment Information', importer='company', note='Must exist in system',
+               examples=('Company Name', 'XYZ Company')),
+    UserColumn('current_employer_remarks', 'Remarks', 'current_employer_remarks', group='Employment Information',
+               importer='text', note='Optional', examples=('Good employee', 'Excellent manager')),
+    UserColumn('current_employer_rating', 'Rating', 'current_employer_rating', group='Employment Information',
+               importer='int', note='Optional (number 1-5)', examples=('4', '5')),
+
+    # Additional Information; exported as the stored JSON, imported from the split columns below
+    # (the JSON columns are still accepted on import for older files)
+    UserColumn('emergency_contact_numbers', 'Emergency Contacts', 'emergency_contact_numbers',
+               group='Additional Information', importer='json'),
+    UserColumn('family_members', 'Family Members', 'family_members', group='Additional Information', importer='json'),
+    UserColumn('previous_employers', 'Previous Employers', 'previous_employers',
+               group='Additional Information', importer='json'),
+    UserColumn('qualifications', 'Qualifications', 'qualifications', group='Additional Information', importer='json'),
+    UserColumn('emergency_contact_name', importer='json_part', note='Optional', examples=('Emergency Contact', 'Emergency')),
+    UserColumn('emergency_contact_number', importer='json_part', note='Optional', examples=('9876543210', '1234567890')),
+    UserColumn('family_member_name', importer='json_part', note='Optional', examples=('Jane Doe', 'John Smith')),
+    UserColumn('family_member_relation', importer='json_part', note='Optional', examples=('Spouse', 'Husband')),
+    UserColumn('family_member_number', importer='json_part', note='Optional', examples=('1234567890', '9876543210')),
+    UserColumn('previous_employer_name', importer='json_part', note='Optional', examples=('Previous Corp', 'ABC Inc')),
+    UserColumn('previous_employer_join_date', importer='json_part', note=DATE_NOTE, examples=('2019-01-01', '2018-01-01')),
+    UserColumn('previous_employer_leave_date', importer='json_part', note=DATE_NOTE, examples=('2021-12-31', '2021-05-31')),
+    UserColumn('previous_employer_remarks', importer='json_part', note='Optional',
+               examples=('Worked as Developer', 'Team Leader')),
+    UserColumn('previous_employer_rating', importer='json_part', note='Optional (number 1-5)', examples=('3', '4')),
+    UserColumn('qualification_name', importer='json_part', note='Optional', examples=('B.Tech', 'MBA')),
+    UserColumn('qualification_institution', importer='json_part', note='Optional', examples=('University', 'Business School')),
+    UserColumn('qualification_year', importer='json_part', note='Optional (year)', examples=('2018', '2016')),
+
+    # Card Print Information, from the summary columns kept up to date by the CardPrint signals
+    UserColumn('latest_card_print_date', 'Latest Card Print Date', 'last_card_print_date', None, 'Card Print Information'),
+    UserColumn('card_print_remarks', 'Card Print Remarks', 'last_card_print_remarks', group='Card Print Information'),
+    UserColumn('card_print_count', 'Card Print Count', 'card_print_count', None, 'Card Print Information'),
+]
+
+USER_COLUMNS_BY_KEY = {column.key: column for column in USER_COLUMNS}
+
+EXPORT_COLUMNS = [column for column in USER_COLUMNS if column.exportable]
+TEMPLATE_COLUMNS = [column for column in USER_COLUMNS if column.in_template]
+
+
+def import_fields(kind):
+    """Keys of the importable columns of one importer kind, in registry order."""
+    return [column.key for column in USER_COLUMNS if column.importer == kind]
+
+
+def export_column_groups():
+    # [(group heading, [columns])] for the export field selection page
+    groups = {}
+    for column in EXPORT_COLUMNS:
+        groups.setdefault(column.group, []).append(column)
+    return list(groups.items())
+
+
+def export_columns(keys=None):
+    """Exportable columns for the selected keys (unknown keys are dropped), or all of them."""
+    if not keys:
+        return list(EXPORT_COLUMNS)
+    return [USER_COLUMNS_BY_KEY[key] for key in keys if key in USER_COLUMNS_BY_KEY and USER_COLUMNS_BY_KEY[key].exportable]
+
+
+def compile_export(columns):
+    """
+    Compile the selected columns into a values_list() projection and a row builder
+    that turns one fetched tuple into an output row in a single pass.
+    """
+    projection = []
+    plan = []
+    for column in columns:
+        if column.source not in projection:
+            projection.append(column.source)
+        plan.append((projection.index(column.source), column.formatter))
+
+    def build_row(values):
+        return [values[index] if formatter is None else formatter(values[index]) for index, formatter in plan]
+
+    return projection, build_row
@@ -0,0 +1,142 @@
+"""
+Background export jobs. The database is the queue: jobs are claimed with a
+conditional UPDATE, so any number of `manage.py run_export_jobs` workers (or the
+one-shot worker started when a job is submitted) can run side by side. Progress
+and the outcome are only written while the worker still holds its claim on the
+job (see jobs.py), and every run builds its artifact in its own temporary file.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .exports import EXPORTS, EXPORT_FORMATS, write_export, export_filename
+from .jobs import STALE_AFTER, ClaimLost, Heartbeat, owned, spawn_worker
+from .models import ExportJob
+
+# Progress is written back every this many rows
+PROGRESS_EVERY = 1000
+
+
+def retention():
+    # How long finished artifacts are kept before they are deleted
+    return timedelta(hours=getattr(settings, 'EXPORT_JOB_RETENTION_HOURS', 24))
+
+
+def submit_export_job(kind, export_format, params, user):
+    """Queue an export and make sure a worker will pick it up."""
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    job = ExportJob.objects.create(
+        kind=kind,
+        export_format=export_format,
+        params=json.dumps(params),
+        created_by=user
+    )
+    if getattr(settings, 'EXPORT_JOB_SPAWN_WORKER', True):
+        spawn_worker('run_export_jobs')
+    return job
+
+
+def requeue_stale_jobs():
+    # Jobs left running by a worker that died (e.g. server restart) go back to the queue;
+    # exports have no side effects, so they simply start over
+    cutoff = timezone.now() - STALE_AFTER
+    return ExportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='pending', claim=None, rows_done=0, heartbeat_at=None
+    )
+
+
+def claim_next_job():
+    """Atomically take the oldest pending job, or return None when the queue is empty."""
+    for job_id in ExportJob.objects.filter(status='pending').order_by('created_at', 'id').values_list('id', flat=True)[:20]:
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(id=job_id, status='pending').update(
+            status='running', claim=uuid.uuid4(), started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return ExportJob.objects.get(id=job_id)
+    return None
+
+
+def _report_progress(job, rows, heartbeat):
+    for count, row in enumerate(rows, start=1):
+        if count % PROGRESS_EVERY == 0:
+            if not owned(job).update(rows_done=count, heartbeat_at=timezone.now()):
+                raise ClaimLost
+            heartbeat.last = time.monotonic()
+        yield row
+
+
+def run_job(job):
+    """Build the artifact for a claimed job into MEDIA_ROOT and record the outcome."""
+    part_path = None
+    try:
+        spec = EXPORTS[job.kind](job.get_params())
+        name = job.file.field.generate_filename(job, export_filename(job.export_format, spec.basename))
+        path = job.file.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name of this run's own, so a half-built file is never
+        # offered for download and a worker that lost its claim cannot touch another's
+        part_path = f'{path}.{job.claim.hex}.part'
+
+        # The COUNT and saving a workbook block in a single call: beat from a thread meanwhile
+        with Heartbeat(job) as heartbeat:
+            rows_total = spec.count()
+            if not owned(job).update(rows_total=rows_total):
+                raise ClaimLost
+            with open(part_path, 'wb') as output:
+                write_export(
+                    output, job.export_format, spec.header,
+                    _report_progress(job, spec.rows(), heartbeat), spec.keys, spec.sheet_name
+                )
+
+        now = timezone.now()
+        # The row stays locked until the file is in place, so the job cannot be requeued in between
+        with transaction.atomic():
+            if not owned(job).update(
+                status='done', file=name, rows_done=rows_total,
+                finished_at=now, heartbeat_at=now, expires_at=now + retention()
+            ):
+                raise ClaimLost
+            os.replace(part_path, path)
+    except ClaimLost:
+        # The job is no longer this worker's; whoever holds it now records the outcome
+        pass
+    except Exception as e:
+        now = timezone.now()
+        owned(job).update(status='failed', error=str(e), finished_at=now, expires_at=now + retention())
+    finally:
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def expire_jobs():
+    """Delete the artifacts of jobs past their expiry time. Returns how many jobs were expired."""
+    expired = 0
+    for job in ExportJob.objects.filter(status__in=['done', 'failed'], expires_at__lt=timezone.now()):
+        if job.file:
+            directory = os.path.dirname(job.file.path)
+            job.file.delete(save=False)
+            shutil.rmtree(directory, ignore_errors=True)
+        ExportJob.objects.filter(id=job.id).update(status='expired', file='')
+        expired += 1
+    return expired
+
+
+def run_pending_jobs():
+    """Run queued jobs until none are left. Returns how many were run."""
+    requeue_stale_jobs()
+    count = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
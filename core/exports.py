@@ -0,0 +1,265 @@
+import csv
+import io
+import json
+import tempfile
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+import xlwt
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .columns import export_columns, compile_export
+from .models import User, Company, Document, CardPrint
+
+# format key -> (content type, file extension, label shown on the export page)
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', 'Excel (.xlsx)'),
+    'csv': ('text/csv', 'csv', 'CSV'),
+    'csv.gz': ('application/gzip', 'csv.gz', 'CSV, gzip-compressed'),
+    'jsonl': ('application/x-ndjson', 'jsonl', 'JSON Lines'),
+    'xls': ('application/ms-excel', 'xls', 'Excel 97-2003 (.xls, max 65,535 rows)'),
+}
+DEFAULT_EXPORT_FORMAT = 'xlsx'
+
+# Legacy .xls sheets stop at 65,536 rows including the header
+XLS_MAX_ROWS = 65535
+
+# Rows buffered into each chunk sent to the client
+ROWS_PER_CHUNK = 500
+
+# Rows fetched per database round trip when exporting with queryset.iterator()
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def csv_chunks(header, rows):
+    """Encode rows as UTF-8 CSV (with a BOM so Excel detects the encoding), a few hundred rows per chunk; None is written as an empty cell."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    # wbits=31 produces a gzip container, so the download is a regular .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def jsonl_chunks(keys, rows):
+    """One JSON object per line, keyed by `keys`."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(keys, row)), default=str, ensure_ascii=False))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _xlsx_value(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal, date, datetime)):
+        return value
+    # Anything else goes in as text, minus the control characters the sheet XML rejects
+    return ILLEGAL_CHARACTERS_RE.sub('', str(value))
+
+
+def write_xlsx(output, header, rows, sheet_name):
+    """
+    Write an .xlsx in write-only mode: rows are streamed to openpyxl's temporary
+    part files as they come, so memory stays flat.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    worksheet.append(header)
+    for row in rows:
+        worksheet.append([_xlsx_value(value) for value in row])
+    workbook.save(output)
+
+
+def write_xls(output, header, rows, sheet_name):
+    # Legacy format: built in memory and capped at XLS_MAX_ROWS data rows
+    workbook = xlwt.Workbook(encoding='utf-8')
+    worksheet = workbook.add_sheet(sheet_name)
+    for col_num, column_title in enumerate(header):
+        worksheet.write(0, col_num, column_title)
+    for row_num, row in enumerate(rows, start=1):
+        if row_num > XLS_MAX_ROWS:
+            break
+        for col_num, cell_value in enumerate(row):
+            worksheet.write(row_num, col_num, _text(cell_value))
+    workbook.save(output)
+
+
+def export_chunks(export_format, header, rows, keys=None):
+    # Byte chunks for the formats that can be produced front to back (CSV, gzip CSV, JSON Lines)
+    if export_format == 'jsonl':
+        return jsonl_chunks(keys or header, rows)
+    chunks = csv_chunks(header, rows)
+    if export_format == 'csv.gz':
+        chunks = gzip_chunks(chunks)
+    return chunks
+
+
+def write_export(output, export_format, header, rows, keys=None, sheet_name='Sheet1'):
+    """Write a whole export in the given format to a binary file object."""
+    if export_format == 'xlsx':
+        write_xlsx(output, header, rows, sheet_name)
+    elif export_format == 'xls':
+        write_xls(output, header, rows, sheet_name)
+    else:
+        for chunk in export_chunks(export_format, header, rows, keys):
+            output.write(chunk)
+
+
+def export_filename(export_format, basename):
+    return f'{basename}.{EXPORT_FORMATS[export_format][1]}'
+
+
+def export_response(export_format, basename, header, rows, keys=None, sheet_name='Sheet1'):
+    """
+    Response for an export in the given format. `rows` should be a lazy iterable
+    (e.g. built from queryset.iterator()) so CSV / JSON Lines output starts
+    streaming right away and nothing holds the whole result set in memory.
+    """
+    if export_format not in EXPORT_FORMATS:
+        export_format = DEFAULT_EXPORT_FORMAT
+    content_type = EXPORT_FORMATS[export_format][0]
+    filename = export_filename(export_format, basename)
+
+    if export_format == 'xls':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        write_xls(response, header, rows, sheet_name)
+        return response
+
+    if export_format == 'xlsx':
+        # The zip container can only be finished at the end, so the file is built
+        # on disk first and then streamed from there
+        output = tempfile.TemporaryFile()
+        write_xlsx(output, header, rows, sheet_name)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=filename, content_type=content_type)
+
+    response = StreamingHttpResponse(export_chunks(export_format, header, rows, keys), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ExportSpec:
+    """What an export contains: the header, the JSON keys, the queryset and how a fetched tuple becomes a row."""
+
+    def __init__(self, basename, header, keys, queryset, build_row=None, sheet_name='Sheet1'):
+        self.basename = basename
+        self.header = header
+        self.keys = keys
+        self.queryset = queryset
+        self.build_row = build_row
+        self.sheet_name = sheet_name
+
+    def count(self):
+        return self.queryset.count()
+
+    def rows(self):
+        # Lazy: rows are produced while the output is written
+        for values in self.queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield self.build_row(values) if self.build_row else list(values)
+
+    def response(self, export_format):
+        return export_response(export_format, self.basename, self.header, self.rows(), self.keys, self.sheet_name)
+
+
+def user_export_params(data):
+    """JSON-serializable export parameters from the export page's POST data."""
+    return {
+        'fields': data.getlist('fields'),
+        'gsezid_filter': data.get('gsezid_filter', ''),
+        'company_filter': data.get('company_filter', ''),
+        'card_print_start_date': data.get('card_print_start_date', ''),
+        'card_print_end_date': data.get('card_print_end_date', ''),
+    }
+
+
+def user_export(params):
+    # Selected columns, or all of them if none were selected
+    columns = export_columns(params.get('fields'))
+    projection, build_row = compile_export(columns)
+
+    users = User.objects.filter(user_type='user')
+
+    # Filter by GSEZ ID
+    if params.get('gsezid_filter'):
+        users = users.filter(gsezid__icontains=params['gsezid_filter'])
+
+    # Filter by company
+    company_filter = str(params.get('company_filter') or '')
+    if company_filter.isdigit():
+        users = users.filter(current_employer_company_id=company_filter)
+
+    # Filter by card print date range
+    if params.get('card_print_start_date') and params.get('card_print_end_date'):
+        users = users.filter(Exists(
+            CardPrint.objects.filter(
+                user=OuterRef('pk'),
+                card_print_date__range=[params['card_print_start_date'], params['card_print_end_date']]
+            )
+        ))
+
+    # Only the selected columns are fetched, as plain tuples
+    return ExportSpec(
+        'users',
+        [column.header for column in columns],
+        [column.key for column in columns],
+        users.order_by('id').values_list(*projection),
+        build_row,
+        sheet_name='Users'
+    )
+
+
+def document_export(params):
+    storage = Document._meta.get_field('govt_id_photo').storage
+    return ExportSpec(
+        'documents',
+        ['Username', 'Govt ID Number', 'Govt ID Photo'],
+        ['username', 'govt_id_number', 'govt_id_photo'],
+        Document.objects.order_by('id').values_list('user__username', 'govt_id_number', 'govt_id_photo'),
+        lambda values: [values[0], values[1], storage.url(values[2]) if values[2] else ''],
+        sheet_name='Documents'
+    )
+
+
+def company_export(params):
+    return ExportSpec(
+        'companies',
+        ['Company'],
+        ['company_name'],
+        Company.objects.order_by('company_name').values_list('company_name'),
+        sheet_name='Companies'
+    )
+
+
+# Export kind -> builder taking the saved parameters
+EXPORTS = {
+    'users': user_export,
+    'documents': document_export,
+    'companies': company_export,
+}
@@ -85,34 +85,23 @@ class SimpleUserRegistrationForm(UserCreationForm):
             'placeholder': 'Confirm Password'
         })
         
-    def clean(self):
-        cleaned_data = super().clean()
-        first_name = cleaned_data.get('first_name')
-        last_name = cleaned_data.get('last_name')
+    def save(self, commit=True):
+        user = super().save(commit=False)
         
         # Since SimpleRegistrationForm doesn't have a gsezid field,
-        # we'll generate a GSEZ ID and use it as the username
-        gsez_id = generate_gsezid()
-        username = gsez_id
+        # we'll generate a GSEZ ID once here and use it as the username
+        if not user.gsezid:
+            user.gsezid = generate_gsezid()
+        
+        username = user.gsezid
         counter = 1
         
         # Check if username already exists, if so, append a number
         while User.objects.filter(username=username).exists():
-            username = f"{gsez_id}_{counter}"
+            username = f"{user.gsezid}_{counter}"
             counter += 1
             
-        cleaned_data['username'] = username
-        
-        return cleaned_data
-        
-    def save(self, commit=True):
-        user = super().save(commit=False)
-        # Set the username from the cleaned_data
-        user.username = self.cleaned_data.get('username')
-        
-        # Generate a GSEZ ID if not already set (should be set in clean method)
-        if not user.gsezid:
-            user.gsezid = generate_gsezid()
+        user.username = username
         
         # Always set the profile_full_link with the correct format
         user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
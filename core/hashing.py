@@ -0,0 +1,52 @@
+"""
+Password hashing on all cores for bulk imports.
+
+This module must not import models: spawned worker processes load it before
+Django is set up.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import django
+from django.contrib.auth.hashers import make_password
+
+
+def _init_worker():
+    # Spawned workers start from a fresh interpreter; DJANGO_SETTINGS_MODULE is inherited
+    django.setup()
+
+
+def _hashed(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class ParallelPasswordHasher:
+    """
+    Hashes passwords in a process pool while the caller keeps parsing rows.
+    submit() returns a Future whose result() is the encoded password.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+
+    def submit(self, raw_password):
+        if self.max_workers < 2:
+            return _hashed(make_password(raw_password))
+        if self.executor is None:
+            # Started on the first password so files without passwords never pay for it.
+            # 'spawn' because forking a server process with open DB connections and threads is unsafe.
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return self.executor.submit(make_password, raw_password)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,179 @@
+"""
+Background import jobs. The uploaded file is stored under MEDIA_ROOT and a
+worker imports it batch by batch; each batch commits together with the job's
+checkpoint (the last file row it covered), so a failed job can be resumed from
+there without importing any row twice. Checkpoints only commit while the worker
+still holds its claim on the job (see jobs.py).
+"""
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from .imports import UserImport, read_rows
+from .jobs import STALE_AFTER, ClaimLost, Heartbeat, owned, spawn_worker
+from .models import ImportJob, ImportRowError
+
+# File row number of the first data row: row 1 is the header, row 2 the instructions
+FIRST_DATA_ROW = 3
+
+
+def submit_import_job(uploaded_file, user, update_existing=False, dry_run=False):
+    """Store the upload, queue its import and make sure a worker will pick it up."""
+    job = ImportJob(
+        kind='users', original_name=uploaded_file.name[:255],
+        update_existing=update_existing, dry_run=dry_run, created_by=user
+    )
+    job.file.save(os.path.basename(uploaded_file.name), uploaded_file, save=False)
+    job.save()
+    start_worker()
+    return job
+
+
+def start_worker():
+    if getattr(settings, 'IMPORT_JOB_SPAWN_WORKER', True):
+        spawn_worker('run_import_jobs')
+
+
+def record_dry_run(kind, name, user, result, rows_total, update_existing=False):
+    """
+    Save a dry run done in the request as a finished job, so it is listed with
+    the imports and its error report can be downloaded.
+    """
+    now = timezone.now()
+    job = ImportJob.objects.create(
+        kind=kind, original_name=name[:255], status='done', dry_run=True, update_existing=update_existing,
+        created_by=user, started_at=now, finished_at=now, rows_total=rows_total, rows_done=rows_total,
+        success_count=result.success_count, updated_count=getattr(result, 'updated_count', 0),
+        error_count=result.error_count
+    )
+    ImportRowError.objects.bulk_create(
+        [ImportRowError(job=job, row_num=row_num, message=message, skipped=skipped)
+         for row_num, message, skipped in result.messages],
+        batch_size=1000
+    )
+    return job
+
+
+def resume_job(job):
+    """Queue a failed job again; it carries on after its checkpoint. Returns False if it cannot be resumed."""
+    if not job.file:
+        return False
+    resumed = ImportJob.objects.filter(id=job.id, status='failed').update(
+        status='pending', error=None, finished_at=None, heartbeat_at=None
+    )
+    if resumed:
+        start_worker()
+    return bool(resumed)
+
+
+def fail_stale_jobs():
+    # Jobs left running by a worker that died (e.g. server restart) are marked failed
+    # rather than restarted, so the admin decides whether to resume them
+    cutoff = timezone.now() - STALE_AFTER
+    return ImportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='failed', error='The worker stopped responding. Resume the job to continue from the last checkpoint.',
+        finished_at=timezone.now()
+    )
+
+
+def claim_next_job():
+    """Atomically take the oldest pending job, or return None when the queue is empty."""
+    for job_id in ImportJob.objects.filter(status='pending').order_by('created_at', 'id').values_list('id', flat=True)[:20]:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(id=job_id, status='pending').update(
+            status='running', claim=uuid.uuid4(), started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+def _count_rows(job, heartbeat):
+    count = 0
+    with job.file.open('rb'):
+        for _ in read_rows(job.file.name, job.file.file):
+            count += 1
+            if count % 1000 == 0:
+                heartbeat()
+    return max(0, count - (FIRST_DATA_ROW - 1))
+
+
+def run_job(job):
+    """Import a claimed job's file from its checkpoint on and record the outcome."""
+    user_import = None
+    heartbeat = Heartbeat(job)
+    try:
+        if job.rows_total is None:
+            job.rows_total = _count_rows(job, heartbeat)
+            owned(job).update(rows_total=job.rows_total)
+
+        # Messages from batches that were rolled back are reported again by this run
+        ImportRowError.objects.filter(job=job, row_num__gt=job.checkpoint_row).delete()
+
+        def checkpoint(row_num, messages):
+            # Compare-and-set inside the batch transaction: without the claim the
+            # batch is rolled back along with it
+            claimed = owned(job).update(
+                checkpoint_row=row_num,
+                rows_done=row_num - FIRST_DATA_ROW + 1,
+                success_count=job.success_count + user_import.success_count,
+                updated_count=job.updated_count + user_import.updated_count,
+                error_count=job.error_count + user_import.error_count,
+                heartbeat_at=timezone.now()
+            )
+            if not claimed:
+                raise ClaimLost
+            heartbeat.last = time.monotonic()
+            ImportRowError.objects.bulk_create([
+                ImportRowError(job=job, row_num=msg_row, message=message, skipped=skipped)
+                for msg_row, message, skipped in messages
+            ])
+
+        with job.file.open('rb'):
+            # The readers want the underlying file object, as with uploads
+            reader = read_rows(job.file.name, job.file.file)
+            headers = next(reader)
+            next(reader, None)  # Skip the instructions row
+
+            user_import = UserImport(
+                headers, start_after=job.checkpoint_row, checkpoint=checkpoint,
+                update_existing=job.update_existing, dry_run=job.dry_run, heartbeat=heartbeat
+            )
+            for row_num, row in enumerate(reader, start=FIRST_DATA_ROW):
+                user_import.add_row(row_num, row)
+            user_import.flush()
+
+        if not owned(job).update(
+            status='done', rows_done=job.rows_total, finished_at=timezone.now(), heartbeat_at=timezone.now()
+        ):
+            raise ClaimLost
+        # The upload is only needed for resuming
+        directory = os.path.dirname(job.file.path)
+        job.file.delete(save=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        ImportJob.objects.filter(id=job.id).update(file='')
+    except ClaimLost:
+        # The job is no longer this worker's; whoever holds it now records the outcome
+        pass
+    except Exception as e:
+        # The file and checkpoint are kept so the job can be resumed
+        owned(job).update(status='failed', error=str(e), finished_at=timezone.now())
+    finally:
+        if user_import is not None:
+            user_import.close()
+
+
+def run_pending_jobs():
+    """Run queued jobs until none are left. Returns how many were run."""
+    fail_stale_jobs()
+    count = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
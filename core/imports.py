@@ -0,0 +1,931 @@
+import codecs
+import csv
+import io
+import json
+import os
+import re
+from datetime import date, datetime
+
+from django.core.files import File
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Q
+from openpyxl import load_workbook
+
+from .columns import import_fields
+from .hashing import ParallelPasswordHasher
+from .models import User, Company, Document, GsezIdPool
+from .search import SEARCH_FIELDS, index_users
+
+# Rows validated in memory and written per transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Never changed when an import updates existing users: they identify the user
+# (gsezid, username) or are derived from its GSEZ ID (qr_code)
+UPSERT_KEY_FIELDS = ('username', 'gsezid', 'qr_code')
+
+# JSON text columns filled from the split multi-value columns
+JSON_FIELDS = ('emergency_contact_numbers', 'family_members', 'previous_employers', 'qualifications')
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%d/%Y', '%d.%m.%Y']
+
+# Values only MM/DD can read (12/31/1990) a column needs, and none only DD/MM can
+# read, before its ambiguous values (05/06/1990) are read as MM/DD instead
+DATE_ORDER_EVIDENCE = 3
+
+QR_CODE_URL = 'http://207.180.234.113/IDCARD/{}'
+
+# Bytes looked at to pick the encoding of an uploaded CSV
+SNIFF_SIZE = 64 * 1024
+
+# Document manifest header (letters and digits only, lower-cased) -> column
+DOCUMENT_COLUMNS = {
+    'username': 'username',
+    'userid': 'username',
+    'gsezid': 'gsezid',
+    'govtidnumber': 'govt_id_number',
+    'govtidphoto': 'photo',
+    'govtidphotopath': 'photo',
+    'photo': 'photo',
+    'photofilename': 'photo',
+}
+
+DOCUMENT_PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+# Archive members larger than this (uncompressed) are refused
+DOCUMENT_PHOTO_MAX_SIZE = 10 * 1024 * 1024
+
+
+def sniff_encoding(sample):
+    """
+    Encoding of an uploaded CSV from its leading bytes: the BOM if there is one,
+    else UTF-8 when the sample is valid UTF-8, else Latin-1.
+    """
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A character cut in half by the end of the sample still counts as UTF-8
+        if e.reason != 'unexpected end of data':
+            return 'latin-1'
+    return 'utf-8'
+
+
+def csv_rows(source):
+    """
+    Rows of a CSV binary file as a generator. The file is decoded incrementally as
+    csv.reader pulls lines, so memory does not grow with the file size.
+    Undecodable bytes after the sniffed sample become U+FFFD instead of failing the import.
+    """
+    source.seek(0)
+    encoding = sniff_encoding(source.read(SNIFF_SIZE))
+    source.seek(0)
+
+    text = io.TextIOWrapper(source, encoding=encoding, errors='replace', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # Leave the file open for the caller to close
+        text.detach()
+
+
+def _xlsx_text(value):
+    # Cell values as the text a CSV export of the sheet would contain
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Phone numbers, ratings and years come back from Excel as floats
+        return str(int(value))
+    return str(value)
+
+
+def xlsx_rows(source):
+    """
+    Rows of the first sheet of an .xlsx binary file as lists of strings. Read-only
+    mode parses the sheet XML as it is iterated instead of loading the workbook.
+    """
+    source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for values in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_xlsx_text(value) for value in values]
+    finally:
+        workbook.close()
+
+
+# Upload extension -> row reader; every importer accepts these
+UPLOAD_READERS = {
+    '.csv': csv_rows,
+    '.xlsx': xlsx_rows,
+}
+
+
+def is_supported_upload(uploaded_file):
+    return os.path.splitext(uploaded_file.name.lower())[1] in UPLOAD_READERS
+
+
+def read_rows(name, source):
+    """Rows of a CSV or Excel binary file, read lazily; the reader is picked by the extension of name."""
+    return UPLOAD_READERS[os.path.splitext(name.lower())[1]](source)
+
+
+def upload_rows(uploaded_file):
+    """Rows of an uploaded CSV or Excel file, read lazily."""
+    return read_rows(uploaded_file.name, uploaded_file.file)
+
+
+def parse_date(value):
+    # Returns None when no supported format matches
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+class DateParser:
+    """
+    parse_date for one column that also tells ambiguous values apart. A value only
+    one format can read (31/01/1990, 01/31/1990) counts as evidence for that
+    format; a value several formats read as different days (05/06/1990) is
+    ambiguous and read with the first of them in DATE_FORMATS order (DD/MM),
+    unless the column's unambiguous values clearly point to another one: at least
+    DATE_ORDER_EVIDENCE of them, and none for the competing formats.
+    """
+
+    def __init__(self, formats=DATE_FORMATS):
+        self.formats = list(formats)
+        self.evidence = dict.fromkeys(self.formats, 0)
+
+    def parse(self, value):
+        """(date, ambiguous) for the value; date is None when no format matches."""
+        readings = []
+        for date_format in self.formats:
+            try:
+                readings.append((date_format, datetime.strptime(value, date_format).date()))
+            except ValueError:
+                continue
+        if not readings:
+            return None, False
+        if len({parsed for _, parsed in readings}) == 1:
+            if len(readings) == 1:
+                self.evidence[readings[0][0]] += 1
+            return readings[0][1], False
+        for date_format, parsed in readings:
+            others = [self.evidence[other] for other, _ in readings if other != date_format]
+            if self.evidence[date_format] >= DATE_ORDER_EVIDENCE and not any(others):
+                return parsed, True
+        return readings[0][1], True
+
+
+def normalize_company_name(name):
+    """Key companies are matched on: whitespace collapsed, case folded ("ABC  Ltd " == "abc ltd")."""
+    return ' '.join(name.split()).casefold()
+
+
+class CompanyResolver:
+    """
+    Company lookups for imports from a map of every company loaded once.
+    Unknown names are created together with one bulk insert instead of a
+    get_or_create per row.
+    """
+
+    def __init__(self):
+        self.companies = {}
+        for company in Company.objects.order_by('id').iterator():
+            # The oldest company wins if near-duplicates already exist
+            self.companies.setdefault(normalize_company_name(company.company_name), company)
+
+    def get(self, name):
+        return self.companies.get(normalize_company_name(name))
+
+    def resolve_many(self, names):
+        """Make sure every name has a company, creating the unseen ones in one go."""
+        missing = {}
+        for name in names:
+            key = normalize_company_name(name)
+            if key and key not in self.companies and key not in missing:
+                missing[key] = ' '.join(name.split())
+        if not missing:
+            return
+
+        try:
+            with transaction.atomic():
+                Company.objects.bulk_create(
+                    [Company(company_name=name) for name in missing.values()],
+                    ignore_conflicts=connection.features.supports_ignore_conflicts
+                )
+        except IntegrityError:
+            # Some were created concurrently and the backend cannot skip conflicts
+            for name in missing.values():
+                Company.objects.get_or_create(company_name=name)
+
+        # bulk_create does not hand back keys on every backend, so read them back
+        for company in Company.objects.filter(company_name__in=list(missing.values())):
+            self.companies.setdefault(normalize_company_name(company.company_name), company)
+
+    def resolve(self, name):
+        self.resolve_many([name])
+        return self.get(name)
+
+
+class CompanyImport:
+    """
+    Company registry import: names are normalized and deduplicated in memory,
+    compared with every existing name loaded in one query, and only the new
+    ones are written with bulk_create in batches.
+
+    Counts: created, duplicate (repeated in the file or already in the
+    database) and invalid (no name, or longer than the column allows).
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.names = {}  # normalized name -> first spelling seen
+        self.created_count = 0
+        self.duplicate_count = 0
+        self.invalid_count = 0
+        self.max_length = Company._meta.get_field('company_name').max_length
+
+    def add_row(self, row_num, row):
+        if not any(value.strip() for value in row):
+            return
+        name = ' '.join(row[0].split()) if row else ''
+        if not name or len(name) > self.max_length:
+            self.invalid_count += 1
+            return
+        key = normalize_company_name(name)
+        if key in self.names:
+            self.duplicate_count += 1
+        else:
+            self.names[key] = name
+
+    def finish(self):
+        """Write the names that are not in the database yet."""
+        existing = {normalize_company_name(name) for name in Company.objects.values_list('company_name', flat=True)}
+        new_names = [name for key, name in self.names.items() if key not in existing]
+        self.duplicate_count += len(self.names) - len(new_names)
+
+        for start in range(0, len(new_names), self.batch_size):
+            self.created_count += self._create(new_names[start:start + self.batch_size])
+
+    def _create(self, names):
+        ignore_conflicts = connection.features.supports_ignore_conflicts
+        try:
+            with transaction.atomic():
+                before = Company.objects.count() if ignore_conflicts else 0
+                Company.objects.bulk_create([Company(company_name=name) for name in names], ignore_conflicts=ignore_conflicts)
+                # Skipped conflicts are not reported, so count what the batch added
+                created = Company.objects.count() - before if ignore_conflicts else len(names)
+        except IntegrityError:
+            # Some were created concurrently and the backend cannot skip conflicts
+            created = sum(Company.objects.get_or_create(company_name=name)[1] for name in names)
+        self.duplicate_count += len(names) - created
+        return created
+
+
+class PendingRow:
+    """A parsed row waiting for its batch to be written."""
+
+    def __init__(self, row_num, user, generated_gsezid=None, password_hash=None, company_name='',
+                 fields=(), password=''):
+        self.row_num = row_num
+        self.user = user
+        self.generated_gsezid = generated_gsezid
+        self.password_hash = password_hash
+        self.company_name = company_name
+        # User fields the row gave a value for; an update only compares these
+        self.fields = fields
+        # Kept unhashed in update mode until the row is known to be new
+        self.password = password
+
+    @property
+    def key(self):
+        # Update mode matches on the GSEZ ID when the row has one, else on the username
+        if self.user.gsezid != self.generated_gsezid:
+            return 'gsezid', self.user.gsezid
+        if self.user.username != self.generated_gsezid:
+            return 'username', self.user.username
+        return None
+
+
+class UserImport:
+    """
+    CSV user import: rows are parsed and validated into unsaved User objects,
+    then written with bulk_create, one transaction per batch. Supplied passwords
+    are hashed on all cores while parsing carries on; rows without one get an
+    unusable password.
+
+    Username / GSEZ ID collisions are checked with one query per batch instead of
+    one per row, and companies come from a CompanyResolver. Per-row problems are
+    collected in messages as (row_num, message, skipped): warnings for rows that
+    were still imported, errors for rows that were skipped.
+
+    With update_existing, rows whose GSEZ ID (or, without one, username) already
+    exists update that user instead of being rejected: the cells the row fills in
+    are compared with the stored values and only changed columns are written,
+    with one bulk_update per set of changed columns. Blank cells, passwords and
+    the identifying columns leave the stored user untouched.
+
+    With dry_run nothing is written: GSEZ IDs are not reserved, passwords not
+    hashed and companies not created, but every row goes through the same
+    parsing and set-based collision checks, so messages list every row that a
+    real import would reject. Companies that would be created are collected in
+    new_companies.
+
+    Background jobs pass start_after to skip the rows an earlier run already
+    committed, a checkpoint(row_num, messages) callback that runs in the same
+    transaction as each batch, with the last row covered and the batch's messages,
+    and a heartbeat() callback that is called for every row and while waiting for
+    password hashes (it is expected to throttle itself).
+    """
+
+    def __init__(self, headers, batch_size=IMPORT_BATCH_SIZE, start_after=0, checkpoint=None, update_existing=False,
+                 dry_run=False, heartbeat=None):
+        # Normalize header: trim whitespace, convert to lowercase
+        self.field_indices = {header.strip().lower(): i for i, header in enumerate(headers)}
+        self.batch_size = batch_size
+        self.gsezid_pool = GsezIdPool(max_block=min(batch_size, 50))
+        self.password_hasher = ParallelPasswordHasher()
+        self.company_resolver = CompanyResolver() if 'current_employer_company' in self.field_indices else None
+        self.pending = []
+        self.seen_usernames = set()
+        self.seen_gsezids = set()
+        self.seen_ids = set()  # existing users updated by this import
+        self.date_parsers = {field: DateParser() for field in import_fields('date')}
+        self.update_existing = update_existing
+        self.dry_run = dry_run
+        self.new_companies = set()
+        self.start_after = start_after
+        self.checkpoint = checkpoint
+        self.heartbeat = heartbeat
+        self.last_row_num = start_after
+        self.success_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.error_count = 0
+        self.messages = []
+        self.reported = 0  # messages already handed to checkpoint
+
+    @property
+    def error_details(self):
+        return [f"Row {row_num}: {message}" if row_num else message for row_num, message, _ in self.messages]
+
+    def add_row(self, row_num, row):
+        if self.heartbeat is not None:
+            self.heartbeat()
+        if row_num <= self.start_after:
+            return
+        self.last_row_num = row_num
+
+        if not any(value.strip() for value in row):
+            self._reject(row_num, "Empty row")
+            return
+
+        try:
+            pending_row = self.build_user(row_num, row)
+        except Exception as e:
+            self._reject(row_num, str(e))
+            return
+
+        self.pending.append(pending_row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def finish(self):
+        """Write the last partial batch, give back the unused GSEZ IDs and stop the hashing workers."""
+        try:
+            self.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        # Also called without a final flush when a job stops on an error
+        self.gsezid_pool.release()
+        self.password_hasher.shutdown()
+
+    # Parsing
+
+    def _has(self, row, field):
+        return field in self.field_indices and self.field_indices[field] < len(row)
+
+    def _value(self, row, field):
+        return row[self.field_indices[field]].strip() if self._has(row, field) else ''
+
+    def build_user(self, row_num, row):
+        """
+        PendingRow with an unsaved User and a Future for its password hash (None for
+        an unusable password); raises for rows that cannot be imported.
+        """
+        user = User(
+            email=User.objects.normalize_email(self._value(row, 'email')),
+            first_name=self._value(row, 'first_name'),
+            last_name=self._value(row, 'last_name'),
+        )
+        fields = set()
+
+        # Set user type and status explicitly first
+        if self._has(row, 'user_type'):
+            user_type_value = self._value(row, 'user_type')
+            if user_type_value in [choice[0] for choice in User.USER_TYPE_CHOICES]:
+                user.user_type = user_type_value
+                fields.add('user_type')
+            elif user_type_value:
+                self._warn(row_num, f"Invalid user_type: {user_type_value}. Using default.")
+
+        if self._has(row, 'status'):
+            status_value = self._value(row, 'status')
+            if status_value in [choice[0] for choice in User.STATUS_CHOICES]:
+                user.status = status_value
+                fields.add('status')
+            elif status_value:
+                self._warn(row_num, f"Invalid status: {status_value}. Using default.")
+
+        # Set optional text fields
+        for field in import_fields('text'):
+            value = self._value(row, field)
+            if value:
+                setattr(user, field, value)
+                fields.add(field)
+
+        # Set boolean fields; a blank cell keeps the default (or, when updating, the stored value)
+        for field in import_fields('bool'):
+            value = self._value(row, field)
+            if value:
+                setattr(user, field, value.lower() in ['1', 'true', 'yes'])
+                fields.add(field)
+
+        # Set date fields
+        for field in import_fields('date'):
+            value = self._value(row, field)
+            if value:
+                date_value, ambiguous = self.date_parsers[field].parse(value)
+                if date_value:
+                    setattr(user, field, date_value)
+                    fields.add(field)
+                    if ambiguous:
+                        self._warn(row_num, f"Ambiguous date for {field}: {value}. Read as {date_value:%d %B %Y}")
+                else:
+                    self._warn(row_num, f"Invalid date format for {field}: {value}. Expected YYYY-MM-DD or DD/MM/YYYY")
+
+        # Set integer fields
+        rating_value = self._value(row, 'current_employer_rating')
+        if rating_value:
+            try:
+                user.current_employer_rating = int(rating_value)
+                fields.add('current_employer_rating')
+            except ValueError:
+                self._warn(row_num, f"Invalid rating value: {rating_value}. Expected integer")
+
+        self._set_json_fields(row_num, row, user)
+        fields.update(field for field in JSON_FIELDS if getattr(user, field))
+
+        # Username defaults to a fresh GSEZ ID, which then also becomes the GSEZ ID.
+        # IDs are only taken once the row has parsed cleanly.
+        username = self._value(row, 'username')
+        generated_gsezid = None
+        if not username:
+            generated_gsezid = self._new_gsezid(row_num)
+            username = generated_gsezid
+        user.username = User.normalize_username(username)
+
+        if not user.gsezid:
+            if not generated_gsezid:
+                generated_gsezid = self._new_gsezid(row_num)
+            user.gsezid = generated_gsezid
+
+        # Set the QR code URL using the GSEZ ID
+        user.qr_code = QR_CODE_URL.format(user.gsezid)
+
+        # Hashed in the worker pool; a random password nobody knows is just an expensive
+        # unusable one, so rows without a password get an unusable password directly
+        password = self._value(row, 'password')
+        password_hash = None
+        if not password:
+            user.set_unusable_password()
+        elif not self.update_existing and not self.dry_run:
+            password_hash = self.password_hasher.submit(password)
+        # The company is resolved for the whole batch at write time
+        return PendingRow(row_num, user, generated_gsezid, password_hash, self._value(row, 'current_employer_company'),
+                          fields - set(UPSERT_KEY_FIELDS), password)
+
+    def _new_gsezid(self, row_num):
+        if self.dry_run:
+            # Stands in for the ID a real import would reserve; cannot collide with a real one
+            return f'<new {row_num}>'
+        return self.gsezid_pool.next()
+
+    def _legacy_json(self, row_num, row, user, field):
+        # Also support the old JSON format for backward compatibility
+        value = self._value(row, field)
+        if value:
+            try:
+                parsed = json.loads(value)
+            except json.JSONDecodeError as je:
+                self._warn(row_num, f"Invalid JSON format for {field}: {str(je)}")
+                return
+            # The profile pages read these as lists of objects
+            if not isinstance(parsed, list) or not all(isinstance(item, dict) for item in parsed):
+                self._warn(row_num, f"Invalid JSON format for {field}: expected a list of objects")
+                return
+            setattr(user, field, value)
+
+    def _set_json_fields(self, row_num, row, user):
+        # Emergency contacts
+        if 'emergency_contact_name' in self.field_indices and 'emergency_contact_number' in self.field_indices:
+            name = self._value(row, 'emergency_contact_name')
+            number = self._value(row, 'emergency_contact_number')
+            if name and number:
+                user.emergency_contact_numbers = json.dumps([{'name': name, 'number': number}])
+        else:
+            self._legacy_json(row_num, row, user, 'emergency_contact_numbers')
+
+        # Family members
+        if 'family_member_name' in self.field_indices and 'family_member_relation' in self.field_indices:
+            name = self._value(row, 'family_member_name')
+            relation = self._value(row, 'family_member_relation')
+            if name and relation:
+                user.family_members = json.dumps([{
+                    'name': name,
+                    'relation': relation,
+                    'number': self._value(row, 'family_member_number')
+                }])
+        else:
+            self._legacy_json(row_num, row, user, 'family_members')
+
+        # Previous employers
+        if 'previous_employer_name' in self.field_indices:
+            company = self._value(row, 'previous_employer_name')
+            if company:
+                employer_data = {'company': company}
+                for csv_field, json_field in [
+                    ('previous_employer_join_date', 'join_date'),
+                    ('previous_employer_leave_date', 'leave_date'),
+                    ('previous_employer_remarks', 'remarks'),
+                    ('previous_employer_rating', 'rating')
+                ]:
+                    value = self._value(row, csv_field)
+                    if value:
+                        employer_data[json_field] = value
+                user.previous_employers = json.dumps([employer_data])
+        else:
+            self._legacy_json(row_num, row, user, 'previous_employers')
+
+        # Qualifications
+        if 'qualification_name' in self.field_indices and 'qualification_institution' in self.field_indices:
+            qualification = self._value(row, 'qualification_name')
+            institution = self._value(row, 'qualification_institution')
+            if qualification and institution:
+                qual_data = {'qualification': qualification, 'institution': institution}
+                year = self._value(row, 'qualification_year')
+                if year:
+                    qual_data['year'] = year
+                user.qualifications = json.dumps([qual_data])
+        else:
+            self._legacy_json(row_num, row, user, 'qualifications')
+
+    # Writing
+
+    def _warn(self, row_num, message):
+        self.messages.append((row_num, message, False))
+
+    def _reject(self, row_num, message, generated_gsezid=None):
+        self.messages.append((row_num, message, True))
+        self.error_count += 1
+        # Hand the ID to the next row instead of leaving a gap
+        if generated_gsezid and not self.dry_run:
+            self.gsezid_pool.put_back(generated_gsezid)
+
+    def flush(self):
+        """Check the buffered rows for collisions with one query per key and write them."""
+        if not self.pending and len(self.messages) == self.reported:
+            return
+        batch, self.pending = self.pending, []
+
+        # Set company foreign keys; unseen companies are created once for the whole batch
+        if self.company_resolver is not None and self.dry_run:
+            self.new_companies.update(
+                normalize_company_name(pending.company_name) for pending in batch
+                if pending.company_name and self.company_resolver.get(pending.company_name) is None
+            )
+        elif self.company_resolver is not None:
+            try:
+                self.company_resolver.resolve_many(pending.company_name for pending in batch if pending.company_name)
+            except Exception as e:
+                self._warn(None, f"Error creating companies: {str(e)}")
+
+        changed = {}
+        if self.update_existing:
+            batch = self.match_existing(batch, changed)
+
+        taken_usernames = set(
+            User.objects.filter(username__in=[pending.user.username for pending in batch])
+            .values_list('username', flat=True)
+        )
+        taken_gsezids = set(
+            User.objects.filter(gsezid__in=[pending.user.gsezid for pending in batch])
+            .values_list('gsezid', flat=True)
+        )
+
+        accepted = []
+        for pending in batch:
+            user, row_num, generated_gsezid = pending.user, pending.row_num, pending.generated_gsezid
+            if user.username in taken_usernames or user.username in self.seen_usernames:
+                self._reject(row_num, f"User with username '{user.username}' already exists",
+                             None if user.username == generated_gsezid else generated_gsezid)
+                continue
+            if user.gsezid in taken_gsezids or user.gsezid in self.seen_gsezids:
+                self._reject(row_num, f"User with GSEZ ID '{user.gsezid}' already exists",
+                             None if user.gsezid == generated_gsezid else generated_gsezid)
+                continue
+            if pending.password_hash is not None:
+                if self.heartbeat is not None:
+                    self.heartbeat()
+                try:
+                    user.password = pending.password_hash.result()
+                except Exception as e:
+                    self._reject(row_num, f"Could not hash password: {str(e)}", generated_gsezid)
+                    continue
+            if pending.company_name and not self.dry_run:
+                company = self.company_resolver.get(pending.company_name)
+                if company is None:
+                    self._warn(row_num, f"Error setting company: {pending.company_name}")
+                user.current_employer_company = company
+            self.seen_usernames.add(user.username)
+            self.seen_gsezids.add(user.gsezid)
+            accepted.append((row_num, user))
+
+        if self.dry_run:
+            # Counted as a real import would count them
+            self.success_count += len(accepted)
+            self.updated_count += sum(len(users) for users in changed.values())
+            if self.checkpoint is not None:
+                self.checkpoint(self.last_row_num, self.messages[self.reported:])
+                self.reported = len(self.messages)
+            return
+        if self.checkpoint is None:
+            self.write(accepted)
+            self.update(changed)
+            return
+        # The batch and its checkpoint commit together, so a resumed job never writes a row twice
+        with transaction.atomic():
+            self.write(accepted)
+            self.update(changed)
+            self.checkpoint(self.last_row_num, self.messages[self.reported:])
+        self.reported = len(self.messages)
+
+    def match_existing(self, batch, changed):
+        """
+        Apply the rows that match an existing user to that user, grouped in changed
+        by the tuple of columns that differ. Returns the rows for new users.
+        """
+        keys = {'gsezid': [], 'username': []}
+        for pending in batch:
+            if pending.key:
+                keys[pending.key[0]].append(pending.key[1])
+        existing = {}
+        if keys['gsezid'] or keys['username']:
+            for user in User.objects.filter(Q(gsezid__in=keys['gsezid']) | Q(username__in=keys['username'])):
+                existing[('gsezid', user.gsezid)] = user
+                existing[('username', user.username)] = user
+
+        new_rows = []
+        for pending in batch:
+            user = existing.get(pending.key) if pending.key else None
+            if user is None:
+                # Hashed now that the row is known to create a user
+                if pending.password and not self.dry_run:
+                    pending.password_hash = self.password_hasher.submit(pending.password)
+                new_rows.append(pending)
+                continue
+
+            if pending.generated_gsezid and not self.dry_run:
+                self.gsezid_pool.put_back(pending.generated_gsezid)
+            if user.id in self.seen_ids:
+                self._reject(pending.row_num, f"User '{user.username}' appears more than once in the file")
+                continue
+            self.seen_ids.add(user.id)
+
+            fields = [field for field in pending.fields if getattr(user, field) != getattr(pending.user, field)]
+            for field in fields:
+                setattr(user, field, getattr(pending.user, field))
+            if pending.company_name:
+                company = self.company_resolver.get(pending.company_name)
+                if company is None:
+                    if self.dry_run:
+                        # Would be created, so the row would change
+                        fields.append('current_employer_company')
+                    else:
+                        self._warn(pending.row_num, f"Error setting company: {pending.company_name}")
+                elif company.id != user.current_employer_company_id:
+                    user.current_employer_company = company
+                    fields.append('current_employer_company')
+
+            if fields:
+                changed.setdefault(tuple(sorted(fields)), []).append(user)
+            else:
+                self.unchanged_count += 1
+        return new_rows
+
+    def update(self, changed):
+        # One UPDATE ... CASE statement per group of rows that changed the same columns
+        reindex = []
+        for fields, users in changed.items():
+            User.objects.bulk_update(users, fields, batch_size=self.batch_size)
+            self.updated_count += len(users)
+            if set(fields) & set(SEARCH_FIELDS):
+                reindex.extend(user.id for user in users)
+        if reindex:
+            # bulk_update bypasses User.save(), so reindex the users whose names changed
+            index_users(reindex)
+
+    def write(self, accepted):
+        if not accepted:
+            return
+        users = [user for _, user in accepted]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=self.batch_size)
+                # bulk_create bypasses User.save(), so index the batch here
+                index_users(
+                    User.objects.filter(username__in=[user.username for user in users]).values_list('id', flat=True)
+                )
+            self.success_count += len(users)
+        except IntegrityError:
+            # A collision the pre-check could not see (a concurrent insert, or a
+            # case-insensitive duplicate); retry row by row to find the bad rows
+            for row_num, user in accepted:
+                # Keys handed out by the rolled-back insert are not real
+                user.pk = None
+                user._state.adding = True
+                try:
+                    with transaction.atomic():
+                        user.save(force_insert=True)
+                    self.success_count += 1
+                except IntegrityError as e:
+                    self._reject(row_num, f"Could not save user '{user.username}': {str(e)}")
+
+
+class PendingDocument:
+    """A manifest row waiting for its batch to be written."""
+
+    def __init__(self, row_num, username, gsezid, govt_id_number, member):
+        self.row_num = row_num
+        self.username = username
+        self.gsezid = gsezid
+        self.govt_id_number = govt_id_number
+        self.member = member
+
+
+class DocumentImport:
+    """
+    Document import from a manifest (username or gsezid, govt ID number, photo
+    file name) and a ZIP of the photos. Members are streamed out of the archive
+    into storage one at a time, never extracted to disk as a whole.
+
+    Users are looked up with one query per batch and the documents written with
+    bulk_create. Rows for a document that already exists (same user and ID
+    number) are skipped, so an upload can be repeated after fixing errors.
+    Problems are collected in messages as (row_num, message, skipped), as in
+    UserImport.
+
+    With dry_run the rows are checked the same way but no photo is stored and
+    no document written.
+    """
+
+    def __init__(self, headers, archive, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+        self.field_indices = {}
+        for i, header in enumerate(headers):
+            column = DOCUMENT_COLUMNS.get(re.sub(r'[^0-9a-z]', '', header.lower()))
+            if column:
+                self.field_indices.setdefault(column, i)
+        if 'username' not in self.field_indices and 'gsezid' not in self.field_indices:
+            raise ValueError('The file needs a username or gsezid column.')
+        if 'govt_id_number' not in self.field_indices or 'photo' not in self.field_indices:
+            raise ValueError('The file needs govt_id_number and photo columns.')
+
+        self.archive = archive
+        # Photos are matched on their path in the archive, else on their file name
+        self.members = {}
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            self.members.setdefault(info.filename.lower(), info)
+            self.members.setdefault(os.path.basename(info.filename).lower(), info)
+
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.pending = []
+        self.seen = set()
+        self.success_count = 0
+        self.error_count = 0
+        self.messages = []
+
+    @property
+    def error_details(self):
+        return [f"Row {row_num}: {message}" for row_num, message, _ in self.messages]
+
+    def _value(self, row, field):
+        index = self.field_indices.get(field)
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    def _reject(self, row_num, message):
+        self.messages.append((row_num, message, True))
+        self.error_count += 1
+
+    def add_row(self, row_num, row):
+        if not any(value.strip() for value in row):
+            return
+
+        username = self._value(row, 'username')
+        gsezid = self._value(row, 'gsezid')
+        govt_id_number = self._value(row, 'govt_id_number')
+        photo = self._value(row, 'photo')
+        if not username and not gsezid:
+            return self._reject(row_num, "Missing username / gsezid")
+        if not govt_id_number:
+            return self._reject(row_num, "Missing govt_id_number")
+        if not photo:
+            return self._reject(row_num, "Missing photo file name")
+
+        # Manifests written on Windows may use backslashes
+        photo = photo.replace('\\', '/').lstrip('/')
+        member = self.members.get(photo.lower()) or self.members.get(os.path.basename(photo).lower())
+        if member is None:
+            return self._reject(row_num, f"Photo '{photo}' is not in the ZIP file")
+        if os.path.splitext(member.filename)[1].lower() not in DOCUMENT_PHOTO_EXTENSIONS:
+            return self._reject(row_num, f"'{member.filename}' is not an image")
+        if member.file_size > DOCUMENT_PHOTO_MAX_SIZE:
+            return self._reject(row_num, f"'{member.filename}' is larger than {DOCUMENT_PHOTO_MAX_SIZE // (1024 * 1024)} MB")
+
+        self.pending.append(PendingDocument(row_num, username, gsezid, govt_id_number, member))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Resolve the batch's users with one query, store the photos and write the documents."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+
+        usernames = [pending.username for pending in batch if pending.username]
+        gsezids = [pending.gsezid for pending in batch if pending.gsezid]
+        by_username, by_gsezid = {}, {}
+        for user_id, username, gsezid in User.objects.filter(
+            Q(username__in=usernames) | Q(gsezid__in=gsezids)
+        ).values_list('id', 'username', 'gsezid'):
+            by_username[username] = user_id
+            by_gsezid[gsezid] = user_id
+
+        matched = []
+        for pending in batch:
+            user_id = by_gsezid.get(pending.gsezid) if pending.gsezid else by_username.get(pending.username)
+            if user_id is None:
+                self._reject(pending.row_num, f"User '{pending.gsezid or pending.username}' does not exist")
+            else:
+                matched.append((user_id, pending))
+
+        existing = set(
+            Document.objects.filter(
+                user_id__in={user_id for user_id, _ in matched},
+                govt_id_number__in={pending.govt_id_number for _, pending in matched}
+            ).values_list('user_id', 'govt_id_number')
+        )
+
+        documents = []
+        try:
+            for user_id, pending in matched:
+                key = (user_id, pending.govt_id_number)
+                if key in existing or key in self.seen:
+                    self._reject(pending.row_num, f"Document '{pending.govt_id_number}' already exists for this user")
+                    continue
+                self.seen.add(key)
+                if self.dry_run:
+                    self.success_count += 1
+                    continue
+
+                document = Document(user_id=user_id, govt_id_number=pending.govt_id_number)
+                try:
+                    with self.archive.open(pending.member) as photo:
+                        document.govt_id_photo.save(os.path.basename(pending.member.filename), File(photo), save=False)
+                except Exception as e:
+                    self._reject(pending.row_num, f"Could not read '{pending.member.filename}': {str(e)}")
+                    continue
+                documents.append(document)
+
+            with transaction.atomic():
+                Document.objects.bulk_create(documents, batch_size=self.batch_size)
+            self.success_count += len(documents)
+        except Exception:
+            # Do not leave photos behind for documents that were never written
+            for document in documents:
+                document.govt_id_photo.delete(save=False)
+            raise
@@ -0,0 +1,103 @@
+"""
+Helpers shared by the database-queued background jobs (exports, imports).
+
+Every claim of a job gets a new token. A worker only writes to the job while it
+still holds its claim: a worker that was too slow, whose job was given up as
+stale and taken by another worker, stops at its next write instead of running
+the same job a second time.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+# A running job whose worker has not reported for this long is treated as dead
+STALE_AFTER = timedelta(minutes=10)
+
+# Seconds between heartbeats of a running job; well inside STALE_AFTER
+HEARTBEAT_EVERY = 30
+
+
+class ClaimLost(Exception):
+    """The job was given up as stale and possibly claimed by another worker."""
+
+
+def spawn_worker(command):
+    """Start a detached `manage.py <command> --once` that drains its queue and exits."""
+    args = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), command, '--once']
+    options = {
+        'cwd': settings.BASE_DIR,
+        'stdin': subprocess.DEVNULL,
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.DEVNULL,
+        'close_fds': True,
+    }
+    if os.name == 'nt':
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+    subprocess.Popen(args, **options)
+
+
+def owned(job):
+    # The job row, as long as this worker's claim on it is current
+    return type(job).objects.filter(id=job.id, status='running', claim=job.claim)
+
+
+class Heartbeat:
+    """
+    Reports a claimed job's worker alive. Called from a loop it writes at most every
+    HEARTBEAT_EVERY seconds; used as a context manager it also beats from a
+    background thread, for steps that block in a single call (a COUNT query,
+    saving a workbook). Raises ClaimLost once the claim is gone.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.last = time.monotonic()
+        self.lost = False
+        self._stop = None
+        self._thread = None
+
+    def beat(self):
+        if not owned(self.job).update(heartbeat_at=timezone.now()):
+            self.lost = True
+            raise ClaimLost
+        self.last = time.monotonic()
+
+    def __call__(self):
+        if self.lost:
+            raise ClaimLost
+        if time.monotonic() - self.last >= HEARTBEAT_EVERY:
+            self.beat()
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat_in_background, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        if self.lost and exc_type is None:
+            raise ClaimLost
+
+    def _beat_in_background(self):
+        try:
+            while not self._stop.wait(HEARTBEAT_EVERY):
+                if time.monotonic() - self.last < HEARTBEAT_EVERY:
+                    continue
+                try:
+                    self.beat()
+                except ClaimLost:
+                    return
+        finally:
+            # The thread's own database connection
+            connections.close_all()
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from core.models import User
+from core.photos import normalize_file
+
+
+class Command(BaseCommand):
+    help = 'Run the stored profile photos through the normalization pipeline, in parallel on all cores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: one per core)')
+        parser.add_argument('--force', action='store_true', help='Also reprocess photos that already look normalized')
+
+    def handle(self, *args, **options):
+        storage = User._meta.get_field('profile_photo').storage
+        # A file shared by several users is processed once
+        names = set(
+            User.objects.exclude(profile_photo__isnull=True).exclude(profile_photo='')
+            .values_list('profile_photo', flat=True)
+        )
+        paths = sorted(path for path in (storage.path(name) for name in names) if os.path.exists(path))
+        missing = len(names) - len(paths)
+        
+        processed = skipped = failed = 0
+        bytes_before = bytes_after = 0
+        # 'spawn' because forking a process with open DB connections is unsafe; the
+        # workers only need Pillow, so they are not set up as Django processes
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(partial(normalize_file, force=options['force']), paths, chunksize=16)
+            for count, (path, before, after, error) in enumerate(results, start=1):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{path}: {error}')
+                elif after is None:
+                    skipped += 1
+                else:
+                    processed += 1
+                    bytes_before += before
+                    bytes_after += after
+                if count % 500 == 0:
+                    self.stdout.write(f'{count}/{len(paths)} photos')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Normalized {processed} photos ({bytes_before // 1024} KB -> {bytes_after // 1024} KB), '
+            f'{skipped} already normalized, {failed} failed, {missing} missing files.'
+        ))
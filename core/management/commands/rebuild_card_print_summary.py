@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import User, refresh_card_print_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the card print count / last print date / remarks stored on each user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        
+        # One short transaction per chunk so the rebuild never holds locks on the whole table
+        for start in range(0, len(user_ids), chunk_size):
+            with transaction.atomic():
+                refresh_card_print_summaries(user_ids[start:start + chunk_size], chunk_size=chunk_size)
+            self.stdout.write(f'{min(start + chunk_size, len(user_ids))}/{len(user_ids)} users')
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt card print summaries for {len(user_ids)} users.'))
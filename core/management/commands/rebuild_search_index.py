@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.models import User
+from core.search import index_users
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the user search index (migrating fills it; run after raw bulk edits)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+        index_users(user_ids.iterator(chunk_size=chunk_size), chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {user_ids.count()} users.'))
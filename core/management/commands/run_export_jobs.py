@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.export_jobs import run_pending_jobs, expire_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background exports and delete expired export files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_jobs()
+            if expired:
+                self.stdout.write(f'Expired {expired} export(s).')
+            
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f'Ran {count} export(s).')
+            
+            if options['once']:
+                break
+            time.sleep(options['interval'])
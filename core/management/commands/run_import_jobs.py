@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.import_jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f'Ran {count} import(s).')
+            
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,110 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import User, Document, is_sharded
+
+# Media directory -> (model, file field, other fields the upload path is built from)
+TARGETS = {
+    'profile_photos': (User, 'profile_photo', ('gsezid', 'username')),
+    'documents': (Document, 'govt_id_photo', ()),
+}
+
+
+class Command(BaseCommand):
+    help = 'Move stored profile photos and document scans into the sharded directory layout and rewrite their paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows moved and updated per transaction')
+        parser.add_argument('--only', choices=sorted(TARGETS), help='Migrate one kind of file only')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        labels = [options['only']] if options['only'] else list(TARGETS)
+        for label in labels:
+            model, field_name, path_fields = TARGETS[label]
+            moved, unchanged, missing = self.shard(
+                label, model, field_name, path_fields, max(1, options['batch_size']), options['dry_run']
+            )
+            verb = 'would be moved' if options['dry_run'] else 'moved'
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {moved} {verb}, {unchanged} already sharded, {missing} missing files.'
+            ))
+        if not options['dry_run']:
+            self.stdout.write('Cached renditions follow the new paths on first request; run warm_renditions to build them ahead.')
+
+    def shard(self, directory, model, field_name, path_fields, batch_size, dry_run):
+        field = model._meta.get_field(field_name)
+        storage = field.storage
+        moved = unchanged = missing = 0
+        # Old name -> new name of files moved during this run; several rows can share a file
+        renamed = {}
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk)
+                .exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+                .order_by('pk').only('pk', field_name, *path_fields)[:batch_size]
+            )
+            if not batch:
+                return moved, unchanged, missing
+            last_pk = batch[-1].pk
+
+            changed = []
+            # (action, source path, destination path) of this batch, undone if it fails
+            done = []
+            try:
+                for obj in batch:
+                    field_file = getattr(obj, field_name)
+                    old = field_file.name
+                    # Done once in its sharded directory, whatever suffix the storage gave the name
+                    if is_sharded(old, directory):
+                        unchanged += 1
+                        continue
+                    new = field.generate_filename(obj, os.path.basename(old)).replace('\\', '/')
+                    old_path = storage.path(old)
+
+                    if old in renamed:
+                        if renamed[old] != new:
+                            # A second row pointing at a file that has already moved gets its own copy
+                            new = storage.get_available_name(new, max_length=field.max_length)
+                            if not dry_run:
+                                self.transfer(shutil.copy2, storage.path(renamed[old]), storage.path(new), done)
+                    elif os.path.exists(old_path):
+                        if storage.exists(new):
+                            # A different file already holds the name (e.g. two scans called scan.jpg)
+                            new = storage.get_available_name(new, max_length=field.max_length)
+                        if not dry_run:
+                            self.transfer(os.rename, old_path, storage.path(new), done)
+                        renamed[old] = new
+                    elif not storage.exists(new):
+                        # Neither at the old path nor moved by an interrupted earlier run
+                        missing += 1
+                        self.stderr.write(f'{old}: file not found')
+                        continue
+
+                    if self.verbosity > 1:
+                        self.stdout.write(f'{old} -> {new}')
+                    field_file.name = new
+                    changed.append(obj)
+
+                if changed and not dry_run:
+                    with transaction.atomic():
+                        model.objects.bulk_update(changed, [field_name], batch_size=batch_size)
+            except Exception:
+                # Put the files back so the database and the disk still agree
+                for action, source, destination in reversed(done):
+                    if action is os.rename:
+                        os.rename(destination, source)
+                    else:
+                        os.remove(destination)
+                raise
+            moved += len(changed)
+
+    def transfer(self, action, source, destination, done):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        action(source, destination)
+        done.append((action, source, destination))
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.models import User, Document
+from core.renditions import RENDITION_SIZES, rendition_cache_dir, rendition_path, render_task
+
+# kind -> (model, photo field)
+PHOTO_SOURCES = {
+    'profile': (User, 'profile_photo'),
+    'document': (Document, 'govt_id_photo'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Generate the cached photo renditions that do not exist yet, e.g. after a bulk import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(RENDITION_SIZES), default=['avatar', 'card'])
+        parser.add_argument('--kinds', nargs='+', choices=list(PHOTO_SOURCES), default=list(PHOTO_SOURCES))
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: one per core)')
+
+    def handle(self, *args, **options):
+        cache_dir = rendition_cache_dir()
+        
+        tasks = {}
+        missing = 0
+        for kind in options['kinds']:
+            model, field_name = PHOTO_SOURCES[kind]
+            storage = model._meta.get_field(field_name).storage
+            names = model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+            for name in set(names.values_list(field_name, flat=True)):
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    missing += 1
+                    continue
+                for size in options['sizes']:
+                    dest_path, _ = rendition_path(cache_dir, name, path, size)
+                    if not os.path.exists(dest_path):
+                        tasks[dest_path] = (path, dest_path, size)
+        
+        self.stdout.write(f'{len(tasks)} renditions to generate.')
+        failed = 0
+        # 'spawn' because forking a process with open DB connections is unsafe; the
+        # workers only need Pillow, so they are not set up as Django processes
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            for count, error in enumerate(executor.map(render_task, tasks.values(), chunksize=16), start=1):
+                if error:
+                    failed += 1
+                    self.stderr.write(error)
+                if count % 500 == 0:
+                    self.stdout.write(f'{count}/{len(tasks)} renditions')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(tasks) - failed} renditions, {failed} failed, {missing} missing source files.'
+        ))
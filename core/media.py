@@ -0,0 +1,140 @@
+"""
+Sending stored files: conditional requests, cache headers and hand-off to the
+front proxy.
+
+With MEDIA_SENDFILE set, Django only checks permissions and answers with an
+X-Accel-Redirect (nginx) or X-Sendfile (Apache mod_xsendfile, lighttpd) header;
+the proxy then sends the bytes, including Range requests. Without it the file
+is streamed by FileResponse, with single byte-range support so video-style
+seeking and resumed downloads still work.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+SENDFILE_BACKENDS = ('x-accel-redirect', 'x-sendfile')
+
+# For URLs that carry the file's version, so the bytes behind them never change
+CACHE_IMMUTABLE = 'max-age=31536000, immutable'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_backend():
+    backend = getattr(settings, 'MEDIA_SENDFILE', None)
+    return backend if backend in SENDFILE_BACKENDS else None
+
+
+def accel_url(prefix, name):
+    """Internal proxy URL of `name` (relative to the directory the location aliases)."""
+    return prefix.rstrip('/') + '/' + quote(name.replace(os.sep, '/'))
+
+
+def file_etag(stat):
+    # Size and modification time, as nginx and Apache compute theirs
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def media_url(field_file):
+    """
+    URL of a stored file carrying its version (the ETag without quotes) as ?v=, so
+    serve_media can let browsers cache it for good: a replaced file gets a new URL.
+    """
+    try:
+        version = file_etag(os.stat(field_file.path)).strip('"')
+    except OSError:
+        return field_file.url
+    return f'{field_file.url}?v={version}'
+
+
+def _parse_range(header, size):
+    """
+    (first byte, last byte) of a single-range header, None when the header should be
+    ignored (malformed or several ranges: the whole file is sent). Raises ValueError
+    when the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # "bytes=-500": the last 500 bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        raise ValueError
+    return first, last
+
+
+def _read_range(file, first, length, block_size=FileResponse.block_size):
+    with file:
+        file.seek(first)
+        while length > 0:
+            data = file.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_file(request, path, cache_control, etag=None, accel=None, content_type=None):
+    """
+    Response for the file at `path`. `accel` is its internal URL for X-Accel-Redirect
+    (see accel_url); without one the file is sent by Django even when nginx is configured.
+    """
+    stat = os.stat(path)
+    etag = etag or file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        backend = sendfile_backend()
+        if backend == 'x-accel-redirect' and accel:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel
+        elif backend == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        else:
+            response = _python_response(request, path, stat.st_size, etag, last_modified, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _python_response(request, path, size, etag, last_modified, content_type):
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # A stale If-Range means the client's partial copy is outdated: send everything
+    if range_header and (not if_range or if_range in (etag, http_date(last_modified))):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            first, last = byte_range
+            length = last - first + 1
+            response = StreamingHttpResponse(
+                _read_range(open(path, 'rb'), first, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = str(length)
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return response
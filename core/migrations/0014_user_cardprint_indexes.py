@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_usersearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'username', 'id'], name='core_user_type_username_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'status', 'is_verified', 'is_printed'], name='core_user_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'is_printed'], name='core_user_type_printed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'is_verified'], name='core_user_type_verified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'current_employer_company'], name='core_user_type_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cardprint',
+            index=models.Index(fields=['card_print_date', 'user'], name='core_cardprint_date_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cardprint',
+            index=models.Index(fields=['user', 'card_print_date'], name='core_cardprint_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_card_print_summary(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    CardPrint = apps.get_model('core', 'CardPrint')
+    
+    latest = CardPrint.objects.filter(user=OuterRef('pk')).order_by('-card_print_date', '-id')
+    print_count = (
+        CardPrint.objects.filter(user=OuterRef('pk'))
+        .order_by().values('user').annotate(total=Count('id')).values('total')
+    )
+    # Only users that have prints need updating; the defaults already fit everyone else
+    user_ids = list(CardPrint.objects.order_by().values_list('user_id', flat=True).distinct())
+    for start in range(0, len(user_ids), 1000):
+        User.objects.filter(id__in=user_ids[start:start + 1000]).update(
+            card_print_count=Coalesce(Subquery(print_count), Value(0)),
+            last_card_print_date=Subquery(latest.values('card_print_date')[:1]),
+            last_card_print_remarks=Subquery(latest.values('remarks')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_cardprint_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='card_print_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='last_card_print_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='last_card_print_remarks',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_card_print_summary, migrations.RunPython.noop),
+    ]
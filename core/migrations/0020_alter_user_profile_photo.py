@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:45
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_importjob_dry_run'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_photo',
+            field=core.models.ProfilePhotoField(blank=True, null=True, upload_to=core.models.profile_photo_path),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 16:20
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_alter_user_profile_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='govt_id_photo',
+            field=models.ImageField(upload_to=core.models.document_photo_path),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_alter_document_govt_id_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='claim',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:40
+
+from django.db import migrations
+
+from core.search import tokenize
+
+# The user fields the index was built from when this migration was written
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email', 'gsezid')
+
+
+def fill_user_search_tokens(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    UserSearchToken = apps.get_model('core', 'UserSearchToken')
+    
+    # Users that existed before the index, or were saved before it covered every
+    # script, are re-tokenized in chunks; rows already there are rebuilt alongside
+    last_id = 0
+    while True:
+        chunk = list(User.objects.filter(id__gt=last_id).order_by('id').values('id', *SEARCH_FIELDS)[:1000])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+        rows = []
+        for values in chunk:
+            tokens = set()
+            for field in SEARCH_FIELDS:
+                tokens.update(tokenize(values[field]))
+            rows.extend(UserSearchToken(user_id=values['id'], token=token) for token in tokens)
+        UserSearchToken.objects.filter(user_id__in=[values['id'] for values in chunk]).delete()
+        UserSearchToken.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_exportjob_claim'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_user_search_tokens, migrations.RunPython.noop),
+    ]
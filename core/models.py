@@ -1,14 +1,23 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 import qrcode
 from io import BytesIO
 from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import ImageFieldFile
 from PIL import Image
+import hashlib
 import json
 from datetime import datetime
 import os
+import re
+import uuid
+
+from .photos import normalize_photo
 
 # Custom UserManager to override create_user method
 class CustomUserManager(UserManager):
@@ -25,48 +34,154 @@ class CustomUserManager(UserManager):
             
         return self._create_user(username, email, password, **extra_fields)
 
+# Prefix of a GSEZ ID for the given day: ZIS + YY + MM + DD
+def gsezid_prefix(day=None):
+    day = day or datetime.now()
+    return f'ZIS{day.year % 100:02d}{day.month:02d}{day.day:02d}'
+
+# Check whether a value looks like an auto-generated GSEZ ID (ZISyyMMdd###)
+def is_generated_gsezid(value):
+    return bool(value) and bool(re.fullmatch(r'ZIS\d{6}\d{3,}', value))
+
+# Highest sequence number that still fits the 3-digit ZISyyMMdd### form
+GSEZID_SEQUENCE_MAX = 999
+
+def _highest_gsezid_sequence(prefix):
+    # Only used once per day, when the sequence row for that day is first created,
+    # so IDs handed out before the sequence table existed are never reused
+    highest = 0
+    for gsezid in User.objects.filter(gsezid__startswith=prefix).values_list('gsezid', flat=True):
+        suffix = gsezid[len(prefix):]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
+def _allocate_gsezid_sequence(prefix, count=1, limit=None):
+    """
+    Atomically claim `count` consecutive sequence numbers for the given prefix
+    and return them as a range. With a limit, the claim stops at it and the
+    range is shorter (or empty) once the day's numbers run out.
+    The UPDATE takes a row lock that is held until the transaction commits, so
+    concurrent workers (on any host) are serialized on the single sequence row.
+    """
+    with transaction.atomic():
+        updated = GsezIdSequence.objects.filter(prefix=prefix).update(last_value=F('last_value') + count)
+        if not updated:
+            try:
+                # First ID of the day - create the row inside a savepoint so a
+                # concurrent insert just falls through to the UPDATE below
+                with transaction.atomic():
+                    GsezIdSequence.objects.create(
+                        prefix=prefix,
+                        last_value=_highest_gsezid_sequence(prefix) + count
+                    )
+            except IntegrityError:
+                GsezIdSequence.objects.filter(prefix=prefix).update(last_value=F('last_value') + count)
+        last_value = GsezIdSequence.objects.filter(prefix=prefix).values_list('last_value', flat=True).get()
+        first_value = last_value - count + 1
+        if limit is not None and last_value > limit:
+            # Give back the part past the limit; the row is still locked by the UPDATE
+            last_value = max(limit, first_value - 1)
+            GsezIdSequence.objects.filter(prefix=prefix).update(last_value=last_value)
+        return range(first_value, last_value + 1)
+
 # Function to generate GSEZ ID in the format ZIS + YY + MM + DD + 3-digit sequence number
 def generate_gsezid():
-    # Get current year, month and date
-    now = datetime.now()
-    current_year = now.year % 100  # Get last 2 digits of year
-    current_month = now.month
-    current_day = now.day
-    
-    # Create date string for filtering
-    date_prefix = f'ZIS{current_year:02d}{current_month:02d}{current_day:02d}'
-    
-    # Find users with today's date prefix
-    users_today = User.objects.filter(gsezid__startswith=date_prefix)
-    
-    # If no users exist with today's date prefix, start from 001
-    if not users_today.exists():
-        sequence_number = 1
-    else:
-        # Find the highest sequence number used today
-        try:
-            # Get all GSEZIDs for today and extract their sequence numbers
-            sequence_numbers = []
-            for user in users_today:
-                try:
-                    seq_num = int(user.gsezid[-3:])
-                    sequence_numbers.append(seq_num)
-                except (ValueError, IndexError):
-                    continue
-            
-            # Find the highest sequence number
-            if sequence_numbers:
-                highest_sequence = max(sequence_numbers)
-                # Increment by 1 if not at max
-                sequence_number = min(highest_sequence + 1, 999)
-            else:
-                sequence_number = 1
-        except Exception:
-            # In case of any error, start from 001
-            sequence_number = 1
+    prefix = gsezid_prefix()
+    sequence_number = _allocate_gsezid_sequence(prefix)[0]
     
     # Format the GSEZ ID as ZISyyMMdd###
-    return f'ZIS{current_year:02d}{current_month:02d}{current_day:02d}{sequence_number:03d}'
+    return f'{prefix}{sequence_number:03d}'
+
+# Next GSEZ ID that generate_gsezid() would return, without claiming it (for display only)
+def peek_gsezid():
+    prefix = gsezid_prefix()
+    last_value = GsezIdSequence.objects.filter(prefix=prefix).values_list('last_value', flat=True).first()
+    if last_value is None:
+        last_value = _highest_gsezid_sequence(prefix)
+    return f'{prefix}{last_value + 1:03d}'
+
+def reserve_gsezids(count):
+    """
+    Claim `count` consecutive GSEZ IDs for today in a single round trip, never past
+    GSEZID_SEQUENCE_MAX: near the end of the day's numbers fewer IDs (or none) are
+    returned. Returns the IDs in order; give back any that end up unused with
+    release_gsezids().
+    """
+    if count <= 0:
+        return []
+    prefix = gsezid_prefix()
+    return [f'{prefix}{n:03d}' for n in _allocate_gsezid_sequence(prefix, count, limit=GSEZID_SEQUENCE_MAX)]
+
+def release_gsezids(gsezids):
+    """
+    Return unused IDs from a reservation to the sequence. Only the contiguous run
+    ending at the current top of the sequence can be returned, and only if nobody
+    allocated after it; anything else is left as a gap. Returns the number released.
+    """
+    by_prefix = {}
+    for gsezid in gsezids:
+        prefix, suffix = gsezid[:9], gsezid[9:]
+        if is_generated_gsezid(gsezid):
+            by_prefix.setdefault(prefix, set()).add(int(suffix))
+    
+    released = 0
+    for prefix, numbers in by_prefix.items():
+        top = max(numbers)
+        first = top
+        while first - 1 in numbers:
+            first -= 1
+        # Compare-and-set: only rewind if the sequence is still at the end of our block
+        if GsezIdSequence.objects.filter(prefix=prefix, last_value=top).update(last_value=first - 1):
+            released += top - first + 1
+    return released
+
+class GsezIdPool:
+    """
+    Hands out GSEZ IDs in memory from blocks claimed with reserve_gsezids(),
+    so bulk paths pay one sequence round trip per block instead of per row.
+    Blocks start small and double up to max_block, so a short import holds back
+    only a few numbers from the registrations running alongside it.
+    """
+    def __init__(self, max_block=50, first_block=4):
+        self.max_block = max_block
+        self.block_size = min(first_block, max_block)
+        self._available = []
+    
+    def next(self):
+        if not self._available:
+            # Stored reversed so pop() hands them out in ascending order
+            self._available = list(reversed(reserve_gsezids(self.block_size)))
+            if not self._available:
+                raise ValueError(f"No GSEZ IDs are left for today (the last is {gsezid_prefix()}{GSEZID_SEQUENCE_MAX})")
+            self.block_size = min(self.block_size * 2, self.max_block)
+        return self._available.pop()
+    
+    def put_back(self, gsezid):
+        # An ID whose row failed to save is handed out again instead of leaving a gap
+        self._available.append(gsezid)
+    
+    def release(self):
+        released = release_gsezids(self._available)
+        self._available = []
+        return released
+
+def sharded_path(directory, filename):
+    """
+    directory/ab/cd/filename, with ab/cd taken from a hash of the filename, so no
+    single directory grows past a few entries per thousand files
+    (the same filename always lands in the same place).
+    """
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(directory, digest[:2], digest[2:4], filename)
+
+def is_sharded(name, directory):
+    # True for a stored name already in directory/ab/cd/; collision suffixes do not matter
+    parts = name.replace('\\', '/').split('/')
+    return (
+        len(parts) == 4 and parts[0] == directory
+        and all(re.fullmatch(r'[0-9a-f]{2}', part) for part in parts[1:3])
+    )
 
 # Function to determine upload path for profile photos using GSEZ ID
 def profile_photo_path(instance, filename):
@@ -78,7 +193,46 @@ def profile_photo_path(instance, filename):
         filename = f"{instance.username}.jpg"
     
     # Return the complete path
-    return os.path.join('profile_photos', filename)
+    return sharded_path('profile_photos', filename)
+
+def document_photo_path(instance, filename):
+    return sharded_path('documents', os.path.basename(filename))
+
+class ProfilePhotoFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        # Form uploads, camera captures and direct profile_photo.save() calls all end up here
+        content = ContentFile(normalize_photo(content), name=name)
+        target = self.field.generate_filename(self.instance, name)
+        gsezid = self.instance.gsezid
+        if not gsezid or os.path.basename(target) != f'{gsezid}.jpg' or not self.storage.exists(target):
+            super().save(name, content, save)
+            return
+        # The user's own <gsezid>.jpg is replaced instead of getting a random suffix
+        # (renditions and ETags follow the new mtime). The new photo is written under
+        # the suffixed name first and only then moved over it, so a failed write
+        # leaves the old photo in place.
+        super().save(name, content, save=False)
+        try:
+            os.replace(self.storage.path(self.name), self.storage.path(target))
+        except OSError:
+            self.storage.delete(self.name)
+            raise
+        self.name = target
+        setattr(self.instance, self.field.attname, self.name)
+        if save:
+            self.instance.save()
+
+class ProfilePhotoField(models.ImageField):
+    """ImageField whose files are normalized by core.photos before they are stored."""
+    attr_class = ProfilePhotoFieldFile
+
+class GsezIdSequence(models.Model):
+    # One row per day prefix (ZISyyMMdd) holding the last sequence number handed out
+    prefix = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.prefix} ({self.last_value})"
 
 class Company(models.Model):
     company_name = models.CharField(max_length=200, unique=True)
@@ -89,6 +243,9 @@ class Company(models.Model):
     class Meta:
         verbose_name_plural = "Companies"
 
+# Columns only refresh_card_print_summaries() writes
+CARD_PRINT_SUMMARY_FIELDS = ('card_print_count', 'last_card_print_date', 'last_card_print_remarks')
+
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
         ('user', 'User'),
@@ -137,7 +294,7 @@ class User(AbstractUser):
     gsez_card_issue_date = models.DateField(blank=True, null=True)
     gsez_card_expiry_date = models.DateField(blank=True, null=True)
     gsezid = models.CharField(max_length=50, unique=True, blank=True, null=True)
-    profile_photo = models.ImageField(upload_to=profile_photo_path, blank=True, null=True)
+    profile_photo = ProfilePhotoField(upload_to=profile_photo_path, blank=True, null=True)
     profile_full_link = models.CharField(max_length=255, blank=True, null=True)
     
     # Contact Information - Using TextField with JSON serialization instead of JSONField
@@ -174,9 +331,43 @@ class User(AbstractUser):
     is_required_profile_detail = models.BooleanField(default=True)
     is_printed = models.BooleanField(default=False)
     
+    # Card print summary, denormalized from CardPrint by refresh_card_print_summaries()
+    # and never written by save() on an existing user (see CARD_PRINT_SUMMARY_FIELDS)
+    card_print_count = models.PositiveIntegerField(default=0)
+    last_card_print_date = models.DateField(blank=True, null=True)
+    last_card_print_remarks = models.TextField(blank=True, null=True)
+    
+    class Meta(AbstractUser.Meta):
+        # Match the filters the admin lists, dashboard counts and exports stack on user_type
+        indexes = [
+            models.Index(fields=['user_type', 'username', 'id'], name='core_user_type_username_idx'),
+            models.Index(fields=['user_type', 'status', 'is_verified', 'is_printed'], name='core_user_type_status_idx'),
+            models.Index(fields=['user_type', 'is_printed'], name='core_user_type_printed_idx'),
+            models.Index(fields=['user_type', 'is_verified'], name='core_user_type_verified_idx'),
+            models.Index(fields=['user_type', 'current_employer_company'], name='core_user_type_company_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.username})"
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # An instance loaded before a card print would write its stale summary back;
+            # deferred fields stay unsaved, as Django does by itself
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in CARD_PRINT_SUMMARY_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+        
+        # Keep the search index in sync (bulk paths call core.search.index_users instead)
+        from .search import SEARCH_FIELDS, index_user
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+            index_user(self)
+    
     # Helper methods for JSON fields
     def get_emergency_contacts(self):
         if not self.emergency_contact_numbers:
@@ -222,10 +413,24 @@ class User(AbstractUser):
     def set_qualifications(self, qualifications):
         self.qualifications = json.dumps(qualifications)
 
+class UserSearchToken(models.Model):
+    # Normalized word from a user's name, username, email or GSEZ ID, used for prefix search
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=150)
+    
+    def __str__(self):
+        return f"{self.token} -> {self.user_id}"
+    
+    class Meta:
+        unique_together = ('user', 'token')
+        indexes = [
+            models.Index(fields=['token', 'user'], name='core_search_token_user_idx'),
+        ]
+
 class Document(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
     govt_id_number = models.CharField(max_length=100)
-    govt_id_photo = models.ImageField(upload_to='documents/')
+    govt_id_photo = models.ImageField(upload_to=document_photo_path)
     
     def __str__(self):
         return f"Document for {self.user}"
@@ -241,3 +446,159 @@ class CardPrint(models.Model):
     
     class Meta:
         ordering = ['-card_print_date']
+        indexes = [
+            # Users with a card printed on / between dates (list filter, export filter)
+            models.Index(fields=['card_print_date', 'user'], name='core_cardprint_date_user_idx'),
+            # Latest print for a user
+            models.Index(fields=['user', 'card_print_date'], name='core_cardprint_user_date_idx'),
+        ]
+
+def export_job_path(instance, filename):
+    # One unguessable directory per job; artifacts are only served through the download view
+    return f'exports/{instance.token.hex}/{filename}'
+
+class ExportJob(models.Model):
+    KIND_CHOICES = (
+        ('users', 'Users'),
+        ('documents', 'Documents'),
+        ('companies', 'Companies'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    )
+    
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    export_format = models.CharField(max_length=10)
+    params = models.TextField(default='{}')  # JSON string of the filters / selected fields
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='export_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    rows_total = models.PositiveIntegerField(blank=True, null=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to=export_job_path, max_length=255, blank=True)
+    # New for every claim; a worker only writes to the job while it still holds its claim
+    claim = models.UUIDField(blank=True, null=True, editable=False)
+    error = models.TextField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} export #{self.pk} ({self.status})"
+    
+    @property
+    def progress(self):
+        # Percentage done, None until the row count is known
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return None
+        return min(99, self.rows_done * 100 // self.rows_total)
+    
+    def get_params(self):
+        return json.loads(self.params or '{}')
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Worker queue scan and expiry sweep
+            models.Index(fields=['status', 'created_at'], name='core_exportjob_status_idx'),
+        ]
+
+def import_job_path(instance, filename):
+    # Uploads are kept until the job finishes so a failed job can be resumed
+    return f'imports/{instance.token.hex}/{filename}'
+
+class ImportJob(models.Model):
+    KIND_CHOICES = (
+        ('users', 'Users'),
+        ('documents', 'Documents'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='users')
+    file = models.FileField(upload_to=import_job_path, max_length=255, blank=True)
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='import_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    # New for every claim; a worker only writes to the job while it still holds its claim
+    claim = models.UUIDField(blank=True, null=True, editable=False)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    rows_total = models.PositiveIntegerField(blank=True, null=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    # File row number of the last row whose batch was committed; a resumed job starts after it
+    checkpoint_row = models.PositiveIntegerField(default=0)
+    update_existing = models.BooleanField(default=False)  # update matching users instead of skipping them
+    dry_run = models.BooleanField(default=False)  # validate only; the counts are what an import would do
+    success_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.pk} ({self.status})"
+    
+    @property
+    def progress(self):
+        # Percentage done, None until the row count is known
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return None
+        return min(99, self.rows_done * 100 // self.rows_total)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='core_importjob_status_idx'),
+        ]
+
+class ImportRowError(models.Model):
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='row_errors')
+    row_num = models.PositiveIntegerField(blank=True, null=True)  # None for problems not tied to a row
+    message = models.TextField()
+    skipped = models.BooleanField(default=True)  # False for warnings on rows that were still imported
+    
+    def __str__(self):
+        return f"Row {self.row_num}: {self.message}"
+    
+    class Meta:
+        ordering = ['row_num', 'id']
+        indexes = [
+            models.Index(fields=['job', 'row_num'], name='core_importrowerr_job_idx'),
+        ]
+
+def refresh_card_print_summaries(user_ids, chunk_size=1000):
+    """
+    Recompute card_print_count / last_card_print_date / last_card_print_remarks
+    for the given users from CardPrint, with one set-based UPDATE per chunk.
+    Call it inside the same transaction as the CardPrint change.
+    """
+    user_ids = list(user_ids)
+    latest = CardPrint.objects.filter(user=OuterRef('pk')).order_by('-card_print_date', '-id')
+    print_count = (
+        CardPrint.objects.filter(user=OuterRef('pk'))
+        .order_by().values('user').annotate(total=Count('id')).values('total')
+    )
+    for start in range(0, len(user_ids), chunk_size):
+        User.objects.filter(id__in=user_ids[start:start + chunk_size]).update(
+            card_print_count=Coalesce(Subquery(print_count), Value(0)),
+            last_card_print_date=Subquery(latest.values('card_print_date')[:1]),
+            last_card_print_remarks=Subquery(latest.values('remarks')[:1]),
+        )
+
@@ -0,0 +1,174 @@
+import base64
+import json
+
+from django.db import connection
+from django.db.models import F, Q
+
+# Filtered lists are counted up to this many rows and shown as "N+" beyond it
+COUNT_ESTIMATE_CAP = 1000
+
+
+def encode_cursor(values, direction):
+    """Opaque, URL-safe token for the row boundary `values` in the given direction ('next'/'prev')."""
+    payload = json.dumps({'d': direction, 'v': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns (direction, values) or (None, None) for a missing or tampered cursor
+    if not token:
+        return None, None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        direction, values = payload['d'], payload['v']
+    except (ValueError, TypeError, KeyError):
+        return None, None
+    if direction not in ('next', 'prev') or not (values is None or isinstance(values, list)):
+        return None, None
+    if values is not None and not all(v is None or isinstance(v, (str, int, float)) for v in values):
+        return None, None
+    if direction == 'next' and values is None:
+        return None, None
+    return direction, values
+
+
+def _beyond(name, value, larger):
+    # Rows whose value sorts strictly after (larger) or before `value`; NULL sorts first
+    if larger:
+        return Q(**{f'{name}__isnull': False}) if value is None else Q(**{f'{name}__gt': value})
+    if value is None:
+        return None
+    return Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+
+
+def _equal(name, value):
+    return Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+
+def _seek(fields, values, forward):
+    """
+    Keyset predicate for rows strictly after (forward) or before the boundary row:
+    (a > x) OR (a = x AND b > y) OR ... with the comparison flipped for descending fields.
+    """
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for (name, descending), value in zip(fields, values):
+        beyond = _beyond(name, value, larger=(forward != descending))
+        if beyond is not None:
+            condition |= prefix & beyond
+        prefix &= _equal(name, value)
+    return condition
+
+
+def _order_by(fields, reverse=False):
+    # Explicit NULL placement so the seek predicate matches the sort on every backend.
+    # NULLs-lowest is already the native order on SQL Server and SQLite, so no CASE
+    # expression is added there and the index on the ordering columns is still usable.
+    expressions = []
+    for name, descending in fields:
+        if descending != reverse:
+            expressions.append(F(name).desc(nulls_last=True))
+        else:
+            expressions.append(F(name).asc(nulls_first=True))
+    return expressions
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count for display: catalog statistics for an unfiltered table,
+    otherwise a count capped at COUNT_ESTIMATE_CAP. Returns (count, label).
+    """
+    if not queryset.query.where.children:
+        table = queryset.model._meta.db_table
+        estimate = None
+        with connection.cursor() as cursor:
+            if connection.vendor == 'microsoft':
+                cursor.execute(
+                    "SELECT SUM(row_count) FROM sys.dm_db_partition_stats "
+                    "WHERE object_id = OBJECT_ID(%s) AND index_id IN (0, 1)",
+                    [table]
+                )
+                estimate = cursor.fetchone()[0]
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+                row = cursor.fetchone()
+                estimate = row[0] if row and row[0] >= 0 else None
+        if estimate is not None:
+            return int(estimate), f'about {int(estimate)}'
+
+    count = queryset.order_by()[:COUNT_ESTIMATE_CAP + 1].count()
+    if count > COUNT_ESTIMATE_CAP:
+        return COUNT_ESTIMATE_CAP, f'{COUNT_ESTIMATE_CAP}+'
+    return count, str(count)
+
+
+class CursorPage:
+    """One page of a keyset-paginated list; iterates like a Django Page's object_list."""
+
+    def __init__(self, object_list, fields, has_next, has_previous, count, count_label):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+        self.count_label = count_label
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list:
+            if has_next:
+                self.next_cursor = encode_cursor(self._boundary(object_list[-1], fields), 'next')
+            if has_previous:
+                self.previous_cursor = encode_cursor(self._boundary(object_list[0], fields), 'prev')
+        # Jumping to the end is a backwards walk from "after the last row"
+        self.last_cursor = encode_cursor(None, 'prev') if has_next else None
+
+    @staticmethod
+    def _boundary(obj, fields):
+        return [getattr(obj, name) for name, descending in fields]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def paginate_by_cursor(queryset, ordering, cursor, per_page, exact_count=False):
+    """
+    Keyset ("seek") pagination: each page is WHERE <after boundary> ORDER BY ... LIMIT n+1,
+    so page N costs the same as page 1.
+    `ordering` is a list like ['username', 'id'] or ['-id'] and must end in a unique field;
+    boundary values must be JSON-serializable (strings and numbers).
+    """
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(fields):
+        direction, values = None, None
+
+    if direction == 'prev':
+        page_qs = queryset.order_by(*_order_by(fields, reverse=True))
+        if values is not None:
+            page_qs = page_qs.filter(_seek(fields, values, forward=False))
+        rows = list(page_qs[:per_page + 1])
+        has_previous = len(rows) > per_page
+        object_list = list(reversed(rows[:per_page]))
+        has_next = values is not None
+    else:
+        page_qs = queryset.order_by(*_order_by(fields))
+        if direction == 'next':
+            page_qs = page_qs.filter(_seek(fields, values, forward=True))
+        rows = list(page_qs[:per_page + 1])
+        has_next = len(rows) > per_page
+        object_list = rows[:per_page]
+        has_previous = direction == 'next'
+
+    if exact_count:
+        count = queryset.count()
+        count_label = str(count)
+    else:
+        count, count_label = estimate_count(queryset)
+
+    return CursorPage(object_list, fields, has_next, has_previous, count, count_label)
@@ -0,0 +1,120 @@
+"""
+Profile photo normalization: every stored photo becomes an upright JPEG without
+metadata, cropped to the card frame, scaled down and compressed to a byte budget.
+
+This module must not import models: the backfill command runs normalize_file()
+in spawned worker processes that never set Django up.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+# Card photo frame as width:height; the ID card and the list views show photos square
+PHOTO_ASPECT = (1, 1)
+
+# Longest edge in pixels; the card prints the photo at under 200px
+PHOTO_MAX_EDGE = 600
+
+# Byte budget per photo, reached by lowering the JPEG quality, then the size
+PHOTO_TARGET_BYTES = 80 * 1024
+PHOTO_MIN_QUALITY = 40
+PHOTO_MAX_QUALITY = 90
+
+# Below this edge length a photo is not shrunk further to meet the budget
+PHOTO_MIN_EDGE = 160
+
+
+def flatten_image(image):
+    # Transparent areas become white, as on the printed card
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _fit(image):
+    # Largest frame of the card aspect ratio, scaled down to PHOTO_MAX_EDGE
+    aspect_width, aspect_height = PHOTO_ASPECT
+    width, height = image.size
+    if width * aspect_height > height * aspect_width:
+        crop = (height * aspect_width // aspect_height, height)
+    else:
+        crop = (width, width * aspect_height // aspect_width)
+    scale = min(1, PHOTO_MAX_EDGE / max(crop))
+    size = (max(1, round(crop[0] * scale)), max(1, round(crop[1] * scale)))
+    # Slightly above centre, where faces usually are
+    return ImageOps.fit(image, size, method=Image.Resampling.LANCZOS, centering=(0.5, 0.4))
+
+
+def _jpeg(image, quality):
+    output = io.BytesIO()
+    # No exif / icc_profile arguments, so no metadata is written
+    image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _encode(image):
+    """Highest quality JPEG within PHOTO_TARGET_BYTES, shrinking the image if even the lowest quality is too big."""
+    while True:
+        low, high, best = PHOTO_MIN_QUALITY, PHOTO_MAX_QUALITY, None
+        while low <= high:
+            quality = (low + high) // 2
+            data = _jpeg(image, quality)
+            if len(data) <= PHOTO_TARGET_BYTES:
+                best, low = data, quality + 1
+            else:
+                high = quality - 1
+        if best is not None:
+            return best
+        if min(image.size) <= PHOTO_MIN_EDGE:
+            return _jpeg(image, PHOTO_MIN_QUALITY)
+        image = image.resize((image.width * 4 // 5, image.height * 4 // 5), Image.Resampling.LANCZOS)
+
+
+def normalize_photo(source):
+    """JPEG bytes of the normalized photo read from a file object or path."""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with Image.open(source) as image:
+        # Let the JPEG decoder skip detail that is scaled away anyway
+        image.draft('RGB', (PHOTO_MAX_EDGE * 2, PHOTO_MAX_EDGE * 2))
+        image = ImageOps.exif_transpose(image)
+        return _encode(_fit(flatten_image(image)))
+
+
+def is_normalized(path):
+    """True for a file the pipeline would leave alone; only the image header is read."""
+    if os.path.getsize(path) > PHOTO_TARGET_BYTES:
+        return False
+    with Image.open(path) as image:
+        width, height = image.size
+        return (
+            image.format == 'JPEG'
+            and not image.info.get('exif')
+            and max(width, height) <= PHOTO_MAX_EDGE
+            # Within rounding of the card frame
+            and abs(width * PHOTO_ASPECT[1] - height * PHOTO_ASPECT[0]) <= max(PHOTO_ASPECT)
+        )
+
+
+def normalize_file(path, force=False):
+    """
+    Normalize a stored photo in place. Returns (path, bytes before, bytes after, error);
+    bytes after is None when the file was already normalized or could not be read.
+    """
+    try:
+        before = os.path.getsize(path)
+        if not force and is_normalized(path):
+            return path, before, None, None
+        data = normalize_photo(path)
+        # Written next to the original and swapped in, so a crash never leaves half a photo
+        part_path = path + '.part'
+        with open(part_path, 'wb') as output:
+            output.write(data)
+        os.replace(part_path, path)
+        return path, before, len(data), None
+    except Exception as e:
+        return path, None, None, str(e)
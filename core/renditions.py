@@ -0,0 +1,81 @@
+"""
+Resized copies of stored photos, generated on first request and cached on disk.
+
+A rendition is keyed by the source's storage name, size and modification time
+plus the rendition size, so a replaced photo gets new renditions (and a new
+ETag) without any bookkeeping. The key doubles as the strong ETag: the same
+key always means the same bytes.
+
+This module must not import models: warm_renditions runs render_file() in
+spawned worker processes.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .photos import flatten_image
+
+# name -> (box width, box height, crop to fill the box instead of fitting inside it)
+RENDITION_SIZES = {
+    'avatar': (150, 150, True),   # list and detail avatars, shown at up to 150px
+    'card': (360, 360, False),    # ID card / profile card, shown at 180px on 2x screens
+    'full': (1200, 1200, False),  # "view" links; still far smaller than a raw scan
+}
+
+RENDITION_QUALITY = 82
+
+
+def rendition_cache_dir():
+    # Outside MEDIA_ROOT so document renditions are only reachable through the view
+    return getattr(settings, 'RENDITION_CACHE_DIR', os.path.join(settings.BASE_DIR, 'rendition_cache'))
+
+
+def rendition_path(cache_dir, name, path, size):
+    """(file path, key) of the rendition of the stored file `name` found at `path`."""
+    stat = os.stat(path)
+    key = hashlib.sha1(f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\0{size}'.encode()).hexdigest()
+    return os.path.join(cache_dir, size, key[:2], f'{key}.jpg'), key
+
+
+def render_file(source_path, dest_path, size):
+    """Write the rendition of an image file. Safe to run for the same file concurrently."""
+    width, height, crop = RENDITION_SIZES[size]
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder skip detail that is scaled away anyway
+        image.draft('RGB', (width, height))
+        image = flatten_image(ImageOps.exif_transpose(image))
+    if crop:
+        image = ImageOps.fit(image, (width, height), method=Image.Resampling.LANCZOS, centering=(0.5, 0.4))
+    else:
+        image.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    # A unique temporary name, so racing requests never hand out a half-written file
+    part_path = f'{dest_path}.{uuid.uuid4().hex}.part'
+    try:
+        image.save(part_path, 'JPEG', quality=RENDITION_QUALITY, optimize=True, progressive=True)
+        os.replace(part_path, dest_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def render_task(task):
+    """render_file((source_path, dest_path, size)) for process pools; returns an error message instead of raising."""
+    source_path, dest_path, size = task
+    try:
+        render_file(source_path, dest_path, size)
+        return None
+    except Exception as e:
+        return f'{source_path} ({size}): {e}'
+
+
+def get_rendition(cache_dir, name, path, size):
+    """(file path, key) of a rendition, generating it first if it is not cached yet."""
+    dest_path, key = rendition_path(cache_dir, name, path, size)
+    if not os.path.exists(dest_path):
+        render_file(path, dest_path, size)
+    return dest_path, key
@@ -0,0 +1,107 @@
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import User, UserSearchToken
+
+# User fields that feed the search index
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email', 'gsezid')
+
+TOKEN_MAX_LENGTH = 150
+
+
+def _is_word_char(ch):
+    # Letters and digits of any script, plus the combining marks (e.g. Devanagari vowel signs) that belong to them
+    return ch.isalnum() or unicodedata.category(ch).startswith('M')
+
+
+def tokenize(value):
+    """
+    Split a value into normalized search tokens: accents on Latin letters stripped,
+    case-folded and broken on anything that is not a letter or digit, in any script.
+    "José.Dsouza@ABC.com" -> ['jose', 'dsouza', 'abc', 'com'], "राज कुमार" -> ['राज', 'कुमार']
+    """
+    if not value:
+        return []
+    chars = []
+    for ch in unicodedata.normalize('NFKD', str(value)):
+        if unicodedata.combining(ch) and chars and chars[-1].isascii():
+            continue
+        chars.append(ch)
+    value = unicodedata.normalize('NFC', ''.join(chars)).casefold()
+    
+    tokens, current = [], []
+    for ch in value + ' ':
+        if _is_word_char(ch):
+            current.append(ch)
+        elif current:
+            tokens.append(''.join(current)[:TOKEN_MAX_LENGTH])
+            current = []
+    return tokens
+
+
+def user_tokens(user):
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(getattr(user, field, None)))
+    return tokens
+
+
+def index_user(user):
+    # Only touch the rows that actually changed
+    wanted = user_tokens(user)
+    existing = set(UserSearchToken.objects.filter(user=user).values_list('token', flat=True))
+    
+    stale = existing - wanted
+    if stale:
+        UserSearchToken.objects.filter(user=user, token__in=stale).delete()
+    
+    missing = wanted - existing
+    if missing:
+        # Not every SQL Server backend supports ignore_conflicts; the diff above already
+        # leaves only new tokens, so it just guards against concurrent saves where available
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user=user, token=token) for token in missing],
+            ignore_conflicts=connection.features.supports_ignore_conflicts
+        )
+
+
+def index_users(user_ids, chunk_size=1000):
+    """
+    Rebuild the tokens for many users with one delete and one bulk insert per chunk.
+    Use after bulk_create / bulk_update / queryset.update() on the search fields,
+    which bypass User.save().
+    """
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        rows = []
+        for values in User.objects.filter(id__in=chunk).values('id', *SEARCH_FIELDS):
+            tokens = set()
+            for field in SEARCH_FIELDS:
+                tokens.update(tokenize(values[field]))
+            rows.extend(UserSearchToken(user_id=values['id'], token=token) for token in tokens)
+        
+        UserSearchToken.objects.filter(user_id__in=chunk).delete()
+        UserSearchToken.objects.bulk_create(rows, batch_size=chunk_size)
+
+
+def search_users(queryset, query):
+    """
+    Narrow a User queryset to users matching every token of the query, each as a
+    prefix of one of their indexed tokens. Each token is a LIKE 'token%' seek on
+    the (token, user) index instead of a scan of the user table. Tokens with a
+    digit may also be any part of the GSEZ ID, so the trailing digits of an ID
+    still find its user.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens and query and query.strip():
+        # Text without a single letter or digit (e.g. "!!!") matches nobody, not everybody
+        return queryset.none()
+    for token in tokens:
+        condition = Q(id__in=UserSearchToken.objects.filter(token__startswith=token).values('user_id'))
+        if any(ch.isdigit() for ch in token):
+            condition |= Q(gsezid__icontains=token)
+        queryset = queryset.filter(condition)
+    return queryset
@@ -0,0 +1,26 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import CardPrint, refresh_card_print_summaries
+
+
+@receiver(pre_save, sender=CardPrint)
+def card_print_saving(sender, instance, **kwargs):
+    # The owner before this save, so a print moved to another user refreshes both
+    instance._previous_user_id = (
+        CardPrint.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+# Keep the card print summary on User in step with every CardPrint change,
+# including Django admin edits and queryset deletes
+@receiver(post_save, sender=CardPrint)
+def card_print_saved(sender, instance, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, '_previous_user_id', None)}
+    refresh_card_print_summaries(user_ids - {None})
+
+
+@receiver(post_delete, sender=CardPrint)
+def card_print_deleted(sender, instance, **kwargs):
+    refresh_card_print_summaries([instance.user_id])
@@ -0,0 +1,37 @@
+from django import template
+from django.urls import reverse
+
+from core import media
+from core.models import User, Document
+from core.renditions import rendition_cache_dir, rendition_path
+
+register = template.Library()
+
+
+@register.filter
+def rendition(obj, size):
+    """
+    URL of a resized copy of a user's profile photo or a document's ID photo:
+    {{ user|rendition:'avatar' }}. Empty when there is no photo.
+    """
+    if isinstance(obj, User) and obj.profile_photo:
+        field_file, url = obj.profile_photo, reverse('photo_rendition', args=['profile', obj.pk, size])
+    elif isinstance(obj, Document) and obj.govt_id_photo:
+        field_file, url = obj.govt_id_photo, reverse('photo_rendition', args=['document', obj.pk, size])
+    else:
+        return ''
+    # The rendition key as ?v= lets photo_rendition mark the response immutable
+    try:
+        _, key = rendition_path(rendition_cache_dir(), field_file.name, field_file.path, size)
+    except OSError:
+        return url
+    return f'{url}?v={key}'
+
+
+@register.filter
+def media_url(field_file):
+    """
+    Versioned URL of an original upload, cached by browsers until the file changes:
+    {{ document.govt_id_photo|media_url }}. Empty when there is no file.
+    """
+    return media.media_url(field_file) if field_file else ''
@@ -1,3 +1,646 @@
-from django.test import TestCase
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from unittest import mock
+import zipfile
+from datetime import date
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .models import (
+    User, Company, CardPrint, Document, ExportJob, GsezIdSequence, GsezIdPool, sharded_path,
+    generate_gsezid, gsezid_prefix, peek_gsezid, reserve_gsezids, release_gsezids
+)
+from .search import search_users
+from .pagination import paginate_by_cursor
+from .imports import UserImport, DocumentImport, CompanyImport
+from .export_jobs import claim_next_job, run_job
+
+
+def _generate_in_thread(results, count):
+    try:
+        for _ in range(count):
+            results.append(generate_gsezid())
+    finally:
+        connections.close_all()
+
+
+def _generate_in_process(queue, count):
+    # Never share the parent's database connection with a forked child
+    connections.close_all()
+    try:
+        queue.put([generate_gsezid() for _ in range(count)])
+    finally:
+        connections.close_all()
+
+
+class GsezIdSequenceTests(TestCase):
+    def test_ids_are_sequential(self):
+        prefix = gsezid_prefix()
+        self.assertEqual(generate_gsezid(), f'{prefix}001')
+        self.assertEqual(generate_gsezid(), f'{prefix}002')
+        self.assertEqual(GsezIdSequence.objects.get(prefix=prefix).last_value, 2)
+
+    def test_sequence_continues_after_existing_ids(self):
+        prefix = gsezid_prefix()
+        User.objects.create(username='legacy', gsezid=f'{prefix}041')
+        self.assertEqual(generate_gsezid(), f'{prefix}042')
+
+    def test_peek_does_not_claim(self):
+        preview = peek_gsezid()
+        self.assertEqual(peek_gsezid(), preview)
+        self.assertEqual(generate_gsezid(), preview)
+
+
+class GsezIdReservationTests(TestCase):
+    def test_reserve_claims_contiguous_block(self):
+        prefix = gsezid_prefix()
+        self.assertEqual(reserve_gsezids(3), [f'{prefix}001', f'{prefix}002', f'{prefix}003'])
+        self.assertEqual(generate_gsezid(), f'{prefix}004')
+
+    def test_release_returns_unused_tail(self):
+        prefix = gsezid_prefix()
+        block = reserve_gsezids(5)
+        self.assertEqual(release_gsezids(block[2:]), 3)
+        self.assertEqual(generate_gsezid(), f'{prefix}003')
+
+    def test_release_after_later_allocation_leaves_gap(self):
+        prefix = gsezid_prefix()
+        block = reserve_gsezids(5)
+        generate_gsezid()
+        self.assertEqual(release_gsezids(block[2:]), 0)
+        self.assertEqual(generate_gsezid(), f'{prefix}007')
+
+    def test_pool_reuses_put_back_ids(self):
+        prefix = gsezid_prefix()
+        pool = GsezIdPool()
+        first = pool.next()
+        pool.put_back(first)
+        self.assertEqual(pool.next(), first)
+        self.assertEqual(pool.next(), f'{prefix}002')
+        pool.release()
+        self.assertEqual(generate_gsezid(), f'{prefix}003')
+
+    def _last_value(self):
+        return GsezIdSequence.objects.get(prefix=gsezid_prefix()).last_value
+
+    def test_pool_blocks_start_small_and_grow(self):
+        pool = GsezIdPool(max_block=8, first_block=2)
+        pool.next()
+        self.assertEqual(self._last_value(), 2)
+        for _ in range(2):
+            pool.next()
+        self.assertEqual(self._last_value(), 2 + 4)
+        for _ in range(4 + 1):
+            pool.next()
+        self.assertEqual(self._last_value(), 2 + 4 + 8)
+        # Eight were handed out; the rest of the block goes back
+        pool.release()
+        self.assertEqual(self._last_value(), 8)
+
+    def test_reservations_stop_at_the_last_three_digit_id(self):
+        prefix = gsezid_prefix()
+        GsezIdSequence.objects.create(prefix=prefix, last_value=997)
+        self.assertEqual(reserve_gsezids(5), [f'{prefix}998', f'{prefix}999'])
+        self.assertEqual(reserve_gsezids(1), [])
+        self.assertEqual(self._last_value(), 999)
+        with self.assertRaises(ValueError):
+            GsezIdPool().next()
+        self.assertEqual(self._last_value(), 999)
+
+
+class GsezIdConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    PROCESSES = 4
+    PER_WORKER = 25
+
+    def test_threads_never_share_an_id(self):
+        results = []
+        threads = [
+            threading.Thread(target=_generate_in_thread, args=(results, self.PER_WORKER))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.THREADS * self.PER_WORKER)
+        self.assertEqual(len(set(results)), len(results))
+
+    @unittest.skipIf(connection.vendor == 'sqlite', 'in-memory SQLite is not shared between processes')
+    def test_processes_never_share_an_id(self):
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_generate_in_process, args=(queue, self.PER_WORKER))
+            for _ in range(self.PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        results = []
+        for _ in processes:
+            results.extend(queue.get(timeout=60))
+        for process in processes:
+            process.join()
+
+        self.assertEqual(len(results), self.PROCESSES * self.PER_WORKER)
+        self.assertEqual(len(set(results)), len(results))
+
+
+class CardPrintSummaryTests(TestCase):
+    def setUp(self):
+        self.first = User.objects.create_user(username='print-first')
+        self.second = User.objects.create_user(username='print-second')
+
+    def test_reassigned_print_refreshes_both_users(self):
+        card_print = CardPrint.objects.create(user=self.first, gsezid='print-first', remarks='printed')
+        card_print.user = self.second
+        card_print.save()
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.card_print_count, self.first.last_card_print_remarks), (0, None))
+        self.assertEqual((self.second.card_print_count, self.second.last_card_print_remarks), (1, 'printed'))
+
+    def test_saving_a_stale_instance_keeps_the_summary(self):
+        stale = User.objects.get(pk=self.first.pk)
+        CardPrint.objects.create(user=self.first, gsezid='print-first', remarks='printed')
+        stale.first_name = 'Edited'
+        stale.save()
+        fresh = User.objects.get(pk=self.first.pk)
+        self.assertEqual(fresh.first_name, 'Edited')
+        self.assertEqual((fresh.card_print_count, fresh.last_card_print_remarks), (1, 'printed'))
+
+
+class UserExportQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='export-admin', password='secret', user_type='admin')
+        self.company = Company.objects.create(company_name='Export Co')
+        self.client.force_login(self.admin)
+
+    def _add_users(self, count):
+        for number in range(count):
+            user = User.objects.create_user(
+                username=f'export-{User.objects.count()}-{number}',
+                user_type='user',
+                current_employer_company=self.company
+            )
+            CardPrint.objects.create(user=user, gsezid=user.username, remarks='printed')
+            CardPrint.objects.create(user=user, gsezid=user.username, remarks='reprinted')
+
+    def _export(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin_export_users'), {'export_format': 'csv'})
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return len(queries), content.splitlines()
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self._add_users(1)
+        few_queries, few_lines = self._export()
+        self._add_users(20)
+        many_queries, many_lines = self._export()
+
+        self.assertEqual(len(few_lines), 2)
+        self.assertEqual(len(many_lines), 22)
+        self.assertEqual(many_queries, few_queries)
+
+    def test_export_includes_company_and_card_print_summary(self):
+        self._add_users(1)
+        queries, lines = self._export()
+        self.assertIn('Export Co', lines[1])
+        self.assertTrue(lines[1].endswith(',2'))
+
+
+@override_settings(EXPORT_JOB_SPAWN_WORKER=False)
+class ExportJobTests(TestCase):
+    def setUp(self):
+        Company.objects.create(company_name='Queued Co')
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _claimed_job(self):
+        ExportJob.objects.create(kind='companies', export_format='csv')
+        return claim_next_job()
+
+    def _files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_claimed_job_stores_its_artifact(self):
+        job = self._claimed_job()
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.rows_total, job.rows_done), (1, 1))
+        with job.file.open('rb') as artifact:
+            self.assertIn(b'Queued Co', artifact.read())
+        self.assertEqual(self._files(), ['companies.csv'])
+
+    def test_worker_that_lost_its_claim_leaves_the_job_alone(self):
+        job = self._claimed_job()
+        # Requeued as stale and taken by another worker meanwhile
+        ExportJob.objects.filter(id=job.id).update(claim=uuid.uuid4())
+        run_job(job)
+        current = ExportJob.objects.get(id=job.id)
+        self.assertEqual(current.status, 'running')
+        self.assertFalse(current.file)
+        self.assertEqual(self._files(), [])
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='jose-d', first_name='José', last_name='Dsouza', user_type='user')
+        User.objects.create_user(username='raj-k', first_name='राज', last_name='कुमार', user_type='user')
+
+    def _search(self, query):
+        return set(search_users(User.objects.all(), query).values_list('username', flat=True))
+
+    def test_accents_and_case_are_ignored(self):
+        self.assertEqual(self._search('JOSE dsou'), {'jose-d'})
+        self.assertEqual(self._search('José'), {'jose-d'})
+
+    def test_non_latin_names_are_indexed(self):
+        self.assertEqual(self._search('राज'), {'raj-k'})
+        self.assertEqual(self._search('कुमा'), {'raj-k'})
+
+    def test_trailing_digits_of_a_gsezid_find_its_user(self):
+        User.objects.create_user(username='id-holder', gsezid='ZIS241018042', user_type='user')
+        self.assertEqual(self._search('042'), {'id-holder'})
+        self.assertEqual(self._search('zis2410'), {'id-holder'})
+
+    def test_query_without_tokens_matches_nobody(self):
+        self.assertEqual(self._search('!!! ...'), set())
+
+    def test_blank_query_leaves_queryset_unfiltered(self):
+        self.assertEqual(self._search(''), {'jose-d', 'raj-k'})
+
+
+class CursorPaginationTests(TestCase):
+    # username is unique and NOT NULL, so middle_name stands in for a sort key with NULLs and duplicates
+    MIDDLE_NAMES = [None, 'b', 'a', None, 'a', 'c', 'a', None, 'b', 'a', None]
+    PER_PAGE = 3
+
+    def setUp(self):
+        for number, middle_name in enumerate(self.MIDDLE_NAMES):
+            User.objects.create_user(username=f'page-{number:02d}', middle_name=middle_name, user_type='user')
+        self.queryset = User.objects.filter(username__startswith='page-')
+
+    def _expected(self, descending):
+        users = sorted(self.queryset, key=lambda user: user.pk)
+        named = sorted((user for user in users if user.middle_name is not None),
+                       key=lambda user: user.middle_name, reverse=descending)
+        nulls = [user for user in users if user.middle_name is None]
+        # NULL sorts first ascending and last descending; ties are broken by id ascending
+        return [user.pk for user in (named + nulls if descending else nulls + named)]
+
+    def _page(self, ordering, cursor):
+        return paginate_by_cursor(self.queryset, ordering, cursor, self.PER_PAGE, exact_count=True)
+
+    def _walk_forward(self, ordering):
+        pages, page = [], self._page(ordering, None)
+        while True:
+            pages.append([user.pk for user in page])
+            if not page.has_next:
+                return pages
+            page = self._page(ordering, page.next_cursor)
+
+    def _walk_backward(self, ordering):
+        pages, page = [], self._page(ordering, self._page(ordering, None).last_cursor)
+        while True:
+            pages.insert(0, [user.pk for user in page])
+            if not page.has_previous:
+                return pages
+            page = self._page(ordering, page.previous_cursor)
+
+    def test_forward_walk_visits_every_row_once_in_order(self):
+        for ordering, descending in ((['middle_name', 'id'], False), (['-middle_name', 'id'], True)):
+            with self.subTest(ordering=ordering):
+                pages = self._walk_forward(ordering)
+                self.assertEqual(sum(pages, []), self._expected(descending))
+                self.assertTrue(all(len(page) == self.PER_PAGE for page in pages[:-1]))
+
+    def test_backward_walk_from_last_page_visits_every_row_once_in_order(self):
+        for ordering, descending in ((['middle_name', 'id'], False), (['-middle_name', 'id'], True)):
+            with self.subTest(ordering=ordering):
+                pages = self._walk_backward(ordering)
+                self.assertEqual(sum(pages, []), self._expected(descending))
+                # Walking back from the end fills the last page and leaves the remainder on the first
+                self.assertTrue(all(len(page) == self.PER_PAGE for page in pages[1:]))
+
+    def test_previous_from_a_later_page_returns_the_page_before(self):
+        ordering = ['middle_name', 'id']
+        first = self._page(ordering, None)
+        second = self._page(ordering, first.next_cursor)
+        third = self._page(ordering, second.next_cursor)
+        back = self._page(ordering, third.previous_cursor)
+        self.assertEqual([user.pk for user in back], [user.pk for user in second])
+        self.assertTrue(back.has_next and back.has_previous)
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        ordering = ['middle_name', 'id']
+        page = self._page(ordering, 'not-a-cursor')
+        self.assertEqual([user.pk for user in page], self._expected(False)[:self.PER_PAGE])
+        self.assertFalse(page.has_previous)
+
+
+def _import(importer, rows):
+    # Data rows start on file row 3, after the header and the instructions row
+    for row_num, row in enumerate(rows, start=3):
+        importer.add_row(row_num, row)
+    importer.finish()
+    return importer
+
+
+def _skipped_rows(importer):
+    return [row_num for row_num, _, skipped in importer.messages if skipped]
+
+
+class UserImportTests(TestCase):
+    def test_collisions_within_a_batch_are_rejected(self):
+        importer = _import(UserImport(['username', 'gsezid']), [
+            ['alice', 'G-ALICE'],
+            ['alice', 'G-OTHER'],  # username already used by row 3
+            ['bob', 'G-ALICE'],    # GSEZ ID already used by row 3
+        ])
+        self.assertEqual(importer.success_count, 1)
+        self.assertEqual(importer.error_count, 2)
+        self.assertEqual(_skipped_rows(importer), [4, 5])
+        self.assertEqual(User.objects.get(username='alice').gsezid, 'G-ALICE')
+        self.assertFalse(User.objects.filter(username='bob').exists())
+
+    def test_collisions_with_existing_users_are_rejected(self):
+        User.objects.create_user(username='carol', gsezid='G-CAROL')
+        importer = _import(UserImport(['username', 'gsezid']), [
+            ['carol', 'G-NEW'],
+            ['dave', 'G-CAROL'],
+            ['erin', 'G-ERIN'],
+        ])
+        self.assertEqual(importer.success_count, 1)
+        self.assertEqual(_skipped_rows(importer), [3, 4])
+
+    def test_rejected_row_gives_its_generated_gsezid_to_the_next_row(self):
+        User.objects.create_user(username='taken', gsezid='G-TAKEN')
+        expected = peek_gsezid()
+        # batch_size=1 writes every row on its own, so row 4 is parsed after row 3 was rejected
+        importer = _import(UserImport(['username', 'gsezid', 'first_name'], batch_size=1), [
+            ['', 'G-TAKEN', 'Rejected'],  # gets a generated username, then fails on its GSEZ ID
+            ['', '', 'Next'],
+        ])
+        self.assertEqual(_skipped_rows(importer), [3])
+        created = User.objects.get(gsezid=expected)
+        self.assertEqual(created.username, expected)
+        self.assertEqual(created.first_name, 'Next')
+        # No gap is left in the sequence
+        self.assertGreater(peek_gsezid(), expected)
+        self.assertEqual(User.objects.filter(username__startswith=expected[:9]).count(), 1)
+
+    def test_failed_bulk_insert_is_retried_row_by_row(self):
+        User.objects.create_user(username='dup', gsezid='G-DUP')
+        importer = UserImport(['username', 'gsezid'])
+        fresh = User(username='fresh', gsezid='G-FRESH')
+        # A collision the batch pre-check did not see, e.g. a concurrent insert
+        late = User(username='dup', gsezid='G-LATE')
+        for user in (fresh, late):
+            user.set_unusable_password()
+        try:
+            importer.write([(3, fresh), (4, late)])
+        finally:
+            importer.close()
+        self.assertEqual(importer.success_count, 1)
+        self.assertEqual(_skipped_rows(importer), [4])
+        self.assertTrue(User.objects.filter(username='fresh').exists())
+        self.assertFalse(User.objects.filter(gsezid='G-LATE').exists())
+
+    def test_one_month_first_date_does_not_flip_the_column(self):
+        importer = _import(UserImport(['username', 'date_of_birth']), [
+            ['us-style', '12/31/1990'],
+            ['ambiguous', '05/06/1990'],
+        ])
+        self.assertEqual(importer.success_count, 2)
+        self.assertEqual(User.objects.get(username='us-style').date_of_birth, date(1990, 12, 31))
+        self.assertEqual(User.objects.get(username='ambiguous').date_of_birth, date(1990, 6, 5))
+        self.assertEqual([row_num for row_num, _, _ in importer.messages], [4])
+
+    def test_month_first_column_reads_ambiguous_dates_month_first(self):
+        importer = _import(UserImport(['username', 'date_of_birth']), [
+            ['us-1', '12/31/1990'],
+            ['us-2', '01/13/1991'],
+            ['us-3', '02/14/1992'],
+            ['ambiguous', '05/06/1990'],
+        ])
+        self.assertEqual(User.objects.get(username='ambiguous').date_of_birth, date(1990, 5, 6))
+        self.assertEqual([row_num for row_num, _, _ in importer.messages], [6])
+
+    def test_update_existing_writes_only_changed_filled_in_columns(self):
+        changed = User.objects.create_user(
+            username='old-name', password='keep-me', gsezid='G-UPD', first_name='Old', last_name='Same',
+            nationality='Indian', is_verified=True
+        )
+        User.objects.create_user(username='same', gsezid='G-SAME', first_name='Same', is_verified=True)
+        headers = ['username', 'password', 'gsezid', 'first_name', 'last_name', 'nationality', 'is_verified']
+        importer = _import(UserImport(headers, update_existing=True), [
+            ['new-name', 'other-password', 'G-UPD', 'New', 'Same', '', ''],
+            ['same', '', 'G-SAME', 'Same', '', '', '1'],
+            ['new-user', '', 'G-NEWUSER', 'Fresh', '', '', ''],
+        ])
+        self.assertEqual((importer.updated_count, importer.unchanged_count, importer.success_count), (1, 1, 1))
+        self.assertEqual(importer.error_count, 0)
+
+        changed.refresh_from_db()
+        self.assertEqual(changed.first_name, 'New')
+        # Blank cells, the password and the identifying columns are left alone
+        self.assertEqual(changed.nationality, 'Indian')
+        self.assertTrue(changed.is_verified)
+        self.assertEqual(changed.username, 'old-name')
+        self.assertTrue(changed.check_password('keep-me'))
+        self.assertTrue(User.objects.filter(username='new-user', gsezid='G-NEWUSER').exists())
+
+    def test_update_existing_rejects_a_user_listed_twice(self):
+        User.objects.create_user(username='twice', gsezid='G-TWICE')
+        importer = _import(UserImport(['gsezid', 'first_name'], update_existing=True), [
+            ['G-TWICE', 'First'],
+            ['G-TWICE', 'Second'],
+        ])
+        self.assertEqual(importer.updated_count, 1)
+        self.assertEqual(_skipped_rows(importer), [4])
+        self.assertEqual(User.objects.get(gsezid='G-TWICE').first_name, 'First')
+
+
+class DocumentImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='doc-user', gsezid='G-DOC')
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _archive(self, names):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name in names:
+                archive.writestr(name, b'not really a photo')
+        buffer.seek(0)
+        return zipfile.ZipFile(buffer)
+
+    def test_photos_match_on_path_or_file_name(self):
+        archive = self._archive(['scans/a.jpg', 'nested/dir/B.JPG', 'c.jpg', 'notes.txt', '__MACOSX/scans/._a.jpg'])
+        importer = DocumentImport(['Username', 'Govt ID Number', 'Photo'], archive, dry_run=True)
+        for row_num, row in enumerate([
+            ['doc-user', 'ID-1', 'scans/a.jpg'],       # full path
+            ['doc-user', 'ID-2', 'b.jpg'],             # file name only, any case
+            ['doc-user', 'ID-3', 'C:\\photos\\c.jpg'],  # Windows path from the manifest's machine
+            ['doc-user', 'ID-4', 'missing.jpg'],
+            ['doc-user', 'ID-5', 'notes.txt'],
+            ['nobody', 'ID-6', 'c.jpg'],
+        ], start=2):
+            importer.add_row(row_num, row)
+        importer.flush()
+        self.assertEqual(importer.success_count, 3)
+        self.assertEqual(_skipped_rows(importer), [5, 6, 7])
+        self.assertFalse(Document.objects.exists())
+
+    def test_repeated_upload_skips_existing_documents(self):
+        rows = [['doc-user', 'ID-1', 'a.jpg'], ['doc-user', 'ID-1', 'a.jpg']]
+        for _ in range(2):
+            importer = DocumentImport(['username', 'govt_id_number', 'photo'], self._archive(['a.jpg']))
+            for row_num, row in enumerate(rows, start=2):
+                importer.add_row(row_num, row)
+            importer.flush()
+        # The second upload only finds rows that already exist
+        self.assertEqual((importer.success_count, importer.error_count), (0, 2))
+        document = Document.objects.get()
+        self.assertEqual(document.user, self.user)
+        self.assertTrue(document.govt_id_photo.storage.exists(document.govt_id_photo.name))
+
+
+class CompanyImportTests(TestCase):
+    def test_counts_created_duplicate_and_invalid_names(self):
+        Company.objects.create(company_name='ACME Ltd')
+        max_length = Company._meta.get_field('company_name').max_length
+        importer = CompanyImport(batch_size=1)
+        for row_num, row in enumerate([
+            ['  acme   LTD '],          # already in the database
+            ['New Co'],
+            ['new  co'],                # repeated in the file
+            ['Other Co'],
+            ['   '],                    # blank row, ignored
+            ['', 'a note'],             # no name
+            ['x' * (max_length + 1)],   # too long
+        ], start=2):
+            importer.add_row(row_num, row)
+        importer.finish()
+        self.assertEqual(
+            (importer.created_count, importer.duplicate_count, importer.invalid_count), (2, 2, 2)
+        )
+        self.assertEqual(
+            sorted(Company.objects.values_list('company_name', flat=True)), ['ACME Ltd', 'New Co', 'Other Co']
+        )
+
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 40), color).save(buffer, 'JPEG')
+    return ContentFile(buffer.getvalue(), name='upload.jpg')
+
+
+class ProfilePhotoSaveTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _files(self):
+        return sorted(name for _, _, names in os.walk(self.media_root) for name in names)
+
+    def _read(self, name):
+        with open(os.path.join(self.media_root, name), 'rb') as stored:
+            return stored.read()
+
+    def test_new_photo_replaces_the_gsezid_file(self):
+        user = User.objects.create_user(username='photo-user', gsezid='G-PHOTO')
+        user.profile_photo.save('a.jpg', _jpeg('red'))
+        first_name, first = user.profile_photo.name, self._read(user.profile_photo.name)
+        user.profile_photo.save('b.jpg', _jpeg('blue'))
+        self.assertEqual(user.profile_photo.name, first_name)
+        self.assertNotEqual(self._read(first_name), first)
+        self.assertEqual(User.objects.get(pk=user.pk).profile_photo.name, first_name)
+        self.assertEqual(self._files(), ['G-PHOTO.jpg'])
+
+    def test_failed_write_keeps_the_old_photo(self):
+        user = User.objects.create_user(username='photo-user', gsezid='G-PHOTO')
+        user.profile_photo.save('a.jpg', _jpeg('red'))
+        name, before = user.profile_photo.name, self._read(user.profile_photo.name)
+        storage = user.profile_photo.storage
+        with mock.patch.object(type(storage), '_save', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                user.profile_photo.save('b.jpg', _jpeg('blue'))
+        self.assertEqual(self._read(name), before)
+
+    def test_name_not_taken_from_a_gsezid_is_never_overwritten(self):
+        user = User.objects.create_user(username='shared')
+        other = sharded_path('profile_photos', 'shared.jpg')
+        os.makedirs(os.path.dirname(os.path.join(self.media_root, other)), exist_ok=True)
+        with open(os.path.join(self.media_root, other), 'wb') as output:
+            output.write(b'someone else')
+        user.profile_photo.save('a.jpg', _jpeg('red'))
+        self.assertNotEqual(os.path.normpath(user.profile_photo.name), os.path.normpath(other))
+        self.assertEqual(self._read(other), b'someone else')
+
+
+class ShardMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = User.objects.create_user(username='shard-user', gsezid='G-SHARD')
+        # Two flat scans as the old upload_to='documents/' stored them, and a newer upload
+        # already holding the sharded name of the first, so that one moves to a suffixed name
+        self.flat = ['documents/scan.jpg', 'documents/other.jpg']
+        for number, name in enumerate(self.flat + [sharded_path('documents', 'scan.jpg')]):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as output:
+                output.write(b'scan')
+            Document.objects.create(user=user, govt_id_number=f'ID-{number}', govt_id_photo=name)
+
+    def _run(self, *args):
+        output = io.StringIO()
+        call_command('shard_media', '--only', 'documents', *args, stdout=output, stderr=io.StringIO())
+        return output.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('documents: 2 would be moved, 1 already sharded', self._run('--dry-run'))
+        for name in self.flat:
+            self.assertTrue(Document.objects.filter(govt_id_photo=name).exists())
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+
+    def test_moved_files_are_settled_on_the_next_run(self):
+        self.assertIn('documents: 2 moved, 1 already sharded', self._run())
+        names = list(Document.objects.values_list('govt_id_photo', flat=True))
+        self.assertEqual(len(set(names)), 3)
+        for name in names:
+            self.assertRegex(name, r'^documents/[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        # The suffixed name counts as done, so later runs find nothing to move
+        self.assertIn('documents: 0 would be moved, 3 already sharded', self._run('--dry-run'))
+        self.assertIn('documents: 0 moved, 3 already sharded', self._run())
@@ -1,4 +1,5 @@
 from django.urls import path
+from django.conf import settings
 from . import views
 
 urlpatterns = [
@@ -36,6 +37,13 @@ urlpatterns = [
     path('admin/export/users/fields/', views.admin_export_fields_selection, name='admin_export_fields_selection'),
     path('admin/export/users/template/', views.admin_export_users_template, name='admin_export_users_template'),
     path('admin/export/companies/', views.admin_export_companies, name='admin_export_companies'),
+    path('admin/exports/', views.admin_export_jobs, name='admin_export_jobs'),
+    path('admin/exports/<int:job_id>/status/', views.admin_export_job_status, name='admin_export_job_status'),
+    path('admin/exports/<int:job_id>/download/', views.admin_export_job_download, name='admin_export_job_download'),
+    path('admin/imports/', views.admin_import_jobs, name='admin_import_jobs'),
+    path('admin/imports/<int:job_id>/status/', views.admin_import_job_status, name='admin_import_job_status'),
+    path('admin/imports/<int:job_id>/resume/', views.admin_import_job_resume, name='admin_import_job_resume'),
+    path('admin/imports/<int:job_id>/errors/', views.admin_import_job_errors, name='admin_import_job_errors'),
     path('admin/import/companies/', views.admin_import_companies, name='admin_import_companies'),
     path('admin/users/import/', views.admin_import_users, name='admin_import_users'),
     
@@ -64,10 +72,17 @@ urlpatterns = [
     
     # API URLs
     path('api/company-suggestions/', views.company_suggestions, name='company_suggestions'),
+    path('api/photo-capture/', views.photo_capture_upload, name='photo_capture_upload'),
     
     # ID Card URL (accessible via QR code)
     path('IDCARD/<str:gsezid>/', views.idcard_view, name='idcard'),
     
+    # Resized profile / document photos
+    path('photos/<str:kind>/<int:pk>/<str:size>.jpg', views.photo_rendition, name='photo_rendition'),
+    
+    # Uploaded files, permission-checked and handed to the front proxy when configured
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:name>", views.serve_media, name='serve_media'),
+    
     # Default URL (home page)
     path('', views.home_view, name='home'),
 ] 
\ No newline at end of file
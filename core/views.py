@@ -1,13 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from functools import wraps
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.urls import reverse_lazy
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.conf import settings
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef
+from django.db import transaction
 import json
 import qrcode
 from io import BytesIO
@@ -24,10 +27,28 @@ import os
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
+from django.utils._os import safe_join
+from django.core.exceptions import SuspiciousFileOperation
 import uuid
-import base64
+import zipfile
 
-from .models import User, Company, Document, generate_gsezid, CardPrint
+from .models import (
+    User, Company, Document, CardPrint, ExportJob, ImportJob,
+    peek_gsezid, is_generated_gsezid
+)
+from .search import search_users
+from .pagination import paginate_by_cursor
+from .exports import (
+    EXPORT_FORMATS, DEFAULT_EXPORT_FORMAT,
+    user_export, user_export_params, document_export, company_export, export_response
+)
+from .export_jobs import submit_export_job
+from .import_jobs import submit_import_job, resume_job, record_dry_run
+from .imports import UserImport, DocumentImport, CompanyImport, upload_rows, is_supported_upload
+from .columns import export_column_groups, import_fields, TEMPLATE_COLUMNS
+from .renditions import RENDITION_SIZES, rendition_cache_dir, get_rendition
+from .captures import store_capture, take_capture, purge_captures
+from .media import serve_file, accel_url, file_etag, CACHE_IMMUTABLE
 from .forms import (
     UserRegistrationForm, UserProfileForm, DocumentForm, 
     CompanyForm, UserManagementForm, CustomAuthenticationForm,
@@ -94,10 +115,7 @@ def simple_register_view(request):
                 user.nationality = 'Not Specified'
                 user.current_address = 'Not Provided'
                 
-                # Use the new GSEZ ID format
-                user.gsezid = generate_gsezid()
-                
-                # Set the QR code URL
+                # Set the QR code URL (the GSEZ ID was allocated by the form)
                 user.qr_code = f"http://207.180.234.113/IDCARD/{user.gsezid}"
                 
                 # Save user
@@ -266,34 +284,6 @@ def user_profile_edit(request):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         
-        # Check if we have a camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
-        if camera_capture_data and camera_capture_data.startswith('data:image'):
-            try:
-                # Process the base64 image data
-                format, imgstr = camera_capture_data.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Convert base64 to file
-                import base64
-                from django.core.files.base import ContentFile
-                
-                # Create a ContentFile from the decoded base64 data
-                filename = f"{request.user.gsezid}.{ext}" if request.user.gsezid else f"user_{request.user.id}.{ext}"
-                data = ContentFile(base64.b64decode(imgstr), name=filename)
-                
-                # Assign the file to the user's profile_photo field
-                request.user.profile_photo.save(filename, data, save=False)
-                
-                # Set the profile_full_link field with .jpg extension
-                request.user.profile_full_link = f"http://207.108.234.113:83/{request.user.gsezid}.jpg"
-                
-            except Exception as e:
-                print(f"Error processing camera capture data: {e}")
-        elif 'profile_photo' in request.FILES:
-            # If a profile photo was uploaded via the form, set the profile_full_link with .jpg extension
-            request.user.profile_full_link = f"http://207.108.234.113:83/{request.user.gsezid}.jpg"
-        
         # Check for deleted items
         deleted_contacts = request.POST.getlist('deleted_contacts[]', [])
         deleted_family_members = request.POST.getlist('deleted_family_members[]', [])
@@ -321,6 +311,12 @@ def user_profile_edit(request):
         if form.is_valid():
             user = form.save(commit=False)
             
+            # A camera capture is uploaded ahead of the form and referenced by token; it is
+            # only taken once the form is accepted, so a rejected post keeps the stored photo
+            if take_capture(request.POST.get('camera_capture_token'), request.user, user) or 'profile_photo' in request.FILES:
+                # A new profile photo was captured or uploaded: set the profile_full_link with .jpg extension
+                user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
+            
             # Process emergency contacts
             if deleted_contacts:
                 updated_contacts = []
@@ -405,6 +401,86 @@ def idcard_view(request, gsezid):
     except User.DoesNotExist:
         return render(request, 'core/user/idcard_not_found.html', {'gsezid': gsezid})
 
+def can_view_govt_id_photo(user, document):
+    # Government ID scans and their renditions: admins and the user they belong to only
+    return user.is_authenticated and (is_admin(user) or document.user_id == user.id)
+
+def photo_rendition(request, kind, pk, size):
+    """
+    Resized copy of a profile photo or document photo, generated on first request.
+    Profile photos are public like the ID card page that shows them; document
+    photos follow can_view_govt_id_photo, as the originals in serve_media do.
+    """
+    if size not in RENDITION_SIZES:
+        raise Http404
+    if kind == 'profile':
+        field_file = get_object_or_404(User, pk=pk).profile_photo
+    elif kind == 'document':
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        document = get_object_or_404(Document, pk=pk)
+        if not can_view_govt_id_photo(request.user, document):
+            raise Http404
+        field_file = document.govt_id_photo
+    else:
+        raise Http404
+    if not field_file or not field_file.storage.exists(field_file.name):
+        raise Http404
+    
+    cache_dir = rendition_cache_dir()
+    try:
+        path, key = get_rendition(cache_dir, field_file.name, field_file.path, size)
+    except OSError:
+        # Not an image Pillow can read
+        raise Http404
+    
+    # URLs from the rendition filter carry the key and never change content; others
+    # are revalidated every time and get an empty 304 while the photo is unchanged
+    scope = 'public' if kind == 'profile' else 'private'
+    if request.GET.get('v') == key:
+        cache_control = f'{scope}, {CACHE_IMMUTABLE}'
+    else:
+        cache_control = f'{scope}, no-cache'
+    return serve_file(
+        request, path, cache_control, etag=f'"{key}"', content_type='image/jpeg',
+        accel=accel_url(getattr(settings, 'RENDITION_ACCEL_PREFIX', '/protected-renditions/'), os.path.relpath(path, cache_dir))
+    )
+
+def serve_media(request, name):
+    """
+    Files under MEDIA_ROOT. Profile photos are public like the ID card page; document
+    scans follow can_view_govt_id_photo; exports and import uploads are for admins only.
+    A URL carrying the file's current ETag as ?v= (see the media_url filter) is cached
+    for a year, anything else is revalidated.
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    # Checked on the resolved path, so "profile_photos/../documents/..." is not public
+    name = os.path.relpath(path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    public = name.startswith('profile_photos/')
+    if not public:
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not is_admin(request.user):
+            document = Document.objects.filter(govt_id_photo=name).first() if name.startswith('documents/') else None
+            if document is None or not can_view_govt_id_photo(request.user, document):
+                raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+    
+    scope = 'public' if public else 'private'
+    version = request.GET.get('v')
+    if version and f'"{version}"' == file_etag(os.stat(path)):
+        cache_control = f'{scope}, {CACHE_IMMUTABLE}'
+    else:
+        cache_control = f'{scope}, no-cache'
+    return serve_file(
+        request, path, cache_control,
+        accel=accel_url(getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/'), name)
+    )
+
 @login_required
 @user_passes_test(is_regular_user)
 def user_job_opportunities(request):
@@ -522,28 +598,17 @@ def admin_manage_users(request):
             # Convert string to date object
             filter_date = datetime.strptime(card_print_date, '%Y-%m-%d').date()
             
-            # Get user IDs with matching card print date
-            card_print_user_ids = CardPrint.objects.filter(
-                card_print_date=filter_date
-            ).values_list('user_id', flat=True).distinct()
-            
-            # Filter users by these IDs
-            users = users.filter(id__in=card_print_user_ids)
+            # Keep users with a card print on that date (correlated EXISTS on the date index)
+            users = users.filter(Exists(
+                CardPrint.objects.filter(user=OuterRef('pk'), card_print_date=filter_date)
+            ))
         except (ValueError, TypeError):
             # If date format is invalid, ignore this filter
             pass
         
     if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(gsezid__icontains=search_query)
-        )
-    
-    # Order users by username
-    users = users.order_by('username')
+        # Prefix match on the search index (username, name, email, GSEZ ID)
+        users = search_users(users, search_query)
     
     # Handle batch actions
     if request.method == 'POST':
@@ -602,16 +667,11 @@ def admin_manage_users(request):
     # Get available status choices for filtering
     status_choices = dict(User.STATUS_CHOICES)
     
-    # Pagination
-    paginator = Paginator(users, int(items_per_page))
-    page = request.GET.get('page', 1)
-    
-    try:
-        users_page = paginator.page(page)
-    except PageNotAnInteger:
-        users_page = paginator.page(1)
-    except EmptyPage:
-        users_page = paginator.page(paginator.num_pages)
+    # Keyset pagination ordered by username; the total is estimated unless ?count=exact
+    users_page = paginate_by_cursor(
+        users, ['username', 'id'], request.GET.get('cursor'), int(items_per_page),
+        exact_count=request.GET.get('count') == 'exact'
+    )
     
     return render(request, 'core/admin/manage_users.html', {
         'users': users_page,
@@ -622,9 +682,8 @@ def admin_manage_users(request):
         'current_search': search_query,
         'current_card_print_date': card_print_date,
         'items_per_page': items_per_page,
-        'total_users': users.count(),
-        'page_obj': users_page,
-        'paginator': paginator
+        'total_users': users_page.count_label,
+        'page_obj': users_page
     })
 
 @login_required
@@ -668,34 +727,6 @@ def admin_edit_user(request, user_id):
     if request.method == 'POST':
         form = AdminUserEditForm(request.POST, request.FILES, instance=user_obj)
         
-        # Check if we have a camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
-        if camera_capture_data and camera_capture_data.startswith('data:image'):
-            try:
-                # Process the base64 image data
-                format, imgstr = camera_capture_data.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Convert base64 to file
-                import base64
-                from django.core.files.base import ContentFile
-                
-                # Create a ContentFile from the decoded base64 data
-                filename = f"{user_obj.gsezid}.{ext}" if user_obj.gsezid else f"user_{user_obj.id}.{ext}"
-                data = ContentFile(base64.b64decode(imgstr), name=filename)
-                
-                # Assign the file to the user's profile_photo field
-                user_obj.profile_photo.save(filename, data, save=False)
-                
-                # Set the profile_full_link field with .jpg extension
-                user_obj.profile_full_link = f"http://207.108.234.113:83/{user_obj.gsezid}.jpg"
-                
-            except Exception as e:
-                print(f"Error processing camera capture data: {e}")
-        elif 'profile_photo' in request.FILES:
-            # If a new profile photo was uploaded via the form, update the profile_full_link with .jpg extension
-            user_obj.profile_full_link = f"http://207.108.234.113:83/{user_obj.gsezid}.jpg"
-        
         # Check for deleted items
         deleted_contacts = request.POST.getlist('deleted_contacts[]', [])
         deleted_family_members = request.POST.getlist('deleted_family_members[]', [])
@@ -730,6 +761,12 @@ def admin_edit_user(request, user_id):
         if form.is_valid():
             user = form.save(commit=False)
             
+            # A camera capture is uploaded ahead of the form and referenced by token; it is
+            # only taken once the form is accepted, so a rejected post keeps the stored photo
+            if take_capture(request.POST.get('camera_capture_token'), request.user, user) or 'profile_photo' in request.FILES:
+                # A new profile photo was captured or uploaded: update the profile_full_link with .jpg extension
+                user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
+            
             # Set is_active based on allow_login
             user.is_active = allow_login
             
@@ -836,22 +873,24 @@ def admin_edit_user(request, user_id):
 @login_required
 @user_passes_test(is_admin)
 def admin_create_user(request):
-    # Generate next GSEZ ID using the new format
-    next_gsez_id = generate_gsezid()
+    # Preview the next GSEZ ID without claiming it; the real one is allocated on save
+    next_gsez_id = peek_gsezid()
     
     if request.method == 'POST':
-        form = AdminUserCreationForm(request.POST, request.FILES)
+        # Create a copy of POST data to modify
+        post_data = request.POST.copy()
         
-        # Check if we have a camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
+        # The GSEZ ID on the form is only the preview, so let the form allocate one
+        if is_generated_gsezid(post_data.get('gsezid', '')):
+            post_data['gsezid'] = ''
+        
+        form = AdminUserCreationForm(post_data, request.FILES)
         
         # Check allow_login status
         allow_login = request.POST.get('allow_login') == 'true'
         
         # If login is not allowed, we'll generate a random password later
         if not allow_login:
-            # Create a copy of POST data to modify
-            post_data = request.POST.copy()
             # Generate a random password that meets Django's requirements
             import random
             import string
@@ -866,10 +905,6 @@ def admin_create_user(request):
             # User type is already handled in the form, but we'll leave this line for safety
             user.user_type = request.POST.get('user_type', 'user')
             
-            # If no GSEZ ID provided, use the auto-generated one
-            if not user.gsezid:
-                user.gsezid = next_gsez_id
-            
             # If login is not allowed, store this information
             user.is_active = allow_login
             
@@ -880,28 +915,8 @@ def admin_create_user(request):
             user.save()
             
             # Process camera capture if available
-            if camera_capture_data and camera_capture_data.startswith('data:image'):
-                try:
-                    # Process the base64 image data
-                    format, imgstr = camera_capture_data.split(';base64,')
-                    ext = format.split('/')[-1]
-                    
-                    # Convert base64 to file
-                    import base64
-                    from django.core.files.base import ContentFile
-                    
-                    # Create a ContentFile from the decoded base64 data
-                    filename = f"{user.gsezid}.{ext}"
-                    data = ContentFile(base64.b64decode(imgstr), name=filename)
-                    
-                    # Assign the file to the user's profile_photo field
-                    user.profile_photo.save(filename, data, save=False)
-                    
-                    # Always set the profile_full_link with .jpg extension
-                    user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
-                    
-                except Exception as e:
-                    print(f"Error processing camera capture data: {e}")
+            if take_capture(request.POST.get('camera_capture_token'), request.user, user):
+                user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
             elif user.profile_photo:
                 # If a profile photo was uploaded via the form, set the profile_full_link with .jpg extension
                 user.profile_full_link = f"http://207.108.234.113:83/{user.gsezid}.jpg"
@@ -1050,26 +1065,20 @@ def admin_manage_companies(request):
         form = CompanyForm()
     
     # Get all companies
-    companies = Company.objects.all().order_by('id')
+    companies = Company.objects.all()
     
-    # Pagination
-    paginator = Paginator(companies, int(items_per_page))
-    page = request.GET.get('page', 1)
-    
-    try:
-        companies_page = paginator.page(page)
-    except PageNotAnInteger:
-        companies_page = paginator.page(1)
-    except EmptyPage:
-        companies_page = paginator.page(paginator.num_pages)
+    # Keyset pagination ordered by id; the total is estimated unless ?count=exact
+    companies_page = paginate_by_cursor(
+        companies, ['id'], request.GET.get('cursor'), int(items_per_page),
+        exact_count=request.GET.get('count') == 'exact'
+    )
     
     return render(request, 'core/admin/manage_companies.html', {
         'companies': companies_page,
-        'total_items': companies.count(),
+        'total_items': companies_page.count_label,
         'items_per_page': items_per_page,
         'form': form,
-        'page_obj': companies_page,
-        'paginator': paginator
+        'page_obj': companies_page
     })
 
 @login_required
@@ -1094,13 +1103,7 @@ def admin_manage_hr(request):
     
     # Apply search if query is provided
     if query:
-        hr_users = hr_users.filter(
-            Q(gsezid__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(mobile_number__icontains=query)
-        )
+        hr_users = search_users(hr_users, query)
     
     # Paginate the users
     paginator = Paginator(hr_users, items_per_page)
@@ -1145,13 +1148,7 @@ def admin_manage_security(request):
     
     # Apply search if query is provided
     if query:
-        security_users = security_users.filter(
-            Q(gsezid__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(mobile_number__icontains=query)
-        )
+        security_users = search_users(security_users, query)
     
     # Paginate the users
     paginator = Paginator(security_users, items_per_page)
@@ -1177,197 +1174,32 @@ def admin_manage_security(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_export_fields_selection(request):
-    # Get unique companies for filtering
-    companies = User.objects.filter(user_type='user').values_list('current_employer_company', flat=True).distinct()
-    companies = [c for c in companies if c]  # Remove empty values
+    # Companies that have at least one user, for filtering
+    companies = Company.objects.filter(
+        Exists(User.objects.filter(user_type='user', current_employer_company=OuterRef('pk')))
+    ).order_by('company_name')
     
     return render(request, 'core/admin/export_fields.html', {
-        'companies': companies
+        'companies': companies,
+        'column_groups': export_column_groups(),
+        'export_formats': [(value, label) for value, (content_type, extension, label) in EXPORT_FORMATS.items()],
+        'default_export_format': DEFAULT_EXPORT_FORMAT
     })
 
 @login_required
 @user_passes_test(is_admin)
 def admin_export_users(request):
-    response = HttpResponse(content_type='application/ms-excel')
-    response['Content-Disposition'] = 'attachment; filename="users.xls"'
-    
-    wb = xlwt.Workbook(encoding='utf-8')
-    ws = wb.add_sheet('Users')
-    
-    # Sheet header, first row
-    row_num = 0
-    
-    # Define all possible columns
-    all_columns = {
-        'id': 'ID',
-        'username': 'Username',
-        'email': 'Email',
-        'first_name': 'First Name',
-        'middle_name': 'Middle Name',
-        'last_name': 'Last Name',
-        'user_type': 'User Type',
-        'status': 'Status',
-        'is_verified': 'Is Verified',
-        'is_required_profile_detail': 'Is Profile Complete',
-        'is_printed': 'Is Printed',
-        'nationality': 'Nationality',
-        'date_of_birth': 'Date of Birth',
-        'gsez_card_issue_date': 'GSEZ Card Issue Date',
-        'gsez_card_expiry_date': 'GSEZ Card Expiry Date',
-        'gsezid': 'GSEZ ID',
-        'profile_full_link': 'Profile Full Link',
-        'employee_contact_number': 'Employee Contact Number',
-        'qr_code': 'QR Code',
-        'current_address': 'Current Address',
-        'is_permanent': 'Is Permanent',
-        'permanent_address': 'Permanent Address',
-        'current_employer': 'Current Employer',
-        'current_employer_join_date': 'Join Date',
-        'current_employer_emp_code': 'Employee Code',
-        'current_employer_designation': 'Designation',
-        'current_employer_department': 'Department',
-        'current_employer_company': 'Company',
-        'current_employer_remarks': 'Remarks',
-        'current_employer_rating': 'Rating',
-        'emergency_contact_numbers': 'Emergency Contacts',
-        'family_members': 'Family Members',
-        'previous_employers': 'Previous Employers',
-        'qualifications': 'Qualifications',
-        'latest_card_print_date': 'Latest Card Print Date',
-        'card_print_remarks': 'Card Print Remarks',
-        'card_print_count': 'Card Print Count'
-    }
-    
-    # Get selected fields or use all fields if none selected
-    selected_fields = request.POST.getlist('fields') if request.method == 'POST' and request.POST.getlist('fields') else all_columns.keys()
+    export_format = request.POST.get('export_format', DEFAULT_EXPORT_FORMAT) if request.method == 'POST' else DEFAULT_EXPORT_FORMAT
+    params = user_export_params(request.POST) if request.method == 'POST' else {}
     
-    # Create columns list based on selected fields
-    columns = []
-    for field in selected_fields:
-        if field in all_columns:
-            columns.append(all_columns[field])
+    # Large exports are built by a background worker instead of inside the request
+    if request.method == 'POST' and request.POST.get('background'):
+        job = submit_export_job('users', export_format, params, request.user)
+        messages.success(request, f'Export #{job.pk} has been queued. The file will be available here when it is ready.')
+        return redirect('admin_export_jobs')
     
-    # Write header row
-    for col_num, column_title in enumerate(columns):
-        ws.write(row_num, col_num, column_title)
-    
-    # Get all users with filters
-    users = User.objects.filter(user_type='user')
-    
-    # Apply filters if provided
-    if request.method == 'POST':
-        # Filter by GSEZ ID
-        gsezid_filter = request.POST.get('gsezid_filter')
-        if gsezid_filter:
-            users = users.filter(gsezid__icontains=gsezid_filter)
-        
-        # Filter by company
-        company_filter = request.POST.get('company_filter')
-        if company_filter:
-            users = users.filter(current_employer_company__icontains=company_filter)
-        
-        # Filter by card print date range
-        card_print_start_date = request.POST.get('card_print_start_date')
-        card_print_end_date = request.POST.get('card_print_end_date')
-        
-        if card_print_start_date and card_print_end_date:
-            # Get users who have card prints within the date range
-            user_ids_with_card_prints = CardPrint.objects.filter(
-                card_print_date__range=[card_print_start_date, card_print_end_date]
-            ).values_list('user_id', flat=True).distinct()
-            
-            users = users.filter(id__in=user_ids_with_card_prints)
-    
-    # Write data rows
-    for user in users:
-        row_num += 1
-        row = []
-        
-        # Get latest card print info for this user
-        latest_card_print = CardPrint.objects.filter(user=user).order_by('-card_print_date').first()
-        card_print_count = CardPrint.objects.filter(user=user).count()
-        
-        for field in selected_fields:
-            if field == 'id':
-                row.append(user.id)
-            elif field == 'username':
-                row.append(user.username)
-            elif field == 'email':
-                row.append(user.email)
-            elif field == 'first_name':
-                row.append(user.first_name)
-            elif field == 'middle_name':
-                row.append(user.middle_name if user.middle_name else '')
-            elif field == 'last_name':
-                row.append(user.last_name)
-            elif field == 'user_type':
-                row.append(user.user_type)
-            elif field == 'status':
-                row.append(user.status)
-            elif field == 'is_verified':
-                row.append('1' if user.is_verified else '0')
-            elif field == 'is_required_profile_detail':
-                row.append('1' if not user.is_required_profile_detail else '0')
-            elif field == 'is_printed':
-                row.append('1' if user.is_printed else '0')
-            elif field == 'nationality':
-                row.append(user.nationality if user.nationality else '')
-            elif field == 'date_of_birth':
-                row.append(str(user.date_of_birth) if user.date_of_birth else '')
-            elif field == 'gsez_card_issue_date':
-                row.append(str(user.gsez_card_issue_date) if user.gsez_card_issue_date else '')
-            elif field == 'gsez_card_expiry_date':
-                row.append(str(user.gsez_card_expiry_date) if user.gsez_card_expiry_date else '')
-            elif field == 'gsezid':
-                row.append(user.gsezid if user.gsezid else '')
-            elif field == 'profile_full_link':
-                row.append(user.profile_full_link if user.profile_full_link else '')
-            elif field == 'employee_contact_number':
-                row.append(user.employee_contact_number if user.employee_contact_number else '')
-            elif field == 'qr_code':
-                row.append(user.qr_code if user.qr_code else '')
-            elif field == 'current_address':
-                row.append(user.current_address if user.current_address else '')
-            elif field == 'is_permanent':
-                row.append('1' if user.is_permanent else '0')
-            elif field == 'permanent_address':
-                row.append(user.permanent_address if user.permanent_address else '')
-            elif field == 'current_employer':
-                row.append(user.current_employer if user.current_employer else '')
-            elif field == 'current_employer_join_date':
-                row.append(str(user.current_employer_join_date) if user.current_employer_join_date else '')
-            elif field == 'current_employer_emp_code':
-                row.append(user.current_employer_emp_code if user.current_employer_emp_code else '')
-            elif field == 'current_employer_designation':
-                row.append(user.current_employer_designation if user.current_employer_designation else '')
-            elif field == 'current_employer_department':
-                row.append(user.current_employer_department if user.current_employer_department else '')
-            elif field == 'current_employer_company':
-                row.append(user.current_employer_company if user.current_employer_company else '')
-            elif field == 'current_employer_remarks':
-                row.append(user.current_employer_remarks)
-            elif field == 'current_employer_rating':
-                row.append(str(user.current_employer_rating) if user.current_employer_rating else '')
-            elif field == 'emergency_contact_numbers':
-                row.append(user.emergency_contact_numbers)
-            elif field == 'family_members':
-                row.append(user.family_members)
-            elif field == 'previous_employers':
-                row.append(user.previous_employers)
-            elif field == 'qualifications':
-                row.append(user.qualifications)
-            elif field == 'latest_card_print_date':
-                row.append(str(latest_card_print.card_print_date) if latest_card_print else '')
-            elif field == 'card_print_remarks':
-                row.append(latest_card_print.remarks if latest_card_print and latest_card_print.remarks else '')
-            elif field == 'card_print_count':
-                row.append(str(card_print_count))
-        
-        for col_num, cell_value in enumerate(row):
-            ws.write(row_num, col_num, str(cell_value) if cell_value is not None else '')
-    
-    wb.save(response)
-    return response
+    # Rows are built lazily while the response is being sent
+    return user_export(params).response(export_format)
 
 @login_required
 @user_passes_test(is_admin)
@@ -1377,75 +1209,15 @@ def admin_export_users_template(request):
     
     writer = csv.writer(response)
     
-    # Header row with all User model fields
-    headers = [
-        'username', 'password', 'first_name', 'middle_name', 'last_name', 'email', 
-        'user_type', 'status', 'is_verified', 'is_required_profile_detail', 'is_printed',
-        'nationality', 'date_of_birth', 'gsez_card_issue_date', 'gsez_card_expiry_date', 'gsezid',
-        'profile_full_link', 'employee_contact_number', 'qr_code', 'current_address', 'is_permanent', 'permanent_address', 
-        'current_employer', 'current_employer_join_date', 'current_employer_emp_code', 
-        'current_employer_designation', 'current_employer_department', 'current_employer_company',
-        'current_employer_remarks', 'current_employer_rating',
-        # Split JSON fields into separate columns
-        'emergency_contact_name', 'emergency_contact_number',
-        'family_member_name', 'family_member_relation', 'family_member_number',
-        'previous_employer_name', 'previous_employer_join_date', 'previous_employer_leave_date', 'previous_employer_remarks', 'previous_employer_rating',
-        'qualification_name', 'qualification_institution', 'qualification_year'
-    ]
-    writer.writerow(headers)
+    # Header row with every importable column
+    writer.writerow([column.key for column in TEMPLATE_COLUMNS])
     
     # Helpful comments row (field requirements)
-    comments = [
-        'Optional (auto-generated if blank)', 'Optional (auto-generated if blank)', 'Optional', 'Optional', 'Optional', 'Optional',
-        'Use: user/admin/hr/security', 'Use: active/inactive/blocked/terminated/under_surveillance', 
-        'Use: 1/0', 'Use: 1/0', 'Use: 1/0',
-        'Optional', 'Use: YYYY-MM-DD or DD/MM/YYYY', 'Use: YYYY-MM-DD or DD/MM/YYYY', 
-        'Use: YYYY-MM-DD or DD/MM/YYYY', 'Optional (auto-generated if blank)',
-        'Optional (e.g. http://207.108.234.113:83/GSEZID.jpg)', 'Optional', 'Optional (auto-generated if blank)', 'Optional', 'Use: 1/0', 'Optional',
-        'Optional', 'Use: YYYY-MM-DD or DD/MM/YYYY', 'Optional', 
-        'Optional', 'Optional', 'Must exist in system',
-        'Optional', 'Optional (number 1-5)',
-        # Comments for separated JSON fields
-        'Optional', 'Optional',
-        'Optional', 'Optional', 'Optional',
-        'Optional', 'Use: YYYY-MM-DD or DD/MM/YYYY', 'Use: YYYY-MM-DD or DD/MM/YYYY', 'Optional', 'Optional (number 1-5)',
-        'Optional', 'Optional', 'Optional (year)'
-    ]
-    writer.writerow(comments)
-    
-    # Example row 1
-    example1 = [
-        'john_doe', 'password123', 'John', '', 'Doe', 'john@example.com',
-        'user', 'active', '1', '1', '0',
-        'Indian', '1990-01-01', '2023-01-01', '2025-01-01', 'ZIS2506000001',
-        'http://207.108.234.113:83/ZIS2506000001.jpg', '9876543210', 'http://207.180.234.113/IDCARD/ZIS2506000001', '123 Street, City', '0', '456 Street, City',
-        'ACME Corp', '2022-01-01', 'EMP123', 
-        'Developer', 'IT', 'Company Name',
-        'Good employee', '4',
-        # Separated JSON fields
-        'Emergency Contact', '9876543210',
-        'Jane Doe', 'Spouse', '1234567890',
-        'Previous Corp', '2019-01-01', '2021-12-31', 'Worked as Developer', '3',
-        'B.Tech', 'University', '2018'
-    ]
-    writer.writerow(example1)
-    
-    # Example row 2 with different date formats
-    example2 = [
-        'jane_smith', 'pass456', 'Jane', 'M', 'Smith', 'jane@example.com',
-        'user', 'active', '0', '1', '0',
-        'American', '31/05/1992', '01.02.2023', '01-02-2025', 'ZIS2506000002',
-        'http://207.108.234.113:83/ZIS2506000002.jpg', '8765432109', 'http://207.180.234.113/IDCARD/ZIS2506000002', '789 Road, Town', '1', '789 Road, Town',
-        'XYZ Ltd', '01/06/2021', 'XYZ456', 
-        'Manager', 'HR', 'XYZ Company',
-        'Excellent manager', '5',
-        # Separated JSON fields
-        'Emergency', '1234567890',
-        'John Smith', 'Husband', '9876543210',
-        'ABC Inc', '2018-01-01', '2021-05-31', 'Team Leader', '4',
-        'MBA', 'Business School', '2016'
-    ]
-    writer.writerow(example2)
+    writer.writerow([column.note for column in TEMPLATE_COLUMNS])
+    
+    # Example rows, the second one with different date formats
+    for example in range(2):
+        writer.writerow([column.examples[example] for column in TEMPLATE_COLUMNS])
     
     return response
 
@@ -1454,314 +1226,56 @@ def admin_export_users_template(request):
 def admin_import_users(request):
     if request.method == 'POST' and request.FILES.get('csv_file'):
         csv_file = request.FILES['csv_file']
-        if not csv_file.name.endswith('.csv'):
-            messages.error(request, 'Please upload a CSV file.')
+        if not is_supported_upload(csv_file):
+            messages.error(request, 'Please upload a CSV or Excel (.xlsx) file.')
             return redirect('admin_import_users')
-
+        
+        # Rows matching an existing GSEZ ID / username update that user instead of being skipped
+        update_existing = bool(request.POST.get('update_existing'))
+        # Validate the whole file and report every rejected row without saving anything
+        dry_run = bool(request.POST.get('dry_run'))
+        
+        if request.POST.get('background'):
+            job = submit_import_job(csv_file, request.user, update_existing=update_existing, dry_run=dry_run)
+            messages.success(request, f'Import #{job.pk} has been queued. Progress and rejected rows are shown here.')
+            return redirect('admin_import_jobs')
+        
         try:
-            # Read CSV file with error handling for different encodings
-            csv_data = csv_file.read()
-            try:
-                # First try UTF-8
-                decoded_file = csv_data.decode('utf-8').splitlines()
-            except UnicodeDecodeError:
-                try:
-                    # Then try ISO-8859-1 (Latin-1)
-                    decoded_file = csv_data.decode('latin-1').splitlines()
-                except UnicodeDecodeError:
-                    # Fall back to a more permissive encoding with error handling
-                    decoded_file = csv_data.decode('utf-8', errors='replace').splitlines()
-                    
-            reader = csv.reader(decoded_file)
+            # Rows are decoded and parsed lazily as the import consumes them
+            reader = upload_rows(csv_file)
             headers = next(reader)  # Get header row
             next(reader, None)  # Skip the second row (instructions/comments)
             
-            # Create field mapping based on headers
-            field_indices = {}
-            for i, header in enumerate(headers):
-                # Normalize header: trim whitespace, convert to lowercase
-                normalized_header = header.strip().lower()
-                field_indices[normalized_header] = i
-            
-            # Debug field indices to help troubleshoot
-            missing_required_fields = []
-            # No required fields - all fields are optional
-            
-            success_count = 0
-            error_count = 0
-            error_details = []
-            
-            for row_num, row in enumerate(reader, start=3):  # Start at 3 to account for header and instruction rows
-                if not row:  # Skip empty rows
-                    error_details.append(f"Row {row_num}: Empty row")
-                    error_count += 1
-                    continue
-                
-                try:
-                    # Extract basic fields
-                    username = row[field_indices.get('username', 0)].strip() if 'username' in field_indices and field_indices['username'] < len(row) else ''
-                    password = row[field_indices.get('password', 0)].strip() if 'password' in field_indices and field_indices['password'] < len(row) else ''
-                    first_name = row[field_indices.get('first_name', 0)].strip() if 'first_name' in field_indices and field_indices['first_name'] < len(row) else ''
-                    last_name = row[field_indices.get('last_name', 0)].strip() if 'last_name' in field_indices and field_indices['last_name'] < len(row) else ''
-                    email = row[field_indices.get('email', 0)].strip() if 'email' in field_indices and field_indices['email'] < len(row) else ''
-                    
-                    # Generate username if not provided
-                    if not username:
-                        username = generate_gsezid()
-                    
-                    # Generate random password if not provided
-                    if not password:
-                        password = User.objects.make_random_password()
-                    
-                    # Check if user already exists
-                    if User.objects.filter(username=username).exists():
-                        error_details.append(f"Row {row_num}: User with username '{username}' already exists")
-                        error_count += 1
-                        continue
-                    
-                    # Create user with basic fields
-                    user = User.objects.create_user(
-                        username=username,
-                        email=email,
-                        password=password,
-                        first_name=first_name,
-                        last_name=last_name
-                    )
-                    
-                    # Set user type and status explicitly first
-                    if 'user_type' in field_indices and field_indices['user_type'] < len(row):
-                        user_type_value = row[field_indices['user_type']].strip()
-                        if user_type_value in [choice[0] for choice in User.USER_TYPE_CHOICES]:
-                            user.user_type = user_type_value
-                        elif user_type_value:
-                            error_details.append(f"Row {row_num}: Invalid user_type: {user_type_value}. Using default.")
-                    
-                    if 'status' in field_indices and field_indices['status'] < len(row):
-                        status_value = row[field_indices['status']].strip()
-                        if status_value in [choice[0] for choice in User.STATUS_CHOICES]:
-                            user.status = status_value
-                        elif status_value:
-                            error_details.append(f"Row {row_num}: Invalid status: {status_value}. Using default.")
-                    
-                    # Set optional text fields
-                    optional_text_fields = [
-                        'middle_name', 'nationality', 'gsezid', 'current_address',
-                        'permanent_address', 'current_employer', 'current_employer_emp_code',
-                        'current_employer_designation', 'current_employer_department',
-                        'current_employer_remarks', 'profile_full_link', 'employee_contact_number'
-                    ]
-                    
-                    for field in optional_text_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip()
-                            if value:
-                                setattr(user, field, value)
-                    
-                    # Set boolean fields
-                    boolean_fields = [
-                        'is_verified', 'is_required_profile_detail', 'is_printed', 'is_permanent'
-                    ]
-                    
-                    for field in boolean_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip().lower()
-                            setattr(user, field, value in ['1', 'true', 'yes'])
-                    
-                    # Set date fields
-                    date_fields = [
-                        'date_of_birth', 'gsez_card_issue_date', 'gsez_card_expiry_date',
-                        'current_employer_join_date'
-                    ]
-                    
-                    date_field_values = {}  # Store processed date values for final debug message
-                    for field in date_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip()
-                            if value:
-                                try:
-                                    # Try different date formats
-                                    date_value = None
-                                    date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%d/%Y', '%d.%m.%Y']
-                                    
-                                    for date_format in date_formats:
-                                        try:
-                                            date_value = datetime.strptime(value, date_format).date()
-                                            # Store the format that worked
-                                            date_field_values[field] = {
-                                                'raw': value,
-                                                'parsed': str(date_value),
-                                                'format_used': date_format
-                                            }
-                                            break
-                                        except ValueError:
-                                            continue
-                                    
-                                    if date_value:
-                                        setattr(user, field, date_value)
-                                    else:
-                                        error_details.append(f"Row {row_num}: Invalid date format for {field}: {value}. Expected YYYY-MM-DD or DD/MM/YYYY")
-                                except Exception as e:
-                                    error_details.append(f"Row {row_num}: Error processing date {field}: {str(e)}")
-                                    # Continue with other fields even if this date field fails
-                    
-                    # Remove the debug message - we don't want it to show in the UI
-                    # (The debug info is still collected in date_field_values if needed later)
-                    
-                    # Set integer fields
-                    if 'current_employer_rating' in field_indices and field_indices['current_employer_rating'] < len(row):
-                        try:
-                            rating_value = row[field_indices['current_employer_rating']].strip()
-                            if rating_value:
-                                rating = int(rating_value)
-                                user.current_employer_rating = rating
-                        except ValueError:
-                            error_details.append(f"Row {row_num}: Invalid rating value: {rating_value}. Expected integer")
-                    
-                    # Set company foreign key
-                    if 'current_employer_company' in field_indices and field_indices['current_employer_company'] < len(row):
-                        company_name = row[field_indices['current_employer_company']].strip()
-                        if company_name:
-                            try:
-                                company, created = Company.objects.get_or_create(company_name=company_name)
-                                user.current_employer_company = company
-                            except Exception as e:
-                                error_details.append(f"Row {row_num}: Error setting company: {str(e)}")
-                    
-                    # Process emergency contacts (comma-separated fields)
-                    emergency_contacts = []
-                    if 'emergency_contact_name' in field_indices and 'emergency_contact_number' in field_indices:
-                        name = row[field_indices['emergency_contact_name']].strip() if field_indices['emergency_contact_name'] < len(row) else ''
-                        number = row[field_indices['emergency_contact_number']].strip() if field_indices['emergency_contact_number'] < len(row) else ''
-                        
-                        if name and number:
-                            emergency_contacts.append({
-                                'name': name,
-                                'number': number
-                            })
-                            user.emergency_contact_numbers = json.dumps(emergency_contacts)
-                    # Also support the old JSON format for backward compatibility
-                    elif 'emergency_contact_numbers' in field_indices and field_indices['emergency_contact_numbers'] < len(row):
-                        value = row[field_indices['emergency_contact_numbers']].strip()
-                        if value:
-                            try:
-                                # Try to parse JSON
-                                json_value = json.loads(value)
-                                user.emergency_contact_numbers = value
-                            except json.JSONDecodeError as je:
-                                error_details.append(f"Row {row_num}: Invalid JSON format for emergency_contact_numbers: {str(je)}")
-                    
-                    # Process family members (comma-separated fields)
-                    family_members = []
-                    if all(field in field_indices for field in ['family_member_name', 'family_member_relation']):
-                        name = row[field_indices['family_member_name']].strip() if field_indices['family_member_name'] < len(row) else ''
-                        relation = row[field_indices['family_member_relation']].strip() if field_indices['family_member_relation'] < len(row) else ''
-                        number = ''
-                        
-                        if 'family_member_number' in field_indices and field_indices['family_member_number'] < len(row):
-                            number = row[field_indices['family_member_number']].strip()
-                        
-                        if name and relation:
-                            family_members.append({
-                                'name': name,
-                                'relation': relation,
-                                'number': number
-                            })
-                            user.family_members = json.dumps(family_members)
-                    # Also support the old JSON format for backward compatibility
-                    elif 'family_members' in field_indices and field_indices['family_members'] < len(row):
-                        value = row[field_indices['family_members']].strip()
-                        if value:
-                            try:
-                                # Try to parse JSON
-                                json_value = json.loads(value)
-                                user.family_members = value
-                            except json.JSONDecodeError as je:
-                                error_details.append(f"Row {row_num}: Invalid JSON format for family_members: {str(je)}")
-                    
-                    # Process previous employers (comma-separated fields)
-                    previous_employers = []
-                    if 'previous_employer_name' in field_indices:
-                        company = row[field_indices['previous_employer_name']].strip() if field_indices['previous_employer_name'] < len(row) else ''
-                        
-                        if company:
-                            employer_data = {'company': company}
-                            
-                            # Add optional fields if they exist
-                            for field_pair in [
-                                ('previous_employer_join_date', 'join_date'),
-                                ('previous_employer_leave_date', 'leave_date'),
-                                ('previous_employer_remarks', 'remarks'),
-                                ('previous_employer_rating', 'rating')
-                            ]:
-                                csv_field, json_field = field_pair
-                                if csv_field in field_indices and field_indices[csv_field] < len(row):
-                                    value = row[field_indices[csv_field]].strip()
-                                    if value:
-                                        employer_data[json_field] = value
-                            
-                            previous_employers.append(employer_data)
-                            user.previous_employers = json.dumps(previous_employers)
-                    # Also support the old JSON format for backward compatibility
-                    elif 'previous_employers' in field_indices and field_indices['previous_employers'] < len(row):
-                        value = row[field_indices['previous_employers']].strip()
-                        if value:
-                            try:
-                                # Try to parse JSON
-                                json_value = json.loads(value)
-                                user.previous_employers = value
-                            except json.JSONDecodeError as je:
-                                error_details.append(f"Row {row_num}: Invalid JSON format for previous_employers: {str(je)}")
-                    
-                    # Process qualifications (comma-separated fields)
-                    qualifications = []
-                    if 'qualification_name' in field_indices and 'qualification_institution' in field_indices:
-                        qualification = row[field_indices['qualification_name']].strip() if field_indices['qualification_name'] < len(row) else ''
-                        institution = row[field_indices['qualification_institution']].strip() if field_indices['qualification_institution'] < len(row) else ''
-                        
-                        if qualification and institution:
-                            qual_data = {
-                                'qualification': qualification,
-                                'institution': institution
-                            }
-                            
-                            # Add year if it exists
-                            if 'qualification_year' in field_indices and field_indices['qualification_year'] < len(row):
-                                year = row[field_indices['qualification_year']].strip()
-                                if year:
-                                    qual_data['year'] = year
-                            
-                            qualifications.append(qual_data)
-                            user.qualifications = json.dumps(qualifications)
-                    # Also support the old JSON format for backward compatibility
-                    elif 'qualifications' in field_indices and field_indices['qualifications'] < len(row):
-                        value = row[field_indices['qualifications']].strip()
-                        if value:
-                            try:
-                                # Try to parse JSON
-                                json_value = json.loads(value)
-                                user.qualifications = value
-                            except json.JSONDecodeError as je:
-                                error_details.append(f"Row {row_num}: Invalid JSON format for qualifications: {str(je)}")
-                    
-                    # Generate GSEZ ID if not provided
-                    if not user.gsezid:
-                        user.gsezid = generate_gsezid()
-                    
-                    # Set the QR code URL using the GSEZ ID
-                    user.qr_code = f"http://207.180.234.113/IDCARD/{user.gsezid}"
-                    
-                    # Save the user
-                    user.save()
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_count += 1
+            # Rows are validated in memory and written in bulk, one transaction per batch
+            user_import = UserImport(headers, update_existing=update_existing, dry_run=dry_run)
+            try:
+                for row_num, row in enumerate(reader, start=3):  # Start at 3 to account for header and instruction rows
+                    user_import.add_row(row_num, row)
+            finally:
+                user_import.finish()
+            
+            if dry_run:
+                job = record_dry_run('users', csv_file.name, request.user, user_import,
+                                     max(0, user_import.last_row_num - 2), update_existing)
+                summary = f'Validation #{job.pk}: {user_import.success_count} new users'
+                if update_existing:
+                    summary += f', {user_import.updated_count} updates'
+                messages.info(request, f'{summary}, {user_import.error_count} rows rejected. Nothing was saved.')
+                if user_import.new_companies:
+                    messages.info(request, f'{len(user_import.new_companies)} new companies would be created.')
+                return redirect('admin_import_jobs')
+            
+            success_count = user_import.success_count
+            error_count = user_import.error_count
+            error_details = user_import.error_details
             
             # Display success and errors
             if success_count > 0:
                 messages.success(request, f'{success_count} users imported successfully.')
-            else:
+            elif not update_existing:
                 messages.warning(request, "No users were imported.")
+            if update_existing:
+                messages.info(request, f'{user_import.updated_count} existing users updated, {user_import.unchanged_count} unchanged.')
                 
             if error_count > 0:
                 messages.error(request, f'{error_count} users skipped due to errors.')
@@ -1780,69 +1294,90 @@ def admin_import_users(request):
     
     return render(request, 'core/admin/import_users.html')
 
+@login_required
+@user_passes_test(is_admin)
+def admin_import_jobs(request):
+    jobs = ImportJob.objects.select_related('created_by')[:50]
+    return render(request, 'core/admin/import_jobs.html', {
+        'jobs': jobs
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def admin_import_job_status(request, job_id):
+    # Polled by the import jobs page while a job is pending or running
+    job = get_object_or_404(ImportJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'progress': job.progress,
+        'success_count': job.success_count,
+        'updated_count': job.updated_count,
+        'error_count': job.error_count,
+        'error': job.error or ''
+    })
+
+@login_required
+@user_passes_test(is_admin)
+@require_POST
+def admin_import_job_resume(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id)
+    if resume_job(job):
+        messages.success(request, f'Import #{job.pk} will continue after row {job.checkpoint_row}.')
+    else:
+        messages.error(request, f'Import #{job.pk} cannot be resumed.')
+    return redirect('admin_import_jobs')
+
+@login_required
+@user_passes_test(is_admin)
+def admin_import_job_errors(request, job_id):
+    # Every rejected row (and warning) of the job, streamed as CSV
+    job = get_object_or_404(ImportJob, id=job_id)
+    rows = (
+        (row_num or '', 'Error' if skipped else 'Warning', message)
+        for row_num, skipped, message in job.row_errors.values_list('row_num', 'skipped', 'message').iterator(chunk_size=2000)
+    )
+    return export_response('csv', f'import_{job.pk}_errors', ['Row', 'Type', 'Error'], rows)
+
 @login_required
 @user_passes_test(is_admin)
 def admin_export_companies(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="companies.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Company'])  # Simplified header
-    
-    companies = Company.objects.all().values_list('company_name')
-    for company in companies:
-        writer.writerow(company)
+    if request.method == 'POST' and request.POST.get('background'):
+        job = submit_export_job('companies', 'csv', {}, request.user)
+        messages.success(request, f'Export #{job.pk} has been queued. The file will be available here when it is ready.')
+        return redirect('admin_export_jobs')
     
-    return response
+    return company_export({}).response('csv')
 
 @login_required
 @user_passes_test(is_admin)
 def admin_import_companies(request):
     if request.method == 'POST' and request.FILES.get('csv_file'):
         csv_file = request.FILES['csv_file']
-        if not csv_file.name.endswith('.csv'):
-            messages.error(request, 'Please upload a CSV file.')
+        if not is_supported_upload(csv_file):
+            messages.error(request, 'Please upload a CSV or Excel (.xlsx) file.')
             return redirect('admin_manage_companies')
 
         try:
-            # Read CSV file with error handling for different encodings
-            csv_data = csv_file.read()
-            try:
-                # First try UTF-8
-                decoded_file = csv_data.decode('utf-8').splitlines()
-            except UnicodeDecodeError:
-                try:
-                    # Then try ISO-8859-1 (Latin-1)
-                    decoded_file = csv_data.decode('latin-1').splitlines()
-                except UnicodeDecodeError:
-                    # Fall back to a more permissive encoding with error handling
-                    decoded_file = csv_data.decode('utf-8', errors='replace').splitlines()
-            
-            reader = csv.reader(decoded_file)
-            next(reader)  # Skip header row
+            # Rows are decoded and parsed lazily as the import consumes them
+            reader = upload_rows(csv_file)
+            next(reader, None)  # Skip header row
 
-            success_count = 0
-            error_count = 0
-            
-            # Process each row - expecting only company name in each row
-            for row in reader:
-                if not row:  # Skip empty rows
-                    continue
-                
-                company_name = row[0].strip()
-                if company_name:
-                    try:
-                        # Check if company already exists
-                        existing_company = Company.objects.filter(company_name=company_name).exists()
-                        if not existing_company:
-                            Company.objects.create(company_name=company_name)
-                            success_count += 1
-                        else:
-                            error_count += 1  # Company already exists
-                    except Exception as e:
-                        error_count += 1
-            
-            messages.success(request, f'{success_count} companies imported successfully. {error_count} companies skipped (already exist or invalid data).')
+            # Names are deduplicated in memory and only the new ones written, in bulk
+            company_import = CompanyImport()
+            for row_num, row in enumerate(reader, start=2):
+                company_import.add_row(row_num, row)
+            company_import.finish()
+            
+            messages.success(
+                request,
+                f'{company_import.created_count} companies imported successfully. '
+                f'{company_import.duplicate_count} duplicates skipped (repeated or already exist), '
+                f'{company_import.invalid_count} invalid rows skipped.'
+            )
         except Exception as e:
             messages.error(request, f'Error importing companies: {str(e)}')
         
@@ -1853,7 +1388,7 @@ def admin_import_companies(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_manage_documents(request):
-    documents = Document.objects.all().order_by('-id')
+    documents = Document.objects.select_related('user')
     
     # Add search functionality
     search_query = request.GET.get('search', '')
@@ -1870,24 +1405,18 @@ def admin_manage_documents(request):
     if items_per_page not in ['5', '10', '15']:
         items_per_page = '10'
     
-    # Pagination
-    paginator = Paginator(documents, int(items_per_page))
-    page = request.GET.get('page', 1)
-    
-    try:
-        documents_page = paginator.page(page)
-    except PageNotAnInteger:
-        documents_page = paginator.page(1)
-    except EmptyPage:
-        documents_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, newest first; the total is estimated unless ?count=exact
+    documents_page = paginate_by_cursor(
+        documents, ['-id'], request.GET.get('cursor'), int(items_per_page),
+        exact_count=request.GET.get('count') == 'exact'
+    )
     
     return render(request, 'core/admin/manage_documents.html', {
         'documents': documents_page,
         'search_query': search_query,
         'items_per_page': items_per_page,
-        'total_items': documents.count(),
-        'page_obj': documents_page,
-        'paginator': paginator
+        'total_items': documents_page.count_label,
+        'page_obj': documents_page
     })
 
 @login_required
@@ -1984,28 +1513,10 @@ def hr_profile(request):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         
-        # Check if we have a camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
-        if camera_capture_data and camera_capture_data.startswith('data:image'):
-            try:
-                # Process the base64 image data
-                format, imgstr = camera_capture_data.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Convert base64 to file
-                import base64
-                from django.core.files.base import ContentFile
-                
-                # Create a ContentFile from the decoded base64 data
-                filename = f"{request.user.gsezid}.{ext}" if request.user.gsezid else f"user_{request.user.id}.{ext}"
-                data = ContentFile(base64.b64decode(imgstr), name=filename)
-                
-                # Assign the file to the user's profile_photo field
-                request.user.profile_photo.save(filename, data, save=False)
-            except Exception as e:
-                print(f"Error processing camera capture data: {e}")
-        
         if form.is_valid():
+            # A camera capture is uploaded ahead of the form and referenced by token; it is
+            # only taken once the form is accepted, so a rejected post keeps the stored photo
+            take_capture(request.POST.get('camera_capture_token'), request.user, request.user)
             form.save()
             messages.success(request, 'Profile updated successfully.')
             return redirect('hr_profile')
@@ -2112,28 +1623,10 @@ def security_profile(request):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         
-        # Check if we have a camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
-        if camera_capture_data and camera_capture_data.startswith('data:image'):
-            try:
-                # Process the base64 image data
-                format, imgstr = camera_capture_data.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Convert base64 to file
-                import base64
-                from django.core.files.base import ContentFile
-                
-                # Create a ContentFile from the decoded base64 data
-                filename = f"{request.user.gsezid}.{ext}" if request.user.gsezid else f"user_{request.user.id}.{ext}"
-                data = ContentFile(base64.b64decode(imgstr), name=filename)
-                
-                # Assign the file to the user's profile_photo field
-                request.user.profile_photo.save(filename, data, save=False)
-            except Exception as e:
-                print(f"Error processing camera capture data: {e}")
-        
         if form.is_valid():
+            # A camera capture is uploaded ahead of the form and referenced by token; it is
+            # only taken once the form is accepted, so a rejected post keeps the stored photo
+            take_capture(request.POST.get('camera_capture_token'), request.user, request.user)
             form.save()
             messages.success(request, 'Profile updated successfully.')
             return redirect('security_profile')
@@ -2149,34 +1642,14 @@ def security_add_user(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST, request.FILES)
         
-        # Check if we have camera capture image data
-        camera_capture_data = request.POST.get('camera_capture_data')
-        
         if form.is_valid():
             user = form.save(commit=False)
             user.user_type = 'user'
             user.save()
             
             # Process camera capture if available
-            if camera_capture_data and camera_capture_data.startswith('data:image'):
-                try:
-                    # Process the base64 image data
-                    format, imgstr = camera_capture_data.split(';base64,')
-                    ext = format.split('/')[-1]
-                    
-                    # Convert base64 to file
-                    import base64
-                    from django.core.files.base import ContentFile
-                    
-                    # Create a ContentFile from the decoded base64 data
-                    filename = f"{user.gsezid}.{ext}" if user.gsezid else f"user_{user.id}.{ext}"
-                    data = ContentFile(base64.b64decode(imgstr), name=filename)
-                    
-                    # Assign the file to the user's profile_photo field
-                    user.profile_photo.save(filename, data, save=False)
-                    user.save()
-                except Exception as e:
-                    print(f"Error processing camera capture data: {e}")
+            if take_capture(request.POST.get('camera_capture_token'), request.user, user):
+                user.save()
             
             messages.success(request, 'User added successfully.')
             return redirect('security_dashboard')
@@ -2208,6 +1681,24 @@ def company_suggestions(request):
         return JsonResponse(list(companies), safe=False)
     return JsonResponse([], safe=False)
 
+@login_required
+@require_POST
+def photo_capture_upload(request):
+    """
+    Store a camera capture sent as a multipart blob and return its token; the
+    profile / user forms post the token in camera_capture_token.
+    """
+    photo = request.FILES.get('photo')
+    if photo is None:
+        return JsonResponse({'error': 'No photo was uploaded.'}, status=400)
+    try:
+        token = store_capture(photo, request.user)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    # Abandoned captures (form never submitted) are cleared on later uploads
+    purge_captures()
+    return JsonResponse({'token': token})
+
 def home_view(request):
     """
     Home page view that shows a welcome message and login form if user is not logged in,
@@ -2258,6 +1749,9 @@ def admin_edit_security(request, user_id):
     if request.method == 'POST':
         form = AdminUserEditForm(request.POST, request.FILES, instance=user)
         if form.is_valid():
+            # A camera capture is uploaded ahead of the form and referenced by token; it is
+            # only taken once the form is accepted, so a rejected post keeps the stored photo
+            take_capture(request.POST.get('camera_capture_token'), request.user, user)
             form.save()
             messages.success(request, f'Security personnel {user.get_full_name()} updated successfully.')
             return redirect('admin_manage_security')
@@ -2297,21 +1791,50 @@ def admin_edit_hr(request, user_id):
 @login_required
 @user_passes_test(is_admin)
 def admin_export_documents(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="documents.csv"'
+    if request.method == 'POST' and request.POST.get('background'):
+        job = submit_export_job('documents', 'csv', {}, request.user)
+        messages.success(request, f'Export #{job.pk} has been queued. The file will be available here when it is ready.')
+        return redirect('admin_export_jobs')
     
-    writer = csv.writer(response)
-    writer.writerow(['Username', 'Govt ID Number', 'Govt ID Photo'])  # CSV header
-    
-    documents = Document.objects.all().select_related('user')
-    for document in documents:
-        writer.writerow([
-            document.user.username,
-            document.govt_id_number,
-            document.govt_id_photo.url if document.govt_id_photo else ''
-        ])
-    
-    return response
+    return document_export({}).response('csv')
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_jobs(request):
+    jobs = ExportJob.objects.select_related('created_by')[:50]
+    return render(request, 'core/admin/export_jobs.html', {
+        'jobs': jobs
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_job_status(request, job_id):
+    # Polled by the export jobs page while a job is pending or running
+    job = get_object_or_404(ExportJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'progress': job.progress,
+        'error': job.error or '',
+        'download_url': reverse('admin_export_job_download', args=[job.id]) if job.status == 'done' else None
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_job_download(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, status='done')
+    if not job.file or not job.file.storage.exists(job.file.name):
+        messages.error(request, 'This export file is no longer available.')
+        return redirect('admin_export_jobs')
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(job.file.name),
+        content_type=EXPORT_FORMATS[job.export_format][0]
+    )
 
 @login_required
 @user_passes_test(is_admin)
@@ -2320,10 +1843,11 @@ def admin_export_documents_template(request):
     response['Content-Disposition'] = 'attachment; filename="documents_template.csv"'
     
     writer = csv.writer(response)
-    writer.writerow(['Username', 'GovtIDNumber', 'GovtIDPhotoPath'])  # Template header
+    writer.writerow(['Username', 'GSEZID', 'GovtIDNumber', 'PhotoFilename'])  # Template header
     
-    # Add a sample row
-    writer.writerow(['username', 'ID12345', 'path/to/photo.jpg'])
+    # Sample rows: a user is matched on GSEZID when it is filled in, else on Username
+    writer.writerow(['john_doe', '', 'ID12345', 'john_doe_id.jpg'])
+    writer.writerow(['', 'ZIS2506000002', 'PP78901', 'scans/ZIS2506000002.png'])
     
     return response
 
@@ -2332,192 +1856,60 @@ def admin_export_documents_template(request):
 def admin_import_documents(request):
     if request.method == 'POST' and request.FILES.get('csv_file'):
         csv_file = request.FILES['csv_file']
-        if not csv_file.name.endswith('.csv'):
-            messages.error(request, 'Please upload a CSV file.')
+        photos_zip = request.FILES.get('photos_zip')
+        if not is_supported_upload(csv_file):
+            messages.error(request, 'Please upload a CSV or Excel (.xlsx) file.')
             return redirect('admin_import_documents')
-
+        if not photos_zip or not photos_zip.name.lower().endswith('.zip'):
+            messages.error(request, 'Please upload the ID photos as a ZIP file.')
+            return redirect('admin_import_documents')
+        
+        # Validate the manifest against the users and the archive without saving anything
+        dry_run = bool(request.POST.get('dry_run'))
+        
         try:
-            # Read CSV file with error handling for different encodings
-            csv_data = csv_file.read()
-            try:
-                # First try UTF-8
-                decoded_file = csv_data.decode('utf-8').splitlines()
-            except UnicodeDecodeError:
-                try:
-                    # Then try ISO-8859-1 (Latin-1)
-                    decoded_file = csv_data.decode('latin-1').splitlines()
-                except UnicodeDecodeError:
-                    # Fall back to a more permissive encoding with error handling
-                    decoded_file = csv_data.decode('utf-8', errors='replace').splitlines()
-            
-            reader = csv.reader(decoded_file)
-            next(reader)  # Skip header row
-
-            success_count = 0
-            error_count = 0
-            
-            # Process each row
-            for row in reader:
-                if not row or len(row) < 3:  # Skip empty rows or rows with insufficient data
-                    continue
+            # Only the archive's directory is read here; photos are streamed out as rows need them
+            with zipfile.ZipFile(photos_zip.file) as archive:
+                reader = upload_rows(csv_file)
+                headers = next(reader)  # Get header row
                 
-                try:
-                    # Extract basic required fields
-                    username = row[field_indices.get('username', -1)].strip() if 'username' in field_indices else ''
-                    password = row[field_indices.get('password', -1)].strip() if 'password' in field_indices else ''
-                    first_name = row[field_indices.get('first_name', -1)].strip() if 'first_name' in field_indices else ''
-                    last_name = row[field_indices.get('last_name', -1)].strip() if 'last_name' in field_indices else ''
-                    email = row[field_indices.get('email', -1)].strip() if 'email' in field_indices else ''
-                    user_type = row[field_indices.get('user_type', -1)].strip() if 'user_type' in field_indices else 'user'
-                    
-                    # Check if required fields are present
-                    if not username or not password or not first_name or not last_name or not email:
-                        error_count += 1
-                        continue
-                    
-                    # Check if user already exists
-                    if User.objects.filter(username=username).exists():
-                        error_count += 1
-                        continue
-                    
-                    # Create user with basic fields
-                    user = User.objects.create_user(
-                        username=username,
-                        email=email,
-                        password=password,
-                        first_name=first_name,
-                        last_name=last_name
-                    )
-                    
-                    # Set optional text fields
-                    optional_text_fields = [
-                        'middle_name', 'nationality', 'gsezid', 'current_address',
-                        'permanent_address', 'current_employer', 'current_employer_emp_code',
-                        'current_employer_designation', 'current_employer_department',
-                        'current_employer_remarks', 'profile_full_link', 'employee_contact_number'
-                    ]
-                    
-                    for field in optional_text_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip()
-                            if value:
-                                setattr(user, field, value)
-                    
-                    # Set boolean fields
-                    boolean_fields = [
-                        'is_verified', 'is_required_profile_detail', 'is_printed', 'is_permanent'
-                    ]
-                    
-                    for field in boolean_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip().lower()
-                            setattr(user, field, value in ['1', 'true', 'yes'])
-                    
-                    # Set date fields
-                    date_fields = [
-                        'date_of_birth', 'gsez_card_issue_date', 'gsez_card_expiry_date',
-                        'current_employer_join_date'
-                    ]
-                    
-                    date_field_values = {}  # Store processed date values for final debug message
-                    for field in date_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip()
-                            if value:
-                                try:
-                                    # Try different date formats
-                                    date_value = None
-                                    date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%d/%Y', '%d.%m.%Y']
-                                    
-                                    for date_format in date_formats:
-                                        try:
-                                            date_value = datetime.strptime(value, date_format).date()
-                                            # Store the format that worked
-                                            date_field_values[field] = {
-                                                'raw': value,
-                                                'parsed': str(date_value),
-                                                'format_used': date_format
-                                            }
-                                            break
-                                        except ValueError:
-                                            continue
-                                    
-                                    if date_value:
-                                        setattr(user, field, date_value)
-                                    else:
-                                        error_details.append(f"Row {row_num}: Invalid date format for {field}: {value}. Expected YYYY-MM-DD or DD/MM/YYYY")
-                                except Exception as e:
-                                    error_details.append(f"Row {row_num}: Error processing date {field}: {str(e)}")
-                                    # Continue with other fields even if this date field fails
-                    
-                    # Remove the debug message - we don't want it to show in the UI
-                    # (The debug info is still collected in date_field_values if needed later)
-                    
-                    # Set integer fields
-                    if 'current_employer_rating' in field_indices and field_indices['current_employer_rating'] < len(row):
-                        try:
-                            rating = int(row[field_indices['current_employer_rating']].strip())
-                            user.current_employer_rating = rating
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # Set company foreign key
-                    if 'current_employer_company' in field_indices and field_indices['current_employer_company'] < len(row):
-                        company_name = row[field_indices['current_employer_company']].strip()
-                        if company_name:
-                            company, created = Company.objects.get_or_create(company_name=company_name)
-                            user.current_employer_company = company
-                    
-                    # Set JSON fields
-                    json_fields = [
-                        'emergency_contact_numbers', 'family_members', 
-                        'previous_employers', 'qualifications'
-                    ]
-                    
-                    for field in json_fields:
-                        if field in field_indices and field_indices[field] < len(row):
-                            value = row[field_indices[field]].strip()
-                            if value:
-                                try:
-                                    # Try to parse JSON
-                                    json_value = json.loads(value)
-                                    setattr(user, field, value)
-                                except json.JSONDecodeError:
-                                    # Invalid JSON, skip this field
-                                    pass
-                    
-                    # Set user type and status
-                    if 'user_type' in field_indices and field_indices['user_type'] < len(row):
-                        user_type_value = row[field_indices['user_type']].strip()
-                        if user_type_value in [choice[0] for choice in User.USER_TYPE_CHOICES]:
-                            user.user_type = user_type_value
-                    
-                    if 'status' in field_indices and field_indices['status'] < len(row):
-                        status_value = row[field_indices['status']].strip()
-                        if status_value in [choice[0] for choice in User.STATUS_CHOICES]:
-                            user.status = status_value
-                    
-                    # Generate GSEZ ID if not provided
-                    if not user.gsezid:
-                        user.gsezid = generate_gsezid()
-                    
-                    # Set the QR code URL using the GSEZ ID
-                    user.qr_code = f"http://207.180.234.113/IDCARD/{user.gsezid}"
-                    
-                    # Save the user
-                    user.save()
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_count += 1
-            
-            messages.success(request, f'{success_count} users imported successfully. {error_count} users skipped (already exist or invalid data).')
+                document_import = DocumentImport(headers, archive, dry_run=dry_run)
+                rows_total = 0
+                for row_num, row in enumerate(reader, start=2):
+                    document_import.add_row(row_num, row)
+                    rows_total = row_num - 1
+                document_import.flush()
+            
+            if dry_run:
+                job = record_dry_run('documents', csv_file.name, request.user, document_import, rows_total)
+                messages.info(request, f'Validation #{job.pk}: {document_import.success_count} documents would be imported, '
+                                       f'{document_import.error_count} rows rejected. Nothing was saved.')
+                return redirect('admin_import_jobs')
+            
+            if document_import.success_count > 0:
+                messages.success(request, f'{document_import.success_count} documents imported successfully.')
+            else:
+                messages.warning(request, "No documents were imported.")
+            
+            if document_import.error_count > 0:
+                messages.error(request, f'{document_import.error_count} rows skipped due to errors.')
+                for error in document_import.error_details[:3]:
+                    messages.warning(request, error)
+                if len(document_import.error_details) > 3:
+                    messages.warning(request, f"... and {len(document_import.error_details) - 3} more errors.")
+        except zipfile.BadZipFile:
+            messages.error(request, 'The photos file is not a valid ZIP archive.')
+            return redirect('admin_import_documents')
+        except StopIteration:
+            messages.error(request, 'The file is empty.')
+            return redirect('admin_import_documents')
         except Exception as e:
-            messages.error(request, f'Error importing users: {str(e)}')
+            messages.error(request, f'Error importing documents: {str(e)}')
+            return redirect('admin_import_documents')
         
-        return redirect('admin_manage_users')
+        return redirect('admin_manage_documents')
     
-    return render(request, 'core/admin/import_users.html')
+    return render(request, 'core/admin/import_documents.html')
 
 @login_required
 @user_passes_test(is_admin)
@@ -2534,14 +1926,18 @@ def admin_add_card_print(request, user_id):
             card_print = form.save(commit=False)
             card_print.user = user
             card_print.gsezid = user.gsezid or ''
-            card_print.save()
-            print("Card print saved with ID:", card_print.id)
             
-            # Update user's is_printed status
-            if not user.is_printed:
-                user.is_printed = True
-                user.save()
-                print("User is_printed set to True")
+            # The card print summary on the user is refreshed in the same transaction
+            with transaction.atomic():
+                card_print.save()
+                print("Card print saved with ID:", card_print.id)
+                
+                # Update user's is_printed status (only that column, so the
+                # freshly refreshed summary columns are not overwritten)
+                if not user.is_printed:
+                    user.is_printed = True
+                    user.save(update_fields=['is_printed'])
+                    print("User is_printed set to True")
                 
             messages.success(request, 'Card print record added successfully.')
         else:
@@ -2563,7 +1959,8 @@ def admin_edit_card_print(request, user_id):
         
         form = CardPrintForm(request.POST, instance=card_print)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             messages.success(request, 'Card print record updated successfully.')
         else:
             messages.error(request, 'Error updating card print record.')
@@ -2585,14 +1982,17 @@ def admin_delete_card_print(request, user_id):
         try:
             card_print = get_object_or_404(CardPrint, id=print_id, user=user)
             print("Found card print with ID:", card_print.id)
-            card_print.delete()
-            print("Card print deleted successfully")
             
-            # If no more card prints exist, update user's is_printed status
-            if not CardPrint.objects.filter(user=user).exists():
-                user.is_printed = False
-                user.save()
-                print("Updated user is_printed to False")
+            # The card print summary on the user is refreshed in the same transaction
+            with transaction.atomic():
+                card_print.delete()
+                print("Card print deleted successfully")
+                
+                # If no more card prints exist, update user's is_printed status
+                if not CardPrint.objects.filter(user=user).exists():
+                    user.is_printed = False
+                    user.save(update_fields=['is_printed'])
+                    print("Updated user is_printed to False")
                 
             messages.success(request, 'Card print record deleted successfully.')
         except Exception as e:
@@ -150,6 +150,29 @@ function previewProfileImage(input) {
     }
 }
 
+// Upload a camera capture as multipart form data; resolves to the token the form posts
+function uploadCameraCapture(blob, tokenInput) {
+    const formData = new FormData();
+    formData.append('photo', blob, `camera_capture_${new Date().getTime()}.jpg`);
+
+    const csrfInput = tokenInput.form ? tokenInput.form.querySelector('[name="csrfmiddlewaretoken"]') : null;
+
+    return fetch(tokenInput.dataset.uploadUrl, {
+        method: 'POST',
+        body: formData,
+        headers: csrfInput ? { 'X-CSRFToken': csrfInput.value } : {},
+        credentials: 'same-origin'
+    })
+        .then(function (response) {
+            return response.json().then(function (data) {
+                if (!response.ok || !data.token) {
+                    throw new Error(data.error || 'Upload failed');
+                }
+                return data.token;
+            });
+        });
+}
+
 // Camera capture for profile photo
 function setupCameraCapture() {
     const openCameraBtn = document.getElementById('openCameraBtn');
@@ -180,6 +203,11 @@ function setupCameraCapture() {
     // Handle file input change for preview
     if (profilePhotoInput) {
         profilePhotoInput.addEventListener('change', function () {
+            // A chosen file replaces an earlier camera capture
+            const tokenInput = document.getElementById('camera_capture_token');
+            if (tokenInput) {
+                tokenInput.value = '';
+            }
             previewProfileImage(this);
         });
     }
@@ -356,8 +384,8 @@ function setupCameraCapture() {
                 const context = photoCanvas.getContext('2d');
                 context.drawImage(cameraFeed, 0, 0, photoCanvas.width, photoCanvas.height);
 
-                // Get image data as base64 string
-                capturedImage = photoCanvas.toDataURL('image/jpeg');
+                // The frame stays on the canvas until it is saved as a JPEG blob
+                capturedImage = true;
 
                 // Hide video and show buttons for retake/save
                 cameraFeed.style.display = 'none';
@@ -386,103 +414,66 @@ function setupCameraCapture() {
         });
     }
 
-    // Save captured photo
+    // Save captured photo: upload the JPEG as a binary blob and keep only its token in the form
     if (savePhotoBtn) {
         savePhotoBtn.addEventListener('click', function () {
             if (!capturedImage) {
                 return;
             }
 
-            try {
-                // Convert base64 to blob
-                const base64 = capturedImage.split(',')[1];
-                const mime = capturedImage.split(',')[0].match(/:(.*?);/)[1];
-                const binaryStr = atob(base64);
-                const len = binaryStr.length;
-                const arr = new Uint8Array(len);
-
-                for (let i = 0; i < len; i++) {
-                    arr[i] = binaryStr.charCodeAt(i);
+            const tokenInput = document.getElementById('camera_capture_token');
+            if (!tokenInput) {
+                console.error('Camera capture token input not found');
+                alert('There was an issue saving the captured image. Please try again or use file upload instead.');
+                return;
+            }
+
+            savePhotoBtn.disabled = true;
+            photoCanvas.toBlob(function (blob) {
+                if (!blob) {
+                    savePhotoBtn.disabled = false;
+                    alert('Failed to save captured image. Please try again or use file upload instead.');
+                    return;
                 }
 
-                const blob = new Blob([arr], { type: mime });
+                uploadCameraCapture(blob, tokenInput)
+                    .then(function (token) {
+                        tokenInput.value = token;
 
-                // Create a File object from the Blob
-                const filename = `camera_capture_${new Date().getTime()}.jpg`;
-                const file = new File([blob], filename, { type: mime });
+                        // The capture replaces any file picked earlier, so it is not uploaded twice
+                        if (profilePhotoInput) {
+                            profilePhotoInput.value = '';
+                        }
 
-                // Check browser support for DataTransfer
-                if (typeof DataTransfer === 'undefined') {
-                    // Show preview directly
-                    if (previewPhoto) {
-                        previewPhoto.src = capturedImage;
-                        previewPhoto.style.display = 'block';
+                        // Show preview directly
+                        if (previewPhoto) {
+                            previewPhoto.src = URL.createObjectURL(blob);
+                            previewPhoto.style.display = 'block';
 
-                        // Hide current photo if exists
-                        const currentPhoto = document.getElementById('currentPhoto');
-                        if (currentPhoto) {
-                            currentPhoto.style.display = 'none';
-                        }
-                    }
-                } else {
-                    // Use DataTransfer to create a FileLike object
-                    const dataTransfer = new DataTransfer();
-                    dataTransfer.items.add(file);
-
-                    // Set the file to the input element
-                    if (profilePhotoInput) {
-                        try {
-                            profilePhotoInput.files = dataTransfer.files;
-
-                            // Trigger change event to update preview
-                            const event = new Event('change', { bubbles: true });
-                            profilePhotoInput.dispatchEvent(event);
-                        } catch (err) {
-                            // Fall back to direct preview
-                            if (previewPhoto) {
-                                previewPhoto.src = capturedImage;
-                                previewPhoto.style.display = 'block';
-
-                                // Hide current photo if exists
-                                const currentPhoto = document.getElementById('currentPhoto');
-                                if (currentPhoto) {
-                                    currentPhoto.style.display = 'none';
-                                }
+                            // Hide current photo if exists
+                            const currentPhoto = document.getElementById('currentPhoto');
+                            if (currentPhoto) {
+                                currentPhoto.style.display = 'none';
                             }
                         }
-                    }
-                }
-
-                // Update the hidden input with the captured image data
-                try {
-                    console.log('Updating hidden input for camera capture data');
-                    let hiddenInput = document.getElementById('camera_capture_data');
-
-                    if (hiddenInput) {
-                        console.log('Found existing hidden input, updating value');
-                        hiddenInput.value = capturedImage;
-                        console.log('Hidden input value set successfully');
-                    } else {
-                        console.error('Hidden input element not found');
-                        alert('There was an issue saving the captured image. Please try again or use file upload instead.');
-                    }
-                } catch (err) {
-                    console.error('Error updating hidden input:', err);
-                    alert('There was an issue saving the captured image. Please try again or use file upload instead.');
-                }
 
-                // Close modal
-                if (modal) {
-                    modal.hide();
-                } else if (cameraModal) {
-                    cameraModal.style.display = 'none';
-                }
+                        // Close modal
+                        if (modal) {
+                            modal.hide();
+                        } else if (cameraModal) {
+                            cameraModal.style.display = 'none';
+                        }
 
-                // Stop camera stream
-                stopCameraStream();
-            } catch (err) {
-                alert("Failed to save captured image: " + err.message);
-            }
+                        // Stop camera stream
+                        stopCameraStream();
+                    })
+                    .catch(function (err) {
+                        alert("Failed to save captured image: " + err.message);
+                    })
+                    .finally(function () {
+                        savePhotoBtn.disabled = false;
+                    });
+            }, 'image/jpeg', 0.92);
         });
     }
 